@@ -0,0 +1,161 @@
+import os
+import zlib
+
+from . import metrics, tracing
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression (ASGI middleware), negotiated with Accept-Encoding.
+#
+# - brotli when installed (requirements.txt) and accepted, else gzip, else nothing;
+# - only text-like content (JSON, text, SVG, JS, event streams): images,
+#   videos, archives and STL files served by /files/ are sent as they are
+#   (already compressed, or too big to compress on every download);
+# - a complete body smaller than COMPRESS_MIN_BYTES is not worth it (headers and
+#   CPU cost more than the saved bytes): sent as is;
+# - a streamed body (server-sent events, file chunks) is compressed chunk by
+#   chunk and flushed after each one, so every event still reaches the client
+#   when it is sent.
+# Responses that already have a Content-Encoding, partial (206) and empty ones
+# are left alone. COMPRESS=0 turns it off (a reverse proxy may do it instead).
+
+ENABLED = os.getenv("COMPRESS", "1").lower() not in ("0", "false", "no", "off")
+MIN_BYTES = max(0, int(os.getenv("COMPRESS_MIN_BYTES", "1024")))
+GZIP_LEVEL = min(9, max(1, int(os.getenv("COMPRESS_GZIP_LEVEL", "5"))))
+BROTLI_QUALITY = min(11, max(0, int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))))
+
+_TYPES = (b"application/json", b"text/", b"image/svg+xml", b"application/javascript", b"application/x-ndjson")
+
+
+def _accepted(headers) -> str | None:
+    """Best encoding accepted by the client ("br", "gzip") or None."""
+    value = None
+    for k, v in headers:
+        if k == b"accept-encoding":
+            value = v.decode("latin-1").lower()
+            break
+    if not value:
+        return None
+    q: dict[str, float] = {}
+    for part in value.split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        q[name.strip()] = weight
+    star = q.get("*", 0.0)
+    if brotli is not None and q.get("br", star) > 0:
+        return "br"
+    if q.get("gzip", q.get("x-gzip", star)) > 0:
+        return "gzip"
+    return None
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits 31: gzip container
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress `data` and flush, so the output can be decoded up to here."""
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.finish()
+        return self._c.compress(data) + self._c.flush()
+
+
+def _count(encoding: str, raw: int, sent: int) -> None:
+    if metrics.ENABLED:
+        metrics.inc("stlmanager_http_compressed_bytes_total", (("encoding", encoding), ("stage", "in")), raw)
+        metrics.inc("stlmanager_http_compressed_bytes_total", (("encoding", encoding), ("stage", "out")), sent)
+
+
+class Compression:
+    """ASGI middleware: compresses text-like responses (see above)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted(scope["headers"])
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder: _Encoder | None = None
+        # None: not decided yet (waiting for the first body message)
+        active: bool | None = None
+        sizes = [0, 0]
+
+        async def send_wrapper(message):
+            nonlocal start, encoder, active
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                ctype = b""
+                eligible = message["status"] not in (204, 206, 304) and message["status"] >= 200
+                for k, v in headers:
+                    if k == b"content-type":
+                        ctype = v
+                    elif k in (b"content-encoding", b"content-range"):
+                        eligible = False
+                if eligible and ctype.startswith(_TYPES):
+                    # Hold the start until the first body chunk tells the size
+                    start = message
+                    return
+                active = False
+                await send(message)
+                return
+            if message["type"] != "http.response.body" or active is False:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if active is None:
+                if not more and len(body) < MIN_BYTES:
+                    active = False
+                    headers = list(start.get("headers", [])) + [(b"vary", b"Accept-Encoding")]
+                    await send({**start, "headers": headers})
+                    await send(message)
+                    return
+                active = True
+                encoder = _Encoder(encoding)
+                with tracing.span("compress", encoding, bytes=len(body)):
+                    data = encoder.finish(body) if not more else encoder.chunk(body)
+                headers = [(k, v) for k, v in start.get("headers", []) if k != b"content-length"]
+                headers += [(b"content-encoding", encoding.encode("ascii")), (b"vary", b"Accept-Encoding")]
+                if not more:
+                    headers.append((b"content-length", str(len(data)).encode("ascii")))
+                await send({**start, "headers": headers})
+            else:
+                with tracing.span("compress", encoding, bytes=len(body)):
+                    data = encoder.chunk(body) if more else encoder.finish(body)
+            sizes[0] += len(body)
+            sizes[1] += len(data)
+            if not more:
+                _count(encoding, *sizes)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+metrics.describe("stlmanager_http_compressed_bytes_total", "counter", "Bytes of compressed responses before (in) and after (out) compression, by encoding.")
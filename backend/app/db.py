@@ -1,7 +1,10 @@
 import os
 import sqlite3
+import time
 from pathlib import Path
 
+from . import folder_store, metrics, tracing
+
 CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", str(Path(__file__).resolve().parent.parent / "data" / "cache.db"))
 
 def _ensure_dir(path: str) -> None:
@@ -10,14 +13,63 @@ def _ensure_dir(path: str) -> None:
 
 def get_connection() -> sqlite3.Connection:
     _ensure_dir(CACHE_DB_PATH)
-    conn = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False)
+    factory = metrics.MeteredConnection if metrics.ENABLED or tracing.ENABLED else sqlite3.Connection
+    conn = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False, factory=factory)
     conn.row_factory = sqlite3.Row
+    # SQLite LOWER() only folds ASCII; tag lookups must match Python's str.lower() (accents...)
+    conn.create_function("unicode_lower", 1, lambda s: s.lower() if isinstance(s, str) else s, deterministic=True)
     return conn
 
 
-def init_db() -> None:
-    conn = get_connection()
-    cur = conn.cursor()
+def _migrate_folder_keys(cur: sqlite3.Cursor) -> int:
+    """Copy the path-keyed folder_index_v1 / preview_overrides_v1 into the id-keyed tables."""
+    root = folder_store.norm_root(os.getenv("COLLECTION_ROOT"))
+    cur.execute("PRAGMA table_info(folder_index_v1)")
+    old_cols = {row[1] for row in cur.fetchall()}
+    cols = ["name", "mtime", "images", "gifs", "videos", "archives", "stls", "tags", "rating",
+            "created_at", "modified_at", "printed", "to_print"]
+    select = ", ".join(c if c in old_cols else f"NULL AS {c}" for c in cols)
+    cur.execute(f"SELECT path, thumbnail_path, {select} FROM folder_index_v1")
+    rows = cur.fetchall()
+    ids: dict[str, int] = {}
+    for r in rows:
+        path = r["path"]
+        # Folders outside COLLECTION_ROOT keep their parent directory as root
+        base = root if folder_store.rel_to(root, path) else folder_store.norm_root(os.path.dirname(path))
+        rec = {c: r[c] for c in cols}
+        rec.update(
+            root_id=folder_store.root_id(cur, base),
+            rel=folder_store.rel_to(base, path) or path,
+            thumbnail_path=folder_store.rel_thumb(path, r["thumbnail_path"]),
+            printed=rec["printed"] or 0,
+            to_print=rec["to_print"] or 0,
+        )
+        cur.execute(folder_store.UPSERT_SQL, rec)
+        cur.execute("SELECT id FROM folder_index WHERE root_id = ? AND rel = ?", (rec["root_id"], rec["rel"]))
+        ids[path] = cur.fetchone()[0]
+    cur.execute("SELECT path, thumbnail_path FROM preview_overrides_v1")
+    for path, thumb in cur.fetchall():
+        if path in ids:
+            cur.execute(
+                "INSERT OR REPLACE INTO preview_overrides(folder_id, thumbnail_path) VALUES(?, ?)",
+                (ids[path], folder_store.rel_thumb(path, thumb)),
+            )
+    cur.execute("DROP TABLE folder_index_v1")
+    cur.execute("DROP TABLE preview_overrides_v1")
+    return len(rows)
+
+
+# Schema versions (PRAGMA user_version). Each step brings a database from the
+# previous version to its own; init_db() runs the steps above the stored version,
+# each in one transaction with the version bump, so startup on an up-to-date
+# database is a single PRAGMA read. Databases created before versioning are at
+# 0 and may be in any earlier state, so the first five steps are idempotent
+# (IF NOT EXISTS, column checks). Later steps only run once and can be plain
+# ALTER/CREATE statements: append them to _STEPS, never edit a released one.
+
+
+def _step_core(cur: sqlite3.Cursor) -> None:
+    """projects / tags / project_tags (STL files) and the collection roots."""
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS projects (
@@ -50,13 +102,39 @@ def init_db() -> None:
         );
         """
     )
-    # Cache index for folders (projects-dossiers)
+    # Collection roots (mount points); folder_index rows are relative to one of them
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS collection_roots (
+            id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL
+        );
+        """
+    )
+
+
+def _step_folders(cur: sqlite3.Cursor) -> None:
+    """folder_index keyed by (root_id, rel), its columns and indexes, preview_overrides."""
+    # Older installs keyed folder_index / preview_overrides by absolute path
+    try:
+        cur.execute("PRAGMA table_info(folder_index)")
+        legacy_keys = "path" in {row[1] for row in cur.fetchall()}
+    except Exception:
+        legacy_keys = False
+    if legacy_keys:
+        cur.execute("ALTER TABLE folder_index RENAME TO folder_index_v1")
+        cur.execute("CREATE TABLE IF NOT EXISTS preview_overrides (path TEXT PRIMARY KEY, thumbnail_path TEXT)")
+        cur.execute("ALTER TABLE preview_overrides RENAME TO preview_overrides_v1")
+        for idx in ("name", "mtime", "rating", "created_at", "modified_at"):
+            cur.execute(f"DROP INDEX IF EXISTS idx_folder_index_{idx}")
+    # Cache index for folders (projects-dossiers): integer id, path = root + rel (see folder_store)
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS folder_index (
-            path TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
+            id INTEGER PRIMARY KEY,
+            root_id INTEGER NOT NULL,
             rel TEXT NOT NULL,
+            name TEXT NOT NULL,
             mtime REAL,
             images INTEGER DEFAULT 0,
             gifs INTEGER DEFAULT 0,
@@ -68,7 +146,11 @@ def init_db() -> None:
             thumbnail_path TEXT,
             created_at TEXT,
             modified_at TEXT,
-            printed INTEGER DEFAULT 0
+            printed INTEGER DEFAULT 0,
+            to_print INTEGER DEFAULT 0,
+            placeholder TEXT,
+            placeholder_src TEXT,
+            UNIQUE (root_id, rel)
         );
         """
     )
@@ -87,32 +169,31 @@ def init_db() -> None:
             print("[db] migration: added column created_at")
         except Exception as e:
             print(f"[db] migration: created_at skipped: {e}")
-    else:
-        print("[db] migration: created_at already present")
     if "modified_at" not in cols:
         try:
             cur.execute("ALTER TABLE folder_index ADD COLUMN modified_at TEXT")
             print("[db] migration: added column modified_at")
         except Exception as e:
             print(f"[db] migration: modified_at skipped: {e}")
-    else:
-        print("[db] migration: modified_at already present")
     if "printed" not in cols:
         try:
             cur.execute("ALTER TABLE folder_index ADD COLUMN printed INTEGER DEFAULT 0")
             print("[db] migration: added column printed")
         except Exception as e:
             print(f"[db] migration: printed skipped: {e}")
-    else:
-        print("[db] migration: printed already present")
     if "to_print" not in cols:
         try:
             cur.execute("ALTER TABLE folder_index ADD COLUMN to_print INTEGER DEFAULT 0")
             print("[db] migration: added column to_print")
         except Exception as e:
             print(f"[db] migration: to_print skipped: {e}")
-    else:
-        print("[db] migration: to_print already present")
+    if "placeholder" not in cols:
+        try:
+            cur.execute("ALTER TABLE folder_index ADD COLUMN placeholder TEXT")
+            cur.execute("ALTER TABLE folder_index ADD COLUMN placeholder_src TEXT")
+            print("[db] migration: added columns placeholder, placeholder_src")
+        except Exception as e:
+            print(f"[db] migration: placeholder skipped: {e}")
     try:
         cur.execute("CREATE INDEX IF NOT EXISTS idx_folder_index_created_at ON folder_index(created_at)")
     except Exception:
@@ -121,6 +202,36 @@ def init_db() -> None:
         cur.execute("CREATE INDEX IF NOT EXISTS idx_folder_index_modified_at ON folder_index(modified_at)")
     except Exception:
         pass
+    # User overrides for folder preview thumbnail (thumbnail relative to the folder)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS preview_overrides (
+            folder_id INTEGER PRIMARY KEY,
+            thumbnail_path TEXT,
+            placeholder TEXT
+        );
+        """
+    )
+    try:
+        cur.execute("PRAGMA table_info(preview_overrides)")
+        if "placeholder" not in {row[1] for row in cur.fetchall()}:
+            cur.execute("ALTER TABLE preview_overrides ADD COLUMN placeholder TEXT")
+            print("[db] migration: added column preview_overrides.placeholder")
+    except Exception as e:
+        print(f"[db] migration: preview_overrides.placeholder skipped: {e}")
+    if legacy_keys:
+        try:
+            n = _migrate_folder_keys(cur)
+        except Exception as e:
+            # init_db rolls the whole step back (renames included): the legacy tables
+            # stay as they were, the version is not bumped and the next start retries
+            print(f"[db] migration: folder keys failed: {e}")
+            raise
+        print(f"[db] migration: folder_index keyed by id ({n} folders)")
+
+
+def _step_tags(cur: sqlite3.Cursor) -> None:
+    """Tag catalog and tag_stats (built from folder_index on first run)."""
     # Global tags catalog (unique tag names)
     cur.execute(
         """
@@ -129,14 +240,142 @@ def init_db() -> None:
         );
         """
     )
-    # User overrides for folder preview thumbnail
+    # Tag usage counts over folder_index (see tag_index), kept in step with every tag write
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS preview_overrides (
+        CREATE TABLE IF NOT EXISTS tag_stats (
+            tag TEXT PRIMARY KEY,
+            lower_tag TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tag_stats_lower ON tag_stats(lower_tag)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tag_stats_count ON tag_stats(count DESC, lower_tag)")
+    try:
+        cur.execute("SELECT EXISTS(SELECT 1 FROM tag_stats)")
+        has_stats = bool(cur.fetchone()[0])
+        cur.execute("SELECT EXISTS(SELECT 1 FROM folder_index WHERE tags IS NOT NULL AND tags != '')")
+        if not has_stats and cur.fetchone()[0]:
+            from . import tag_index
+            n = tag_index.rebuild(cur)
+            print(f"[db] migration: tag_stats built ({n} tags)")
+    except Exception as e:
+        print(f"[db] migration: tag_stats skipped: {e}")
+
+
+def _step_caches(cur: sqlite3.Cursor) -> None:
+    """Path-keyed caches: per-directory media summaries, image headers."""
+    # Per-directory media summary cache (see media_index.summarize)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS dir_summary (
             path TEXT PRIMARY KEY,
-            thumbnail_path TEXT
+            mtime REAL,
+            images INTEGER DEFAULT 0,
+            gifs INTEGER DEFAULT 0,
+            videos INTEGER DEFAULT 0,
+            archives INTEGER DEFAULT 0,
+            stls INTEGER DEFAULT 0,
+            latest_mtime REAL,
+            first_image TEXT,
+            has_meta INTEGER DEFAULT 0,
+            stl_names TEXT,
+            children TEXT
+        );
+        """
+    )
+    # Per-file image header cache (see image_meta.lookup)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_meta (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            size INTEGER,
+            width INTEGER,
+            height INTEGER,
+            orientation INTEGER,
+            frames INTEGER
+        );
+        """
+    )
+
+
+def _step_jobs(cur: sqlite3.Cursor) -> None:
+    """Background jobs history."""
+    # Background jobs history (reindex, scan, maintenance)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT,
+            status TEXT NOT NULL,
+            done INTEGER DEFAULT 0,
+            total INTEGER,
+            counters TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TEXT,
+            started_at TEXT,
+            finished_at TEXT
         );
         """
     )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at)")
+
+
+def _step_index_version(cur: sqlite3.Cursor) -> None:
+    """Counter bumped by triggers on every change of folder names, paths, tags or thumbnails."""
+    # Cache key of results computed over the whole index (duplicates); triggers, so
+    # that every writer counts, offline scripts included. Rewrites with the same
+    # values (reindex) do not bump it.
+    cur.execute("CREATE TABLE index_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)")
+    cur.execute("INSERT INTO index_version (id, version) VALUES (1, 0)")
+    bump = "BEGIN UPDATE index_version SET version = version + 1 WHERE id = 1; END"
+    cur.execute(f"CREATE TRIGGER trg_folder_index_ins AFTER INSERT ON folder_index {bump}")
+    cur.execute(f"CREATE TRIGGER trg_folder_index_del AFTER DELETE ON folder_index {bump}")
+    cur.execute(
+        "CREATE TRIGGER trg_folder_index_upd AFTER UPDATE OF root_id, rel, name, tags, thumbnail_path ON folder_index"
+        " WHEN OLD.root_id IS NOT NEW.root_id OR OLD.rel IS NOT NEW.rel OR OLD.name IS NOT NEW.name"
+        f" OR OLD.tags IS NOT NEW.tags OR OLD.thumbnail_path IS NOT NEW.thumbnail_path {bump}"
+    )
+    cur.execute(f"CREATE TRIGGER trg_collection_roots_upd AFTER UPDATE OF path ON collection_roots WHEN OLD.path IS NOT NEW.path {bump}")
+
+
+_STEPS = [_step_core, _step_folders, _step_tags, _step_caches, _step_jobs, _step_index_version]
+SCHEMA_VERSION = len(_STEPS)
+
+
+def schema_version(cur: sqlite3.Cursor) -> int:
+    cur.execute("PRAGMA user_version")
+    return int(cur.fetchone()[0])
+
+
+def init_db(attach_root: bool = True) -> None:
+    conn = get_connection()
+    cur = conn.cursor()
+    version = schema_version(cur)
+    if version > SCHEMA_VERSION:
+        print(f"[db] schema v{version} is newer than this build (v{SCHEMA_VERSION}), not migrating")
+    elif version < SCHEMA_VERSION:
+        started = time.perf_counter()
+        for n in range(version + 1, SCHEMA_VERSION + 1):
+            step = _STEPS[n - 1]
+            cur.execute("BEGIN")
+            try:
+                step(cur)
+                cur.execute(f"PRAGMA user_version = {n}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"[db] migration to v{n} ({step.__name__}) failed")
+                conn.close()
+                raise
+        print(f"[db] schema v{version} -> v{SCHEMA_VERSION} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    # Register COLLECTION_ROOT (or swap the root of a remounted collection); off for offline tools
+    if attach_root:
+        from . import relocate
+        relocate.attach_root(cur, os.getenv("COLLECTION_ROOT"))
     conn.commit()
     conn.close()
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from . import metrics, relocate, tracing
+from .media_index import META_NAME
+
+# LRU cache of /folders/detail payloads.
+#
+# Entries are keyed by (path, media_type, offset, limit) and carry the folder
+# fingerprint they were built from: st_mtime_ns of the folder and of its
+# sidecar. A hit whose fingerprint no longer matches is dropped and counted as
+# stale, so files added/removed in the folder or an edited .stl_collect.json
+# are picked up without any call. Changes the fingerprint cannot see (DB-only
+# writes, recursive counts of subfolders) are covered by the write endpoints
+# calling invalidate(path), and by bulk indexers calling invalidate().
+# Bounded by DETAIL_CACHE_ENTRIES payloads and DETAIL_CACHE_BYTES of JSON.
+
+MAX_ENTRIES = max(1, int(os.getenv("DETAIL_CACHE_ENTRIES", "512")))
+MAX_BYTES = max(1, int(os.getenv("DETAIL_CACHE_BYTES", str(32 * 1024 * 1024))))
+
+_lock = threading.RLock()
+# key -> (fingerprint, payload, size)
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_bytes = 0
+_stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "invalidations": 0}
+
+
+def fingerprint(path: str) -> tuple[int, int | None] | None:
+    with tracing.span("fs", "stat", path=path):
+        try:
+            folder_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        try:
+            meta_mtime = os.stat(os.path.join(path, META_NAME)).st_mtime_ns
+        except OSError:
+            meta_mtime = None
+    return folder_mtime, meta_mtime
+
+
+def _drop(key: tuple) -> None:
+    global _bytes
+    entry = _cache.pop(key, None)
+    if entry is not None:
+        _bytes -= entry[2]
+
+
+def get(key: tuple, fp) -> dict | None:
+    """Cached payload for key if it was built from the same fingerprint."""
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        if fp is None or entry[0] != fp:
+            _drop(key)
+            _stats["stale"] += 1
+            _stats["misses"] += 1
+            return None
+        _cache.move_to_end(key)
+        _stats["hits"] += 1
+        return entry[1]
+
+
+def put(key: tuple, fp, payload: dict) -> None:
+    global _bytes
+    if fp is None:
+        return
+    try:
+        size = len(json.dumps(payload, ensure_ascii=False, default=str))
+    except Exception:
+        return
+    if size > MAX_BYTES:
+        return
+    with _lock:
+        _drop(key)
+        _cache[key] = (fp, payload, size)
+        _bytes += size
+        while len(_cache) > MAX_ENTRIES or _bytes > MAX_BYTES:
+            old_key, _ = next(iter(_cache.items()))
+            _drop(old_key)
+            _stats["evictions"] += 1
+
+
+def invalidate(path: str | None = None) -> None:
+    """Drop the payloads of one folder (every page of it), or everything."""
+    global _bytes
+    with _lock:
+        _stats["invalidations"] += 1
+        if path is None:
+            _cache.clear()
+            _bytes = 0
+            return
+        path = str(path)
+        for key in [k for k in _cache if k[0] == path]:
+            _drop(key)
+
+
+def stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "entries": len(_cache),
+            "bytes": _bytes,
+            "max_entries": MAX_ENTRIES,
+            "max_bytes": MAX_BYTES,
+            "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else None,
+            "miss_ratio": round(_stats["misses"] / lookups, 4) if lookups else None,
+        }
+
+
+@relocate.on_move
+def _on_move(old: str, new: str) -> None:
+    invalidate(old)
+    invalidate(new)
+
+
+@metrics.register
+def _metrics():
+    s = stats()
+    yield "stlmanager_cache_requests_total", "counter", {"cache": "detail", "result": "hit"}, s["hits"]
+    yield "stlmanager_cache_requests_total", "counter", {"cache": "detail", "result": "miss"}, s["misses"]
+    yield "stlmanager_cache_entries", "gauge", {"cache": "detail"}, s["entries"]
+    yield "stlmanager_cache_bytes", "gauge", {"cache": "detail"}, s["bytes"]
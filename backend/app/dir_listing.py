@@ -0,0 +1,122 @@
+import os
+import threading
+from collections import OrderedDict
+
+from . import metrics, relocate, tracing
+from .media_index import IMAGE_EXT, GIF_EXT, VIDEO_EXT, ARCHIVE_EXT
+
+# Cached file listing of a project folder, for the detail view.
+#
+# One entry per folder: the file names directly inside it, grouped by media
+# type in directory order, keyed on the folder's st_mtime_ns (creating,
+# deleting or renaming a file bumps it, so a stale entry is never served).
+# Archive sizes are not part of the entry: an archive rewritten in place does
+# not touch the folder mtime, so they are stat'ed on every request, only for the
+# archives a page returns. At most DETAIL_LISTING_CACHE folders are kept (LRU).
+
+MEDIA_TYPES = ("images", "gifs", "videos", "archives", "stls", "others")
+MAX_ENTRIES = max(1, int(os.getenv("DETAIL_LISTING_CACHE", "256")))
+
+_IGNORE_NAMES = {"Thumbs.db", "desktop.ini"}
+
+
+class Listing:
+    def __init__(self, mtime_ns: int, media: dict[str, list[str]]):
+        self.mtime_ns = mtime_ns
+        self.media = media
+
+    def totals(self) -> dict[str, int]:
+        return {t: len(names) for t, names in self.media.items()}
+
+
+def _media_type(name: str) -> str:
+    ext = os.path.splitext(name)[1].lower()
+    if ext in IMAGE_EXT:
+        return "images"
+    if ext in GIF_EXT:
+        return "gifs"
+    if ext in VIDEO_EXT:
+        return "videos"
+    if ext in ARCHIVE_EXT:
+        return "archives"
+    if ext == ".stl":
+        return "stls"
+    return "others"
+
+
+def _scan(folder: str, mtime_ns: int) -> Listing:
+    media: dict[str, list[str]] = {t: [] for t in MEDIA_TYPES}
+    metrics.fs("scandir", folder)
+    try:
+        with tracing.span("fs", "scandir", path=folder), os.scandir(folder) as it:
+            for e in it:
+                try:
+                    if not e.is_file():
+                        continue
+                except OSError:
+                    continue
+                if e.name.startswith('.') or e.name in _IGNORE_NAMES:
+                    continue
+                media[_media_type(e.name)].append(e.name)
+    except PermissionError:
+        pass
+    return Listing(mtime_ns, media)
+
+
+_lock = threading.RLock()
+_cache: "OrderedDict[str, Listing]" = OrderedDict()
+
+
+def get(folder: str) -> Listing:
+    """Listing of `folder`, re-scanned only when its mtime changed. OSError if it is gone."""
+    folder = str(folder)
+    metrics.fs("stat", folder)
+    with tracing.span("fs", "stat", path=folder):
+        mtime_ns = os.stat(folder).st_mtime_ns
+    with _lock:
+        hit = _cache.get(folder)
+        if hit is not None and hit.mtime_ns == mtime_ns:
+            _cache.move_to_end(folder)
+            metrics.inc("stlmanager_cache_requests_total", (("cache", "dir_listing"), ("result", "hit")))
+            return hit
+    metrics.inc("stlmanager_cache_requests_total", (("cache", "dir_listing"), ("result", "miss")))
+    listing = _scan(folder, mtime_ns)
+    with _lock:
+        _cache[folder] = listing
+        _cache.move_to_end(folder)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return listing
+
+
+def archive_sizes(folder: str, names: list[str]) -> dict[str, int]:
+    """Current sizes of the given archives of `folder` (missing ones left out)."""
+    out: dict[str, int] = {}
+    for name in names:
+        path = os.path.join(folder, name)
+        try:
+            metrics.fs("stat", folder)
+            with tracing.span("fs", "stat", path=path):
+                out[name] = int(os.stat(path).st_size)
+        except OSError:
+            continue
+    return out
+
+
+@metrics.register
+def _metrics():
+    yield "stlmanager_cache_entries", "gauge", {"cache": "dir_listing"}, len(_cache)
+
+
+def invalidate(folder: str | None = None) -> None:
+    with _lock:
+        if folder is None:
+            _cache.clear()
+        else:
+            _cache.pop(str(folder), None)
+
+
+@relocate.on_move
+def _on_move(old: str, new: str) -> None:
+    invalidate(old)
+    invalidate(new)
@@ -0,0 +1,228 @@
+import heapq
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+from . import folder_store, metrics, tag_index
+from .db import get_connection
+
+# Duplicate detection: pairs of projects sharing at least `min_shared` tags
+# (excluded tags not counted), best first (score, then names).
+#
+# One engine for GET /folders/duplicates and its SSE stream:
+# - projects are processed by decreasing tag count, each one's co-occurrence
+#   counts with the projects after it computed then dropped; candidates go to a
+#   heap bounded to `limit` entries. A pair found while processing a project
+#   scores at most that project's tag count, so when that count drops, the heap
+#   entries above it are final and are handed out right away (in order).
+#   Memory: O(limit + projects), never a table of all the pairs;
+# - cancellable: the loops check a threading.Event (set when the client went
+#   away) and raise Cancelled;
+# - results are cached, keyed by (min_shared, excluded tags, index version):
+#   the version is a counter bumped by SQLite triggers whenever a folder is
+#   added, removed, renamed or gets other tags / another thumbnail (see
+#   db._step_index_version), so any change of the index, from any writer, makes
+#   the next request recompute. LRU of DUPLICATES_CACHE_ENTRIES results.
+
+MAX_ENTRIES = max(1, int(os.getenv("DUPLICATES_CACHE_ENTRIES", "16")))
+# Pairs per ("pairs", ...) event
+BATCH = 100
+
+_lock = threading.Lock()
+# (min_shared, excluded, version) -> (limit, pairs, total)
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "cancelled": 0}
+
+
+class Cancelled(BaseException):
+    """Raised by the engine when its cancel event is set.
+
+    BaseException, like jobs.JobCancelled, so that `except Exception` blocks
+    around a computation let it through.
+    """
+
+
+class _Rank:
+    """Candidate pair in the top-k heap; `a < b` means a ranks after b (lower score, then names after)."""
+
+    __slots__ = ("score", "key", "ia", "ib")
+
+    def __init__(self, score: int, key: tuple[str, str], ia: int, ib: int):
+        self.score = score
+        self.key = key
+        self.ia = ia
+        self.ib = ib
+
+    def __lt__(self, other: "_Rank") -> bool:
+        if self.score != other.score:
+            return self.score < other.score
+        return self.key > other.key
+
+
+def _rows(cur) -> list[dict]:
+    cur.execute(
+        f"SELECT {folder_store.PATH_SQL}, fi.name, {folder_store.thumb_sql('fi.thumbnail_path')}, fi.tags"
+        " FROM folder_index fi JOIN collection_roots cr ON cr.id = fi.root_id"
+    )
+    return [dict(path=r[0], name=r[1], thumb=r[2], tags=tag_index.split(r[3])) for r in cur.fetchall()]
+
+
+def _engine(rows: list[dict], min_shared: int, limit: int, excluded: set[str], cancel: threading.Event | None):
+    def check():
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+
+    left = limit
+    tags_of: list[set[str]] = []
+    for r in rows:
+        tv = ((t or "").strip().lower() for t in (r.get("tags") or []))
+        tags_of.append({t for t in tv if t and t not in excluded})
+    # Rows by decreasing tag count (see above); rows with too few tags cannot pair
+    order = sorted((i for i, s in enumerate(tags_of) if len(s) >= min_shared), key=lambda i: -len(tags_of[i]))
+    # tag -> positions in `order` (increasing)
+    tag_map: dict[str, list[int]] = {}
+    for p, i in enumerate(order):
+        for t in tags_of[i]:
+            tag_map.setdefault(t, []).append(p)
+
+    def pair(e: _Rank) -> dict:
+        a = rows[e.ia]
+        b = rows[e.ib]
+        return {
+            "a_path": a.get("path"),
+            "a_name": a.get("name"),
+            "a_thumb": a.get("thumb"),
+            "b_path": b.get("path"),
+            "b_name": b.get("name"),
+            "b_thumb": b.get("thumb"),
+            "score": e.score,
+            "shared": sorted(tags_of[e.ia] & tags_of[e.ib]),
+        }
+
+    heap: list[_Rank] = []
+    total = 0
+    bound = None
+    last_pct = -1
+    for p, ia in enumerate(order):
+        check()
+        n_tags = len(tags_of[ia])
+        if bound is None or n_tags < bound:
+            bound = n_tags
+            final = [e for e in heap if e.score > bound]
+            if final:
+                heap = [e for e in heap if e.score <= bound]
+                heapq.heapify(heap)
+                final.sort(reverse=True)
+                left -= len(final)
+                for k in range(0, len(final), BATCH):
+                    yield "pairs", [pair(e) for e in final[k: k + BATCH]]
+        counts: dict[int, int] = {}
+        for t in tags_of[ia]:
+            check()
+            lst = tag_map[t]
+            for q in lst[bisect_right(lst, p):]:
+                counts[q] = counts.get(q, 0) + 1
+        for q, c in counts.items():
+            if c < min_shared:
+                continue
+            total += 1
+            if left <= 0 or (len(heap) >= left and c < heap[0].score):
+                continue
+            i, j = (ia, order[q]) if ia < order[q] else (order[q], ia)
+            e = _Rank(c, (str(rows[i].get("name") or ""), str(rows[j].get("name") or "")), i, j)
+            if len(heap) < left:
+                heapq.heappush(heap, e)
+            elif heap[0] < e:
+                heapq.heapreplace(heap, e)
+        pct = int((p + 1) * 100 / len(order))
+        if pct != last_pct:
+            last_pct = pct
+            yield "progress", pct
+    heap.sort(reverse=True)
+    for k in range(0, len(heap), BATCH):
+        yield "pairs", [pair(e) for e in heap[k: k + BATCH]]
+    yield "total", total
+
+
+def iter_pairs(min_shared: int, limit: int, excluded_tags: list[str] | None = None, cancel: threading.Event | None = None):
+    """Yields ("progress", pct), ("pairs", [pair, ...]) in final order, then ("total", n).
+
+    n is the number of pairs over the threshold (at most `limit` are returned).
+    Served from the cache when possible; a completed computation is cached.
+    Raises Cancelled when `cancel` gets set.
+    """
+    min_shared = max(1, int(min_shared))
+    limit = max(1, int(limit))
+    excluded = {(t or "").strip().lower() for t in (excluded_tags or []) if (t or "").strip()}
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        key = (min_shared, tuple(sorted(excluded)), folder_store.index_version(cur))
+        with _lock:
+            entry = _cache.get(key)
+            # Usable when computed for at least as many pairs, or when it holds them all
+            if entry is not None and (entry[0] >= limit or len(entry[1]) == entry[2]):
+                _cache.move_to_end(key)
+                _stats["hits"] += 1
+            else:
+                entry = None
+                _stats["misses"] += 1
+        rows = _rows(cur) if entry is None else None
+    finally:
+        conn.close()
+
+    if entry is not None:
+        pairs = entry[1][:limit]
+        for k in range(0, len(pairs), BATCH):
+            yield "pairs", pairs[k: k + BATCH]
+        yield "total", entry[2]
+        return
+
+    found: list[dict] = []
+    try:
+        for kind, data in _engine(rows, min_shared, limit, excluded, cancel):
+            if kind == "pairs":
+                found.extend(data)
+            elif kind == "total":
+                with _lock:
+                    _cache[key] = (limit, found, data)
+                    _cache.move_to_end(key)
+                    while len(_cache) > MAX_ENTRIES:
+                        _cache.popitem(last=False)
+            yield kind, data
+    except Cancelled:
+        with _lock:
+            _stats["cancelled"] += 1
+        raise
+
+
+def compute(min_shared: int, limit: int, excluded_tags: list[str] | None = None, cancel: threading.Event | None = None) -> tuple[list[dict], int]:
+    """(pairs, total) in one go, see iter_pairs()."""
+    pairs: list[dict] = []
+    total = 0
+    for kind, data in iter_pairs(min_shared, limit, excluded_tags, cancel):
+        if kind == "pairs":
+            pairs.extend(data)
+        elif kind == "total":
+            total = data
+    return pairs, total
+
+
+def invalidate() -> None:
+    """Drop the cached results (not needed on index changes, see above)."""
+    with _lock:
+        _cache.clear()
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "entries": len(_cache), "max_entries": MAX_ENTRIES}
+
+
+@metrics.register
+def _metrics():
+    s = stats()
+    yield "stlmanager_cache_requests_total", "counter", {"cache": "duplicates", "result": "hit"}, s["hits"]
+    yield "stlmanager_cache_requests_total", "counter", {"cache": "duplicates", "result": "miss"}, s["misses"]
+    yield "stlmanager_cache_entries", "gauge", {"cache": "duplicates"}, s["entries"]
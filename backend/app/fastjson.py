@@ -0,0 +1,65 @@
+import json
+from datetime import date, datetime
+from pathlib import PurePath
+
+from starlette.responses import JSONResponse
+
+from . import tracing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON rendering for the API responses.
+#
+# FastAPI turns the dict returned by an endpoint into JSON in two passes:
+# jsonable_encoder() walks and copies the whole payload (checking every value),
+# then json.dumps() renders the copy. For the big read endpoints (/folders/
+# pages, detail, duplicates, tags-counts) the payload is already made of plain
+# JSON types, so they return a FastJSONResponse themselves (response()), which
+# FastAPI sends as is: one pass, straight to bytes. The same class is the app's
+# default response class, so the other endpoints get the faster rendering too
+# (after jsonable_encoder).
+#
+# orjson is used when installed (requirements.txt; several times faster than
+# json), otherwise the stdlib json with compact separators, UTF-8 output.
+
+ENABLED = orjson is not None
+
+
+def _default(obj):
+    # The few non-JSON types that end up in payloads (orjson handles datetime itself)
+    if isinstance(obj, PurePath):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, "item"):
+        # numpy scalars (folder snapshot)
+        return obj.item()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+else:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps(); the rendering is a span of traced requests."""
+
+    def render(self, content) -> bytes:
+        with tracing.span("json", "render"):
+            return dumps(content)
+
+
+def response(content, status_code: int = 200, headers: dict | None = None) -> FastJSONResponse:
+    """Response for an endpoint whose payload is already plain JSON (skips jsonable_encoder)."""
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
@@ -0,0 +1,374 @@
+import os
+import sys
+import threading
+from typing import Iterable
+
+from . import folder_store, metrics, relocate
+from .db import get_connection
+
+try:  # Optional dependency: the snapshot is simply disabled without NumPy
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# In-process columnar snapshot of folder_index for the listing endpoint.
+#
+# Enabled with FOLDER_SNAPSHOT=1 (requires numpy). Rows are held as plain Python
+# lists for the strings returned to the client (tags interned) and NumPy columns
+# for everything that is filtered or sorted on; each tag gets a packed bitset of
+# the rows carrying it. Filters become boolean masks (the name search is one
+# np.char.find over the search strings), sort orders are cached permutations
+# (np.argsort / np.lexsort over the columns), and a page is
+# `perm[mask[perm]][offset:offset+limit]`.
+#
+# Single-folder writes (rating, flags, tags, preview, rename, delete...) call
+# refresh(paths) after their commit, which re-reads just those rows; bulk
+# indexers call invalidate() and the snapshot is rebuilt on the next request.
+
+ENABLED = os.getenv("FOLDER_SNAPSHOT", "0").lower() in ("1", "true", "yes", "on") and np is not None
+
+_SELECT = folder_store.SELECT_SQL
+
+# Rebuild from scratch once this share of rows are tombstones
+_MAX_DEAD_RATIO = 0.25
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+def _tag_tokens(csv_text) -> tuple[str, ...]:
+    # Same tokens as the SQL filter: instr(',' || LOWER(tags) || ',', ',' || tag || ',')
+    if not isinstance(csv_text, str) or not csv_text:
+        return ()
+    return tuple(_intern(t.lower()) for t in csv_text.split(","))
+
+
+class FolderSnapshot:
+    def __init__(self, rows):
+        self.n = 0
+        self.paths: list[str] = []
+        self.index: dict[str, int] = {}
+        self.names: list[str] = []
+        self.rels: list[str] = []
+        self.thumbs: list = []
+        self.placeholders: list = []
+        self.created: list = []
+        self.modified: list = []
+        self.search: list[str] = []
+        self.tags: list[list[str]] = []
+        self.tag_tokens: list[tuple[str, ...]] = []
+        cap = max(16, len(rows))
+        self.mtime = np.full(cap, np.nan, dtype=np.float64)
+        self.rating = np.full(cap, -1, dtype=np.int8)
+        self.printed = np.zeros(cap, dtype=np.bool_)
+        self.to_print = np.full(cap, -1, dtype=np.int8)
+        self.counts = np.zeros((cap, 5), dtype=np.int32)
+        self.alive = np.zeros(cap, dtype=np.bool_)
+        self.tag_bits: dict[str, np.ndarray] = {}
+        self.dead = 0
+        self._perms: dict[str, np.ndarray] = {}
+        self._q_cache: tuple[str, np.ndarray] | None = None
+        # self.search as a NumPy string array, rebuilt on the first search after a write
+        self._search_arr: np.ndarray | None = None
+        for r in rows:
+            self._append(r)
+
+    # ---- storage -------------------------------------------------------
+
+    def _grow(self, need: int) -> None:
+        cap = len(self.alive)
+        if need <= cap:
+            return
+        new_cap = max(need, cap * 2)
+        for attr in ("mtime", "rating", "printed", "to_print", "alive"):
+            old = getattr(self, attr)
+            fill = np.nan if attr == "mtime" else (-1 if attr in ("rating", "to_print") else 0)
+            arr = np.full(new_cap, fill, dtype=old.dtype)
+            arr[:cap] = old
+            setattr(self, attr, arr)
+        counts = np.zeros((new_cap, 5), dtype=np.int32)
+        counts[:cap] = self.counts
+        self.counts = counts
+        nbytes = (new_cap + 7) // 8
+        for t, bits in self.tag_bits.items():
+            grown = np.zeros(nbytes, dtype=np.uint8)
+            grown[: len(bits)] = bits
+            self.tag_bits[t] = grown
+
+    def _set_tag_bit(self, tag: str, i: int, on: bool) -> None:
+        bits = self.tag_bits.get(tag)
+        if bits is None:
+            if not on:
+                return
+            bits = np.zeros((len(self.alive) + 7) // 8, dtype=np.uint8)
+            self.tag_bits[tag] = bits
+        # np.packbits/unpackbits use big-endian bit order within a byte
+        if on:
+            bits[i >> 3] |= np.uint8(0x80 >> (i & 7))
+        else:
+            bits[i >> 3] &= np.uint8(~(0x80 >> (i & 7)) & 0xFF)
+
+    def _write(self, i: int, r) -> None:
+        name = r["name"]
+        self.names[i] = name
+        self.rels[i] = r["rel"]
+        self.thumbs[i] = r["thumbnail_path"]
+        self.placeholders[i] = r["placeholder"]
+        self.created[i] = _intern(r["created_at"])
+        self.modified[i] = _intern(r["modified_at"])
+        # Same fields as the SQL filter: LOWER(name) / LOWER(rel)
+        self.search[i] = (name or "").lower() + "\0" + (r["rel"] or "").lower()
+        self._search_arr = None
+        raw = r["tags"]
+        self.tags[i] = [_intern(t.strip()) for t in raw.split(",") if t.strip()] if isinstance(raw, str) and raw.strip() else []
+        for tok in self.tag_tokens[i]:
+            self._set_tag_bit(tok, i, False)
+        self.tag_tokens[i] = _tag_tokens(raw)
+        for tok in self.tag_tokens[i]:
+            self._set_tag_bit(tok, i, True)
+        self.mtime[i] = r["mtime"] if r["mtime"] is not None else np.nan
+        self.rating[i] = r["rating"] if r["rating"] is not None else -1
+        self.printed[i] = bool(r["printed"])
+        self.to_print[i] = r["to_print"] if r["to_print"] is not None else -1
+        self.counts[i] = (r["images"] or 0, r["gifs"] or 0, r["videos"] or 0, r["archives"] or 0, r["stls"] or 0)
+        self.alive[i] = True
+
+    def _append(self, r) -> None:
+        i = self.n
+        self._grow(i + 1)
+        self.n += 1
+        self.paths.append(r["path"])
+        self.index[r["path"]] = i
+        for lst in (self.names, self.rels, self.thumbs, self.placeholders, self.created, self.modified, self.search, self.tags):
+            lst.append(None)
+        self.tag_tokens.append(())
+        self._write(i, r)
+
+    def _sort_values(self, i: int) -> dict:
+        mt = self.mtime[i]
+        return {
+            "name": self.names[i],
+            "date": None if np.isnan(mt) else float(mt),
+            "rating": int(self.rating[i]),
+            "created": self.created[i],
+            "modified": self.modified[i],
+        }
+
+    def upsert(self, r) -> None:
+        i = self.index.get(r["path"])
+        if i is None:
+            self._append(r)
+            self._perms.clear()
+        else:
+            if not self.alive[i]:
+                self.dead -= 1
+            before = self._sort_values(i)
+            self._write(i, r)
+            after = self._sort_values(i)
+            # Only drop the sort orders whose key actually changed (e.g. a rating click keeps name order)
+            for k in before:
+                if before[k] != after[k]:
+                    self._perms.pop(f"{k}:asc", None)
+                    self._perms.pop(f"{k}:desc", None)
+        self._q_cache = None
+
+    def remove(self, path: str) -> None:
+        i = self.index.get(path)
+        if i is None or not self.alive[i]:
+            return
+        self.alive[i] = False
+        for tok in self.tag_tokens[i]:
+            self._set_tag_bit(tok, i, False)
+        self.tag_tokens[i] = ()
+        self.dead += 1
+        self._q_cache = None
+
+    # ---- query ---------------------------------------------------------
+
+    def _perm(self, sort: str, desc: bool) -> np.ndarray:
+        key = f"{sort}:{'desc' if desc else 'asc'}"
+        perm = self._perms.get(key)
+        if perm is not None:
+            return perm
+        n = self.n
+        idx = np.arange(n)
+        if sort == "rating":
+            # NULLs last whatever the order, like the SQL CASE
+            vals = self.rating[:n]
+            nonnull = idx[vals >= 0]
+            order = np.argsort(-vals[nonnull] if desc else vals[nonnull], kind="stable")
+            perm = np.concatenate([nonnull[order], idx[vals < 0]])
+        else:
+            if sort == "date":
+                vals = self.mtime[:n]
+                nulls = idx[np.isnan(vals)]
+                nonnull = idx[~np.isnan(vals)]
+                asc = np.concatenate([nulls, nonnull[np.argsort(vals[nonnull], kind="stable")]])
+            else:
+                col = np.array({"created": self.created, "modified": self.modified}.get(sort, self.names), dtype=object)
+                notnull = col != None  # noqa: E711 (elementwise)
+                col[~notnull] = ""
+                # SQLite: NULLs sort first in ASC; code point order matches BINARY collation (UTF-8)
+                asc = np.lexsort((col.astype(str), notnull))
+            perm = asc[::-1].copy() if desc else asc
+        self._perms[key] = perm
+        return perm
+
+    def _q_mask(self, q: str) -> np.ndarray:
+        if self._q_cache is not None and self._q_cache[0] == q:
+            return self._q_cache[1]
+        if self._search_arr is None:
+            self._search_arr = np.array(self.search, dtype=str)
+        m = np.char.find(self._search_arr, q) >= 0
+        self._q_cache = (q, m)
+        return m
+
+    def query(self, sort: str, order: str, page: int, limit: int, q=None, tags=None, printed=None, to_print=None, rating=None) -> dict:
+        n = self.n
+        mask = self.alive[:n].copy()
+        if q:
+            mask &= self._q_mask(q.lower())
+        if tags:
+            for t in tags:
+                tv = (t or "").strip().lower()
+                if not tv:
+                    continue
+                bits = self.tag_bits.get(tv)
+                if bits is None:
+                    mask[:] = False
+                    break
+                mask &= np.unpackbits(bits, count=n).view(np.bool_)
+        if printed is not None:
+            mask &= self.printed[:n] if printed else ~self.printed[:n]
+        if to_print is not None:
+            mask &= (self.to_print[:n] == 1) if to_print else (self.to_print[:n] != 1)
+        if rating is not None:
+            mask &= self.rating[:n] == rating
+        sort_key = (sort or "name").lower()
+        if sort_key not in ("name", "date", "rating", "created", "modified"):
+            sort_key = "name"
+        perm = self._perm(sort_key, (order or "asc").lower() == "desc")
+        ordered = perm[mask[perm]]
+        offset = (page - 1) * limit
+        items = [self._item(int(i)) for i in ordered[offset: offset + limit]]
+        return {"items": items, "total": int(len(ordered))}
+
+    def _item(self, i: int) -> dict:
+        c = self.counts[i]
+        mt = self.mtime[i]
+        rt = int(self.rating[i])
+        tp = int(self.to_print[i])
+        # Same shape as the SQL path of list_folders
+        return {
+            "name": self.names[i],
+            "path": self.paths[i],
+            "rel": self.rels[i],
+            "mtime": None if np.isnan(mt) else float(mt),
+            "tags": list(self.tags[i]),
+            "rating": None if rt < 0 else rt,
+            "created_at": self.created[i],
+            "modified_at": self.modified[i],
+            "printed": bool(self.printed[i]),
+            "to_print": None if tp < 0 else tp,
+            "thumbnail_path": self.thumbs[i],
+            "placeholder": self.placeholders[i],
+            "counts": {
+                "images": int(c[0]),
+                "gifs": int(c[1]),
+                "videos": int(c[2]),
+                "archives": int(c[3]),
+                "stls": int(c[4]),
+            },
+        }
+
+    def stats(self) -> dict:
+        return {"rows": self.n - self.dead, "tombstones": self.dead, "tags": len(self.tag_bits)}
+
+
+_lock = threading.RLock()
+_snapshot: FolderSnapshot | None = None
+
+
+def _build() -> FolderSnapshot:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(_SELECT)
+    snap = FolderSnapshot(cur.fetchall())
+    conn.close()
+    return snap
+
+
+def get() -> FolderSnapshot | None:
+    """Current snapshot (built on first use), or None when disabled."""
+    global _snapshot
+    if not ENABLED:
+        return None
+    with _lock:
+        if _snapshot is None or _snapshot.dead > _MAX_DEAD_RATIO * max(1, _snapshot.n):
+            try:
+                _snapshot = _build()
+            except Exception as e:
+                print(f"[snapshot] build failed: {e}")
+                return None
+        return _snapshot
+
+
+def query(**kwargs) -> dict | None:
+    """Run a listing query against the snapshot; None means "use SQL"."""
+    with _lock:
+        snap = get()
+        if snap is None:
+            return None
+        return snap.query(**kwargs)
+
+
+@metrics.register
+def _metrics():
+    snap = _snapshot
+    if snap is not None:
+        yield "stlmanager_cache_entries", "gauge", {"cache": "folder_snapshot"}, snap.n - snap.dead
+
+
+def invalidate() -> None:
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+def refresh(paths: Iterable[str]) -> None:
+    """Re-read the given folder_index rows (missing ones are removed from the snapshot)."""
+    if not ENABLED:
+        return
+    paths = [str(p) for p in paths if p]
+    with _lock:
+        if _snapshot is None or not paths:
+            return
+        try:
+            conn = get_connection()
+            cur = conn.cursor()
+            by_root: dict[int, list[str]] = {}
+            for p in paths:
+                rid, rel = folder_store.key(cur, p)
+                if rel is not None:
+                    by_root.setdefault(rid, []).append(rel)
+            found = {}
+            for rid, rels in by_root.items():
+                placeholders = ",".join("?" * len(rels))
+                cur.execute(_SELECT + f" WHERE fi.root_id = ? AND fi.rel IN ({placeholders})", [rid, *rels])
+                found.update((r["path"], r) for r in cur.fetchall())
+            conn.close()
+        except Exception as e:
+            print(f"[snapshot] refresh failed, dropping snapshot: {e}")
+            invalidate()
+            return
+        for p in paths:
+            if p in found:
+                _snapshot.upsert(found[p])
+            else:
+                _snapshot.remove(p)
+
+
+@relocate.on_move
+def _on_move(old: str, new: str) -> None:
+    refresh([old, new])
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+
+# Keys of folder_index.
+#
+# A folder row has an integer id and is located by (root_id, rel): rel is the
+# folder path relative to its collection root (collection_roots), and
+# thumbnail_path is stored relative to the folder. The API keeps exchanging
+# absolute paths; this module converts at the boundary (key() on the way in,
+# PATH_SQL / thumb_sql() on the way out). Moving the collection to another mount
+# point therefore only rewrites one collection_roots row (relocate.attach_root),
+# and renaming a folder only its rel.
+
+SEP = os.sep
+
+# Absolute folder path, for queries joining `folder_index fi` and `collection_roots cr`
+PATH_SQL = f"(cr.path || '{SEP}' || fi.rel)"
+
+
+def thumb_sql(col: str) -> str:
+    """SQL turning a stored thumbnail (relative to the folder, or absolute) into an absolute path."""
+    return (
+        f"CASE WHEN {col} IS NULL OR {col} = '' THEN NULL"
+        f" WHEN substr({col}, 1, 1) = '{SEP}' THEN {col}"
+        f" ELSE {PATH_SQL} || '{SEP}' || {col} END"
+    )
+
+
+# Inline preview of the effective thumbnail (see placeholders); only while it matches the current file
+PLACEHOLDER_SQL = (
+    "CASE WHEN po.thumbnail_path IS NOT NULL THEN NULLIF(po.placeholder, '')"
+    " WHEN fi.placeholder_src IS fi.thumbnail_path THEN NULLIF(fi.placeholder, '') END"
+)
+
+
+# Listing / detail row: same columns (and absolute paths) as before the integer key
+SELECT_SQL = f"""
+    SELECT fi.name, {PATH_SQL} AS path, fi.rel, fi.mtime, fi.images, fi.gifs, fi.videos, fi.archives, fi.stls,
+           fi.tags, fi.rating, fi.created_at, fi.modified_at, fi.printed, fi.to_print,
+           {thumb_sql("COALESCE(po.thumbnail_path, fi.thumbnail_path)")} AS thumbnail_path,
+           {PLACEHOLDER_SQL} AS placeholder
+    FROM folder_index fi
+    JOIN collection_roots cr ON cr.id = fi.root_id
+    LEFT JOIN preview_overrides po ON po.folder_id = fi.id
+"""
+
+# Full write of a folder record (see folders._build_folder_record); the id, and with it
+# the preview override, survives a re-index of the same folder
+UPSERT_SQL = """
+    INSERT INTO folder_index
+    (root_id, rel, name, mtime, images, gifs, videos, archives, stls, tags, rating, thumbnail_path, created_at, modified_at, printed, to_print)
+    VALUES (:root_id, :rel, :name, :mtime, :images, :gifs, :videos, :archives, :stls, :tags, :rating, :thumbnail_path, :created_at, :modified_at, :printed, :to_print)
+    ON CONFLICT(root_id, rel) DO UPDATE SET
+      name=excluded.name,
+      mtime=excluded.mtime,
+      images=excluded.images,
+      gifs=excluded.gifs,
+      videos=excluded.videos,
+      archives=excluded.archives,
+      stls=excluded.stls,
+      tags=excluded.tags,
+      rating=excluded.rating,
+      thumbnail_path=excluded.thumbnail_path,
+      created_at=excluded.created_at,
+      modified_at=excluded.modified_at,
+      printed=excluded.printed,
+      to_print=excluded.to_print
+"""
+
+
+def norm_root(root: str | None) -> str:
+    """Stored form of a root: normalized, no trailing separator ("/" and unset give "")."""
+    if not root:
+        return ""
+    return os.path.normpath(root).rstrip(SEP)
+
+
+def abs_path(root: str, rel: str) -> str:
+    return root + SEP + rel
+
+
+def rel_to(base: str, path: str | None) -> str | None:
+    """`path` relative to `base`, or None when it is not below it."""
+    if not path or not path.startswith(base + SEP):
+        return None
+    return path[len(base) + 1:] or None
+
+
+def rel_thumb(folder: str, thumb: str | None) -> str | None:
+    """Stored form of a thumbnail: relative to its folder when inside it, else unchanged."""
+    if not thumb:
+        return None
+    return rel_to(folder, thumb) or thumb
+
+
+# Stored root path -> id
+_roots: dict[str, int] = {}
+
+
+def root_id(cur: sqlite3.Cursor, root: str | None = None) -> int:
+    """Id of a collection root (default COLLECTION_ROOT), registered on first use."""
+    r = norm_root(os.getenv("COLLECTION_ROOT") if root is None else root)
+    rid = _roots.get(r)
+    if rid is not None:
+        return rid
+    cur.execute("SELECT id FROM collection_roots WHERE path = ?", (r,))
+    row = cur.fetchone()
+    if row is not None:
+        _roots[r] = row[0]
+        return row[0]
+    # Registered by init_db at startup; this only happens when the root changes at runtime
+    cur.execute("INSERT INTO collection_roots(path) VALUES(?)", (r,))
+    return cur.lastrowid
+
+
+def forget_roots() -> None:
+    _roots.clear()
+
+
+def key(cur: sqlite3.Cursor, path: str | os.PathLike) -> tuple[int, str | None]:
+    """(root_id, rel) of an absolute folder path under COLLECTION_ROOT; rel is None outside of it."""
+    r = norm_root(os.getenv("COLLECTION_ROOT"))
+    return root_id(cur, r), rel_to(r, str(path))
+
+
+def record_params(cur: sqlite3.Cursor, rec: dict) -> dict:
+    """Named parameters of UPSERT_SQL for a folder record carrying an absolute path."""
+    rid, rel = key(cur, rec["path"])
+    if rel is None:
+        raise ValueError(f"'{rec['path']}' is not under COLLECTION_ROOT")
+    return {
+        **rec,
+        "root_id": rid,
+        "rel": rel,
+        "thumbnail_path": rel_thumb(rec["path"], rec.get("thumbnail_path")),
+        "to_print": rec.get("to_print", 0),
+    }
+
+
+def upsert(cur: sqlite3.Cursor, rec: dict) -> None:
+    cur.execute(UPSERT_SQL, record_params(cur, rec))
+
+
+def index_version(cur: sqlite3.Cursor) -> int:
+    """Counter bumped on every change of folder names, paths, tags or thumbnails (db._step_index_version)."""
+    cur.execute("SELECT version FROM index_version WHERE id = 1")
+    row = cur.fetchone()
+    return int(row[0]) if row else 0
@@ -0,0 +1,320 @@
+import os
+import sqlite3
+import struct
+
+from . import metrics, tracing
+from .db import get_connection
+
+# Image dimensions for the detail gallery, read from file headers only.
+#
+# JPEG, PNG (APNG), WebP, BMP and GIF headers give width, height, EXIF
+# orientation and frame count without decoding any pixel: a JPEG is read up to
+# its SOF segment, a PNG up to its first IDAT, a WebP chunk headers only, a GIF
+# block headers only (image data sub-blocks are skipped by length). Results are
+# cached in `image_meta`, one row per file stamped with its st_mtime_ns and
+# size; a row is re-read only when either changed. Files that cannot be parsed
+# are cached too (width NULL) so they are not retried on every request.
+#
+# width/height are the stored pixel size; an orientation of 5..8 means the image
+# is displayed rotated by 90°, i.e. with width and height swapped.
+
+_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_CHUNK = 500
+
+
+def _exif_orientation(tiff: bytes) -> int | None:
+    """Orientation tag (0x0112) of IFD0 of a TIFF/EXIF block."""
+    if len(tiff) < 8:
+        return None
+    if tiff[:2] == b"II":
+        e = "<"
+    elif tiff[:2] == b"MM":
+        e = ">"
+    else:
+        return None
+    ifd = struct.unpack(e + "I", tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return None
+    n = struct.unpack(e + "H", tiff[ifd:ifd + 2])[0]
+    for i in range(n):
+        off = ifd + 2 + 12 * i
+        if off + 12 > len(tiff):
+            break
+        tag, typ = struct.unpack(e + "HH", tiff[off:off + 4])
+        if tag == 0x0112 and typ == 3:
+            value = struct.unpack(e + "H", tiff[off + 8:off + 10])[0]
+            return value if 1 <= value <= 8 else None
+    return None
+
+
+def _jpeg(fh) -> dict | None:
+    orientation = None
+    while True:
+        b = fh.read(1)
+        # Markers may be preceded by any number of 0xFF fill bytes
+        while b == b"\xff":
+            b = fh.read(1)
+        if not b:
+            return None
+        marker = b[0]
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue
+        if marker in (0xD9, 0xDA):
+            return None
+        raw = fh.read(2)
+        if len(raw) < 2:
+            return None
+        length = struct.unpack(">H", raw)[0]
+        if length < 2:
+            return None
+        if marker in _SOF:
+            seg = fh.read(5)
+            if len(seg) < 5:
+                return None
+            height, width = struct.unpack(">HH", seg[1:5])
+            return {"width": width, "height": height, "orientation": orientation, "frames": 1}
+        if marker == 0xE1 and orientation is None:
+            seg = fh.read(length - 2)
+            if seg[:6] == b"Exif\x00\x00":
+                orientation = _exif_orientation(seg[6:])
+            continue
+        fh.seek(length - 2, os.SEEK_CUR)
+
+
+def _png(fh) -> dict | None:
+    head = fh.read(16)
+    if len(head) < 16 or head[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", fh.read(8))
+    fh.seek(5 + 4, os.SEEK_CUR)
+    frames = 1
+    orientation = None
+    # acTL (APNG) and eXIf come before the first IDAT
+    while True:
+        raw = fh.read(8)
+        if len(raw) < 8:
+            break
+        length, ctype = struct.unpack(">I4s", raw)
+        if ctype in (b"IDAT", b"IEND"):
+            break
+        if ctype == b"acTL":
+            frames = struct.unpack(">I", fh.read(4))[0] or 1
+            fh.seek(length - 4 + 4, os.SEEK_CUR)
+        elif ctype == b"eXIf":
+            orientation = _exif_orientation(fh.read(length))
+            fh.seek(4, os.SEEK_CUR)
+        else:
+            fh.seek(length + 4, os.SEEK_CUR)
+    return {"width": width, "height": height, "orientation": orientation, "frames": frames}
+
+
+def _webp(fh) -> dict | None:
+    head = fh.read(12)
+    if len(head) < 12 or head[8:12] != b"WEBP":
+        return None
+    width = height = orientation = None
+    frames = 0
+    while True:
+        raw = fh.read(8)
+        if len(raw) < 8:
+            break
+        ctype, length = struct.unpack("<4sI", raw)
+        padded = length + (length & 1)
+        if ctype == b"VP8X":
+            data = fh.read(10)
+            width = 1 + int.from_bytes(data[4:7], "little")
+            height = 1 + int.from_bytes(data[7:10], "little")
+            fh.seek(padded - 10, os.SEEK_CUR)
+            continue
+        if ctype == b"VP8 " and width is None:
+            data = fh.read(10)
+            if data[3:6] != b"\x9d\x01\x2a":
+                return None
+            w, h = struct.unpack("<HH", data[6:10])
+            return {"width": w & 0x3FFF, "height": h & 0x3FFF, "orientation": None, "frames": 1}
+        if ctype == b"VP8L" and width is None:
+            data = fh.read(5)
+            if data[:1] != b"\x2f":
+                return None
+            bits = int.from_bytes(data[1:5], "little")
+            return {"width": (bits & 0x3FFF) + 1, "height": ((bits >> 14) & 0x3FFF) + 1, "orientation": None, "frames": 1}
+        if ctype == b"ANMF":
+            frames += 1
+        elif ctype == b"EXIF":
+            data = fh.read(length)
+            if data[:6] == b"Exif\x00\x00":
+                data = data[6:]
+            orientation = _exif_orientation(data)
+            fh.seek(padded - length, os.SEEK_CUR)
+            continue
+        # Bitstream of an extended file: skipped, its EXIF chunk comes after it
+        fh.seek(padded, os.SEEK_CUR)
+    if width is None:
+        return None
+    return {"width": width, "height": height, "orientation": orientation, "frames": frames or 1}
+
+
+def _bmp(fh) -> dict | None:
+    head = fh.read(26)
+    if len(head) < 26 or head[:2] != b"BM":
+        return None
+    dib = struct.unpack("<I", head[14:18])[0]
+    if dib == 12:
+        width, height = struct.unpack("<HH", head[18:22])
+    else:
+        width, height = struct.unpack("<ii", head[18:26])
+    # Negative height = top-down rows
+    return {"width": abs(width), "height": abs(height), "orientation": None, "frames": 1}
+
+
+def _skip_sub_blocks(fh) -> bool:
+    while True:
+        n = fh.read(1)
+        if not n:
+            return False
+        if n[0] == 0:
+            return True
+        fh.seek(n[0], os.SEEK_CUR)
+
+
+def _gif(fh) -> dict | None:
+    head = fh.read(13)
+    if len(head) < 13 or head[:6] not in (b"GIF87a", b"GIF89a"):
+        return None
+    width, height, packed = struct.unpack("<HHB", head[6:11])
+    if packed & 0x80:
+        fh.seek(3 << ((packed & 0x07) + 1), os.SEEK_CUR)
+    frames = 0
+    while True:
+        b = fh.read(1)
+        if not b or b == b"\x3b":
+            break
+        if b == b"\x21":
+            if not fh.read(1) or not _skip_sub_blocks(fh):
+                break
+        elif b == b"\x2c":
+            desc = fh.read(9)
+            if len(desc) < 9:
+                break
+            frames += 1
+            if desc[8] & 0x80:
+                fh.seek(3 << ((desc[8] & 0x07) + 1), os.SEEK_CUR)
+            # LZW minimum code size, then the image data sub-blocks
+            if not fh.read(1) or not _skip_sub_blocks(fh):
+                break
+        else:
+            break
+    return {"width": width, "height": height, "orientation": None, "frames": frames or 1}
+
+
+_PARSERS = {
+    b"\xff\xd8": _jpeg,
+    b"\x89P": _png,
+    b"RI": _webp,
+    b"BM": _bmp,
+    b"GI": _gif,
+}
+
+
+def read_header(path: str) -> dict | None:
+    """{width, height, orientation, frames} from the file header, or None if unknown/corrupt."""
+    try:
+        with open(path, "rb") as fh:
+            parser = _PARSERS.get(fh.read(2))
+            if parser is None:
+                return None
+            fh.seek(0)
+            meta = parser(fh)
+    except (OSError, struct.error, IndexError, ValueError):
+        return None
+    if not meta or not meta["width"] or not meta["height"]:
+        return None
+    return meta
+
+
+def lookup(folder: str, names: list[str]) -> dict[str, dict]:
+    """Header metadata of the files `names` of `folder`, from the cache or read and cached.
+
+    Files that are gone or cannot be parsed are left out of the result.
+    """
+    stats: dict[str, tuple[int, int]] = {}
+    metrics.fs("stat", folder, len(names))
+    with tracing.span("fs", "stat", path=folder, files=len(names)):
+        for name in names:
+            try:
+                st = os.stat(os.path.join(folder, name))
+            except OSError:
+                continue
+            stats[os.path.join(folder, name)] = (st.st_mtime_ns, st.st_size)
+    if not stats:
+        return {}
+
+    cached: dict[str, sqlite3.Row] = {}
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        paths = list(stats)
+        for i in range(0, len(paths), _CHUNK):
+            part = paths[i:i + _CHUNK]
+            cur.execute(
+                f"SELECT * FROM image_meta WHERE path IN ({','.join('?' * len(part))})",
+                part,
+            )
+            cached.update((r["path"], r) for r in cur.fetchall())
+    except sqlite3.Error as e:
+        print(f"[image_meta] cache read skipped for '{folder}': {e}")
+        cur = None
+
+    out: dict[str, dict] = {}
+    upserts: list[tuple] = []
+    for path, (mtime_ns, size) in stats.items():
+        row = cached.get(path)
+        if row is not None and row["mtime_ns"] == mtime_ns and row["size"] == size:
+            if row["width"] is not None:
+                out[os.path.basename(path)] = {
+                    "width": row["width"], "height": row["height"],
+                    "orientation": row["orientation"], "frames": row["frames"],
+                }
+            continue
+        with tracing.span("fs", "header_read", path=path):
+            meta = read_header(path)
+        if meta:
+            out[os.path.basename(path)] = meta
+            upserts.append((path, mtime_ns, size, meta["width"], meta["height"], meta["orientation"], meta["frames"]))
+        else:
+            upserts.append((path, mtime_ns, size, None, None, None, None))
+
+    metrics.fs("header_read", folder, len(upserts))
+    metrics.inc("stlmanager_cache_requests_total", (("cache", "image_meta"), ("result", "hit")), len(stats) - len(upserts))
+    metrics.inc("stlmanager_cache_requests_total", (("cache", "image_meta"), ("result", "miss")), len(upserts))
+
+    if cur is not None and upserts:
+        try:
+            cur.executemany(
+                """
+                INSERT OR REPLACE INTO image_meta (path, mtime_ns, size, width, height, orientation, frames)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                upserts,
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            # The cache is best effort; the result is still correct
+            print(f"[image_meta] cache write skipped for '{folder}': {e}")
+    if conn is not None:
+        conn.close()
+    return out
+
+
+def forget(conn: sqlite3.Connection, folder: str, name: str | None = None) -> None:
+    """Drop cached rows of one file of `folder`, or of every file at or below `folder`."""
+    folder = str(folder)
+    try:
+        if name is not None:
+            conn.execute("DELETE FROM image_meta WHERE path = ?", (os.path.join(folder, name),))
+        else:
+            lo, hi = folder + os.sep, folder + chr(ord(os.sep) + 1)
+            conn.execute("DELETE FROM image_meta WHERE path >= ? AND path < ?", (lo, hi))
+    except sqlite3.Error:
+        pass
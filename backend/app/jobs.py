@@ -0,0 +1,341 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from . import metrics
+from .db import get_connection
+
+# Background jobs for long maintenance operations (reindex, scan, fix-tags...).
+# Jobs run one at a time on a single worker thread so that they never compete
+# for the SQLite writer lock; a second submission of the same job (same kind and
+# params) while it is queued or running returns the existing job instead.
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINAL_STATUSES = {STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED}
+
+# Minimum delay between two progress writes to SQLite (memory is always up to date)
+_PERSIST_INTERVAL = 1.0
+# Finished jobs kept in memory (history remains available in SQLite)
+_MAX_FINISHED_IN_MEMORY = 50
+
+
+class JobCancelled(BaseException):
+    """Raised by checkpoint() when the current job was cancelled.
+
+    Derives from BaseException on purpose: the indexers wrap most per-folder work
+    in `except Exception` blocks, which must not swallow a cancellation.
+    """
+
+
+class Job:
+    def __init__(self, kind: str, params: dict, fn: Callable[[], Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.key = kind + ":" + json.dumps(params, sort_keys=True, ensure_ascii=False)
+        self.fn = fn
+        self.status = STATUS_QUEUED
+        self.done = 0
+        self.total: int | None = None
+        self.counters: dict[str, Any] = {}
+        self.result: Any = None
+        self.error: str | None = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.started_at: str | None = None
+        self.finished_at: str | None = None
+        self.version = 0
+        self.cancel_event = threading.Event()
+        self._persisted_at = 0.0
+
+    def snapshot(self) -> dict:
+        pct = None
+        if self.total:
+            pct = int(min(self.done, self.total) * 100 / self.total)
+        elif self.status == STATUS_DONE:
+            pct = 100
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "progress_pct": pct,
+            "counters": dict(self.counters),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+_lock = threading.Lock()
+_changed = threading.Condition(_lock)
+_jobs: dict[str, Job] = {}
+_active_by_key: dict[str, str] = {}
+_queue: "queue.Queue[Job]" = queue.Queue()
+_worker: threading.Thread | None = None
+_local = threading.local()
+# job id -> callbacks run on every change of the job (see watch())
+_watchers: dict[str, list[Callable[[], None]]] = {}
+
+
+def _persist(job: Job) -> None:
+    snap = job.snapshot()
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO jobs(id, kind, params, status, done, total, counters, result, error, created_at, started_at, finished_at)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
+            ON CONFLICT(id) DO UPDATE SET
+              status=excluded.status,
+              done=excluded.done,
+              total=excluded.total,
+              counters=excluded.counters,
+              result=excluded.result,
+              error=excluded.error,
+              started_at=excluded.started_at,
+              finished_at=excluded.finished_at
+            """,
+            (
+                snap["id"], snap["kind"], json.dumps(snap["params"], ensure_ascii=False), snap["status"],
+                snap["done"], snap["total"], json.dumps(snap["counters"], ensure_ascii=False),
+                json.dumps(snap["result"], ensure_ascii=False, default=str) if snap["result"] is not None else None,
+                snap["error"], snap["created_at"], snap["started_at"], snap["finished_at"],
+            ),
+        )
+        conn.commit()
+        conn.close()
+        job._persisted_at = time.monotonic()
+    except Exception as e:
+        print(f"[jobs] persist failed for {job.id}: {e}")
+
+
+def _notify(job: Job) -> None:
+    # Caller holds _lock
+    job.version += 1
+    _changed.notify_all()
+    for fn in _watchers.get(job.id, ()):
+        try:
+            fn()
+        except Exception as e:
+            print(f"[jobs] watcher failed for {job.id}: {e}")
+
+
+def _finish(job: Job, status: str, result: Any = None, error: str | None = None) -> None:
+    with _lock:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = datetime.utcnow().isoformat()
+        if status == STATUS_DONE and job.total is not None:
+            job.done = job.total
+        if _active_by_key.get(job.key) == job.id:
+            del _active_by_key[job.key]
+        _notify(job)
+        # Trim finished jobs from memory, oldest first
+        finished = [j for j in _jobs.values() if j.status in FINAL_STATUSES]
+        for old in finished[:-_MAX_FINISHED_IN_MEMORY]:
+            _jobs.pop(old.id, None)
+    _persist(job)
+    kind = (("kind", job.kind),)
+    metrics.inc("stlmanager_jobs_total", kind + (("status", status),))
+    if job.started_at:
+        elapsed = (datetime.fromisoformat(job.finished_at) - datetime.fromisoformat(job.started_at)).total_seconds()
+        metrics.inc("stlmanager_job_seconds_total", kind, elapsed)
+        metrics.inc("stlmanager_job_items_total", kind, job.done or 0)
+
+
+def _run(job: Job) -> None:
+    if job.cancel_event.is_set():
+        _finish(job, STATUS_CANCELLED)
+        return
+    with _lock:
+        job.status = STATUS_RUNNING
+        job.started_at = datetime.utcnow().isoformat()
+        _notify(job)
+    _persist(job)
+    _local.job = job
+    try:
+        result = job.fn()
+    except JobCancelled:
+        _finish(job, STATUS_CANCELLED)
+    except Exception as e:
+        detail = getattr(e, "detail", None) or str(e)
+        print(f"[jobs] {job.kind} {job.id} failed: {detail}")
+        _finish(job, STATUS_FAILED, error=str(detail))
+    else:
+        _finish(job, STATUS_DONE, result=result)
+    finally:
+        _local.job = None
+
+
+def _worker_loop() -> None:
+    while True:
+        job = _queue.get()
+        try:
+            _run(job)
+        finally:
+            _queue.task_done()
+
+
+def _ensure_worker() -> None:
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_worker_loop, name="stlmanager-jobs", daemon=True)
+        _worker.start()
+
+
+def submit(kind: str, fn: Callable[[], Any], params: Optional[dict] = None) -> dict:
+    """Queue fn() as a background job and return its descriptor.
+
+    If an identical job (same kind and params) is already queued or running,
+    no new job is created and the existing one is returned with deduplicated=True.
+    """
+    job = Job(kind, params or {}, fn)
+    with _lock:
+        existing_id = _active_by_key.get(job.key)
+        existing = _jobs.get(existing_id) if existing_id else None
+        if existing is not None and existing.status not in FINAL_STATUSES:
+            return {"job_id": existing.id, "kind": kind, "status": existing.status, "deduplicated": True}
+        _jobs[job.id] = job
+        _active_by_key[job.key] = job.id
+    _persist(job)
+    _ensure_worker()
+    _queue.put(job)
+    return {"job_id": job.id, "kind": kind, "status": job.status, "deduplicated": False}
+
+
+def current() -> Job | None:
+    return getattr(_local, "job", None)
+
+
+def checkpoint(done: int | None = None, total: int | None = None, **counters: Any) -> None:
+    """Report progress from inside a job and honour cancellation.
+
+    No-op when called outside a background job, so indexers can call it
+    unconditionally from their loops. Raises JobCancelled if a cancel was requested.
+    """
+    job = current()
+    if job is None:
+        return
+    with _lock:
+        if done is not None:
+            job.done = int(done)
+        if total is not None:
+            job.total = int(total)
+        if counters:
+            job.counters.update(counters)
+        _notify(job)
+    if time.monotonic() - job._persisted_at >= _PERSIST_INTERVAL:
+        _persist(job)
+    if job.cancel_event.is_set():
+        raise JobCancelled()
+
+
+def is_cancelled() -> bool:
+    job = current()
+    return job is not None and job.cancel_event.is_set()
+
+
+def cancel(job_id: str) -> dict | None:
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        if job.status not in FINAL_STATUSES:
+            job.cancel_event.set()
+            _notify(job)
+        snap = job.snapshot()
+    snap["cancel_requested"] = job.cancel_event.is_set()
+    return snap
+
+
+def _row_to_snapshot(row) -> dict:
+    d = dict(row)
+    for k in ("params", "counters", "result"):
+        try:
+            d[k] = json.loads(d[k]) if d.get(k) else ({} if k != "result" else None)
+        except Exception:
+            pass
+    total = d.get("total")
+    d["progress_pct"] = int(min(d.get("done") or 0, total) * 100 / total) if total else (100 if d.get("status") == STATUS_DONE else None)
+    return d
+
+
+def get(job_id: str) -> dict | None:
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = cur.fetchone()
+        conn.close()
+    except Exception:
+        row = None
+    return _row_to_snapshot(row) if row else None
+
+
+def list_jobs(limit: int = 50, kind: str | None = None) -> list[dict]:
+    conn = get_connection()
+    cur = conn.cursor()
+    if kind:
+        cur.execute("SELECT * FROM jobs WHERE kind = ? ORDER BY created_at DESC LIMIT ?", (kind, limit))
+    else:
+        cur.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+    rows = [_row_to_snapshot(r) for r in cur.fetchall()]
+    conn.close()
+    # Live state wins over the (throttled) persisted one
+    with _lock:
+        return [(_jobs[r["id"]].snapshot() if r["id"] in _jobs else r) for r in rows]
+
+
+def watch(job_id: str, fn: Callable[[], None]) -> bool:
+    """Call fn() after every change of the job; False when it is not in memory.
+
+    fn runs on the thread making the change, with the jobs lock held: it must
+    only hand the news over (e.g. loop.call_soon_threadsafe), never block.
+    """
+    with _lock:
+        if job_id not in _jobs:
+            return False
+        _watchers.setdefault(job_id, []).append(fn)
+        return True
+
+
+def unwatch(job_id: str, fn: Callable[[], None]) -> None:
+    with _lock:
+        fns = _watchers.get(job_id)
+        if fns and fn in fns:
+            fns.remove(fn)
+            if not fns:
+                del _watchers[job_id]
+
+
+def mark_interrupted() -> None:
+    """Jobs still queued/running in SQLite at startup died with the previous process."""
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE jobs SET status = ?, error = COALESCE(error, 'interrompu (redémarrage)'), finished_at = COALESCE(finished_at, ?) WHERE status IN (?, ?)",
+            (STATUS_FAILED, datetime.utcnow().isoformat(), STATUS_QUEUED, STATUS_RUNNING),
+        )
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"[jobs] startup cleanup failed: {e}")
@@ -1,9 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import health, projects, scan, folders, files, version
+from .routers import health, projects, scan, folders, files, version, jobs as jobs_router, metrics as metrics_router
 from .db import init_db
+from . import compression, fastjson, jobs, metrics, posters, tracing, warmup
 
-app = FastAPI(title="STLManager API")
+# Responses rendered by app/fastjson.py (orjson, else compact stdlib json)
+app = FastAPI(title="STLManager API", default_response_class=fastjson.FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,6 +14,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if compression.ENABLED:
+    app.add_middleware(compression.Compression)
+# Around compression, so that it is part of the trace
+if tracing.ENABLED:
+    app.add_middleware(tracing.RequestTracing)
+# Outermost: times the whole request, CORS included
+if metrics.ENABLED:
+    app.add_middleware(metrics.RequestMetrics)
 
 app.include_router(health.router)
 app.include_router(projects.router, prefix="/projects", tags=["projects"])
@@ -19,7 +29,17 @@ app.include_router(scan.router, tags=["scan"])
 app.include_router(folders.router, prefix="/folders", tags=["folders"])
 app.include_router(files.router, prefix="/files", tags=["files"])
 app.include_router(version.router)
+app.include_router(jobs_router.router, prefix="/jobs", tags=["jobs"])
+app.include_router(metrics_router.router)
 
 @app.on_event("startup")
 def on_startup():
     init_db()
+    jobs.mark_interrupted()
+    # Page cache and in-memory indexes, in the background (WARMUP=0: built on first use)
+    warmup.start()
+    # Posters / placeholders missing for existing projects (new install, Pillow or ffmpeg just added)
+    try:
+        posters.schedule(if_pending=True)
+    except Exception as e:
+        print(f"[posters] backfill not scheduled: {e}")
@@ -0,0 +1,276 @@
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from . import metrics, tracing
+from .db import get_connection
+
+# Media classification shared by the folders router and the /scan pipeline
+IMAGE_EXT = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+GIF_EXT = {".gif"}
+VIDEO_EXT = {".mp4", ".webm", ".mov", ".m4v"}
+ARCHIVE_EXT = {".zip", ".7z", ".rar"}
+STL_EXT = {".stl"}
+MEDIA_EXT = IMAGE_EXT | GIF_EXT | VIDEO_EXT | ARCHIVE_EXT | STL_EXT
+
+META_NAME = ".stl_collect.json"
+
+# Recursive media summary of a project folder, cached per directory.
+#
+# Each directory gets one `dir_summary` row holding its *own* file counts, the
+# newest file mtime, its first image, its STL file names and its child
+# directories, stamped with the directory's mtime. A directory whose mtime did
+# not change is not listed again: only changed subtrees are re-scanned, the rest
+# costs one stat() per directory. A file rewritten in place does not change its
+# parent directory mtime, so the sidecar of a cached directory is stat()ed as
+# well (one more stat, only where there is one): an edited .stl_collect.json
+# (tags, rating, made by hand, by scripts/fix_tags_json.py --no-db or on the
+# NAS) moves the summary's newest mtime, and the incremental reindex picks it
+# up. Media files overwritten in place under the same name are only seen once
+# the directory itself changes.
+
+
+class SubtreeSummary:
+    def __init__(self, path: str):
+        self.path = path
+        self.images = 0
+        self.gifs = 0
+        self.videos = 0
+        self.archives = 0
+        self.stls = 0
+        self.latest_mtime: float | None = None
+        self.first_image: str | None = None
+        # Directories (absolute paths) directly holding media, and whether they have a sidecar
+        self.media_dirs: list[tuple[str, bool]] = []
+        self.stl_files: list[str] = []
+        self.dirs_scanned = 0
+        self.dirs_cached = 0
+        self.unreadable: list[str] = []
+
+    @property
+    def any_media(self) -> bool:
+        return bool(self.images or self.gifs or self.videos or self.archives or self.stls)
+
+    def counts(self) -> dict:
+        return {
+            "images": self.images,
+            "gifs": self.gifs,
+            "videos": self.videos,
+            "archives": self.archives,
+            "stls": self.stls,
+        }
+
+
+def classify(name: str) -> str | None:
+    ext = os.path.splitext(name)[1].lower()
+    if ext in IMAGE_EXT:
+        return "images"
+    if ext in GIF_EXT:
+        return "gifs"
+    if ext in VIDEO_EXT:
+        return "videos"
+    if ext in ARCHIVE_EXT:
+        return "archives"
+    if ext in STL_EXT:
+        return "stls"
+    return None
+
+
+def _list_own(path: str) -> dict | None:
+    """Scan one directory (non-recursive). None if it cannot be listed."""
+    own = {"images": 0, "gifs": 0, "videos": 0, "archives": 0, "stls": 0,
+           "latest": None, "first_image": None, "stl_names": [], "children": [], "has_meta": False}
+    stats = 0
+    try:
+        with tracing.span("fs", "scandir", path=path), os.scandir(path) as it:
+            for e in it:
+                try:
+                    if e.is_dir():
+                        # Like os.walk(followlinks=False)
+                        if not e.is_symlink():
+                            own["children"].append(e.name)
+                        continue
+                    if not e.is_file():
+                        continue
+                    if e.name == META_NAME:
+                        own["has_meta"] = True
+                    try:
+                        stats += 1
+                        mt = e.stat().st_mtime
+                        if own["latest"] is None or mt > own["latest"]:
+                            own["latest"] = mt
+                    except OSError:
+                        pass
+                    kind = classify(e.name)
+                    if kind is None:
+                        continue
+                    own[kind] += 1
+                    if kind == "images" and own["first_image"] is None:
+                        own["first_image"] = e.name
+                    elif kind == "stls":
+                        own["stl_names"].append(e.name)
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    finally:
+        metrics.fs("scandir", path)
+        metrics.fs("stat", path, stats)
+    return own
+
+
+def _row_to_own(row) -> dict:
+    return {
+        "images": row["images"], "gifs": row["gifs"], "videos": row["videos"],
+        "archives": row["archives"], "stls": row["stls"], "latest": row["latest_mtime"],
+        "first_image": row["first_image"], "has_meta": bool(row["has_meta"]),
+        "stl_names": json.loads(row["stl_names"] or "[]"),
+        "children": json.loads(row["children"] or "[]"),
+    }
+
+
+def _prefix_bounds(path: str) -> tuple[str, str]:
+    # Every descendant path sorts in [path + sep, path + chr(sep + 1)); lets SQLite use the primary key
+    return path + os.sep, path + chr(ord(os.sep) + 1)
+
+
+def _load_subtree(cur, path: str) -> dict:
+    lo, hi = _prefix_bounds(path)
+    cur.execute("SELECT * FROM dir_summary WHERE path = ? OR (path >= ? AND path < ?)", (path, lo, hi))
+    return {r["path"]: r for r in cur.fetchall()}
+
+
+def _upsert_params(d: str, dir_mtime: float, own: dict) -> tuple:
+    return (
+        d, dir_mtime, own["images"], own["gifs"], own["videos"], own["archives"], own["stls"],
+        own["latest"], own["first_image"], 1 if own["has_meta"] else 0,
+        json.dumps(own["stl_names"], ensure_ascii=False), json.dumps(own["children"], ensure_ascii=False),
+    )
+
+
+def summarize(folder: Path | str, conn: sqlite3.Connection | None = None) -> SubtreeSummary:
+    """Recursive media summary of `folder`, re-scanning only directories whose mtime changed.
+
+    When `conn` is given the cache rows are written through it and left for the
+    caller to commit (so that it can be used inside an indexer transaction).
+    """
+    top = str(folder)
+    summary = SubtreeSummary(top)
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = get_connection()
+        cur = conn.cursor()
+        cached = _load_subtree(cur, top)
+    except sqlite3.Error:
+        cur = None
+        cached = {}
+
+    upserts: list[tuple] = []
+    meta_stats = 0
+    stack = [top]
+    while stack:
+        d = stack.pop()
+        try:
+            with tracing.span("fs", "stat", path=d):
+                dir_mtime = os.stat(d).st_mtime
+        except OSError:
+            if d == top:
+                summary.unreadable.append(d)
+            continue
+        row = cached.pop(d, None)
+        if row is not None and row["mtime"] == dir_mtime:
+            own = _row_to_own(row)
+            summary.dirs_cached += 1
+            if own["has_meta"]:
+                meta = os.path.join(d, META_NAME)
+                try:
+                    with tracing.span("fs", "stat", path=meta):
+                        meta_mtime = os.stat(meta).st_mtime
+                    meta_stats += 1
+                except OSError:
+                    meta_mtime = None
+                if meta_mtime is not None and (own["latest"] is None or meta_mtime > own["latest"]):
+                    # Sidecar rewritten in place: newest mtime of the directory moves
+                    own["latest"] = meta_mtime
+                    upserts.append(_upsert_params(d, dir_mtime, own))
+        else:
+            own = _list_own(d)
+            if own is None:
+                summary.unreadable.append(d)
+                continue
+            summary.dirs_scanned += 1
+            upserts.append(_upsert_params(d, dir_mtime, own))
+        summary.images += own["images"]
+        summary.gifs += own["gifs"]
+        summary.videos += own["videos"]
+        summary.archives += own["archives"]
+        summary.stls += own["stls"]
+        if own["latest"] is not None and (summary.latest_mtime is None or own["latest"] > summary.latest_mtime):
+            summary.latest_mtime = own["latest"]
+        # Pre-order walk: images of a parent win over images of its subfolders
+        if summary.first_image is None and own["first_image"]:
+            summary.first_image = os.path.join(d, own["first_image"])
+        if own["images"] or own["gifs"] or own["videos"] or own["archives"] or own["stls"]:
+            summary.media_dirs.append((d, own["has_meta"]))
+        for n in own["stl_names"]:
+            summary.stl_files.append(os.path.join(d, n))
+        stack.extend(os.path.join(d, c) for c in reversed(own["children"]))
+
+    metrics.fs("stat", top, summary.dirs_cached + summary.dirs_scanned + len(summary.unreadable) + meta_stats)
+    metrics.inc("stlmanager_cache_requests_total", (("cache", "dir_summary"), ("result", "hit")), summary.dirs_cached)
+    metrics.inc("stlmanager_cache_requests_total", (("cache", "dir_summary"), ("result", "miss")), summary.dirs_scanned)
+
+    if cur is not None:
+        try:
+            if upserts:
+                cur.executemany(
+                    """
+                    INSERT OR REPLACE INTO dir_summary
+                    (path, mtime, images, gifs, videos, archives, stls, latest_mtime, first_image, has_meta, stl_names, children)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    upserts,
+                )
+            # Rows left over belong to directories that no longer exist (unless merely unreadable)
+            stale = [(p,) for p in cached if not any(p == u or p.startswith(u + os.sep) for u in summary.unreadable)]
+            if stale:
+                cur.executemany("DELETE FROM dir_summary WHERE path = ?", stale)
+            if own_conn:
+                conn.commit()
+        except sqlite3.Error as e:
+            # The cache is best effort; counts are still correct
+            print(f"[media_index] cache write skipped for '{top}': {e}")
+    if own_conn and conn is not None:
+        conn.close()
+    return summary
+
+
+def forget(conn: sqlite3.Connection, folder: Path | str) -> None:
+    """Drop cached summaries for `folder` and everything below it."""
+    path = str(folder)
+    lo, hi = _prefix_bounds(path)
+    try:
+        conn.execute("DELETE FROM dir_summary WHERE path = ? OR (path >= ? AND path < ?)", (path, lo, hi))
+    except sqlite3.Error:
+        pass
+
+
+def prune(conn: sqlite3.Connection, root: Path | str, keep_tops: set[str]) -> int:
+    """Drop cached summaries of top-level folders of `root` that are not in `keep_tops`."""
+    root_s = str(root).rstrip("/\\") + os.sep
+    try:
+        cur = conn.cursor()
+        lo, hi = _prefix_bounds(str(root).rstrip("/\\"))
+        cur.execute("SELECT path FROM dir_summary WHERE path >= ? AND path < ?", (lo, hi))
+        gone = []
+        for (p,) in cur.fetchall():
+            top = root_s + p[len(root_s):].split(os.sep, 1)[0]
+            if top not in keep_tops:
+                gone.append((p,))
+        if gone:
+            cur.executemany("DELETE FROM dir_summary WHERE path = ?", gone)
+        return len(gone)
+    except sqlite3.Error:
+        return 0
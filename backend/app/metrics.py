@@ -0,0 +1,248 @@
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from . import tracing
+
+# Process metrics in the Prometheus text format (GET /metrics), without any
+# client library.
+#
+# Counters and histograms are plain dicts keyed by (name, labels) behind one
+# lock: recording a sample is a dict update, cheap enough for the hot /folders/
+# and /files/ paths. Instrumented:
+# - HTTP: latency histogram and request count per method + route template
+#   (RequestMetrics middleware; the template, not the raw path, so /files/
+#   does not create one series per file);
+# - SQLite: statements and time spent in execute()/executemany() per verb, for
+#   every connection made by db.get_connection() (MeteredConnection);
+# - filesystem: scandir / stat / JSON read / JSON write counts per area
+#   (under COLLECTION_ROOT, under the data directory, other), from the
+#   indexers, detail listings and sidecar reads/writes (fs());
+# - background jobs: runs, items and seconds per kind (indexer throughput =
+#   rate(items) / rate(seconds));
+# - caches: hits / misses of the in-memory and SQLite caches, pulled at scrape
+#   time from the modules that own them (register()).
+# METRICS=0 turns the middleware off, and the SQLite wrapper unless tracing
+# needs it.
+
+ENABLED = os.getenv("METRICS", "1").lower() not in ("0", "false", "no", "off")
+
+# Seconds; the default Prometheus client buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters: dict[tuple[str, tuple], float] = {}
+# (name, labels) -> [count per bucket..., +Inf count, sum]
+_histograms: dict[tuple[str, tuple], list] = {}
+_help: dict[str, tuple[str, str]] = {}
+_collectors: list[Callable[[], Iterable[tuple[str, str, dict, float]]]] = []
+
+
+def describe(name: str, kind: str, text: str) -> None:
+    _help[name] = (kind, text)
+
+
+def inc(name: str, labels: tuple = (), value: float = 1) -> None:
+    key = (name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, labels: tuple, seconds: float) -> None:
+    key = (name, labels)
+    i = bisect_left(BUCKETS, seconds)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        h[i] += 1
+        h[-1] += seconds
+
+
+def register(fn: Callable[[], Iterable[tuple[str, str, dict, float]]]) -> Callable:
+    """Register a scrape-time collector yielding (name, kind, labels, value)."""
+    _collectors.append(fn)
+    return fn
+
+
+# ---- filesystem -------------------------------------------------------------
+
+_areas: list[tuple[str, str]] = []
+
+
+def _area(path: str) -> str:
+    if not _areas:
+        for label, base in (("collection", os.getenv("COLLECTION_ROOT")), ("data", os.path.dirname(os.getenv("CACHE_DB_PATH") or ""))):
+            if base:
+                _areas.append((label, os.path.normpath(base).rstrip(os.sep) + os.sep))
+    path = path.rstrip(os.sep) + os.sep
+    for label, base in _areas:
+        if path.startswith(base):
+            return label
+    return "other"
+
+
+def fs(op: str, path, n: int = 1) -> None:
+    """Count `n` filesystem operations `op` (scandir, stat, json_read, json_write) on `path`."""
+    if n:
+        inc("stlmanager_fs_ops_total", (("op", op), ("area", _area(str(path)))), n)
+
+
+# ---- SQLite -----------------------------------------------------------------
+
+def _verb(sql: str) -> str:
+    head = sql.lstrip()[:8].upper()
+    for verb in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE", "CREATE", "PRAGMA"):
+        if head.startswith(verb):
+            return verb.lower()
+    return "other"
+
+
+def _sql_done(sql: str, started: float) -> None:
+    ended = time.perf_counter()
+    verb = _verb(sql)
+    trace = tracing.current()
+    if trace is not None:
+        trace.record("sql", verb, started, ended, {"sql": " ".join(sql.split())[:300]})
+    if not ENABLED:
+        return
+    labels = (("verb", verb),)
+    elapsed = ended - started
+    with _lock:
+        key = ("stlmanager_sqlite_statements_total", labels)
+        _counters[key] = _counters.get(key, 0) + 1
+        key = ("stlmanager_sqlite_seconds_total", labels)
+        _counters[key] = _counters.get(key, 0) + elapsed
+
+
+class MeteredCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _sql_done(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _sql_done(sql, started)
+
+
+class MeteredConnection(sqlite3.Connection):
+    """sqlite3 connection counting statements and their execute() time (fetches not included).
+
+    Also gives each statement a span in the request's trace (see tracing).
+    """
+
+    def cursor(self, factory=MeteredCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# ---- HTTP -------------------------------------------------------------------
+
+class RequestMetrics:
+    """ASGI middleware: latency histogram and count per method + route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            labels = (("method", scope["method"]), ("route", getattr(route, "path", None) or "unmatched"))
+            observe("stlmanager_http_request_duration_seconds", labels, time.perf_counter() - started)
+            inc("stlmanager_http_requests_total", labels + (("status", str(status[0])),))
+
+
+# ---- exposition ---------------------------------------------------------------
+
+def _fmt_labels(labels) -> str:
+    if not labels:
+        return ""
+    items = labels.items() if isinstance(labels, dict) else labels
+    parts = []
+    for k, v in items:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render() -> str:
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+    series: dict[str, list[str]] = {}
+    kinds: dict[str, str] = {}
+    for (name, labels), v in sorted(counters.items()):
+        kinds.setdefault(name, "counter")
+        series.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {_fmt_value(v)}")
+    for (name, labels), h in sorted(histograms.items()):
+        kinds.setdefault(name, "histogram")
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, n in zip(BUCKETS, h):
+            cumulative += n
+            lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', repr(bound)),))} {cumulative}")
+        cumulative += h[len(BUCKETS)]
+        lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {cumulative}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {repr(float(h[-1]))}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+    for fn in list(_collectors):
+        try:
+            for name, kind, labels, v in fn():
+                if v is None:
+                    continue
+                kinds.setdefault(name, kind)
+                series.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {_fmt_value(v)}")
+        except Exception as e:
+            print(f"[metrics] collector failed: {e}")
+    out = []
+    for name, lines in series.items():
+        kind, text = _help.get(name, (kinds[name], ""))
+        if text:
+            out.append(f"# HELP {name} {text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+describe("stlmanager_http_request_duration_seconds", "histogram", "HTTP request latency by method and route template.")
+describe("stlmanager_http_requests_total", "counter", "HTTP requests by method, route template and status.")
+describe("stlmanager_sqlite_statements_total", "counter", "SQLite statements executed, by verb.")
+describe("stlmanager_sqlite_seconds_total", "counter", "Time spent in SQLite execute()/executemany(), by verb.")
+describe("stlmanager_fs_ops_total", "counter", "Filesystem operations by kind and area (collection, data, other).")
+describe("stlmanager_jobs_total", "counter", "Finished background jobs by kind and status.")
+describe("stlmanager_job_items_total", "counter", "Items (folders, files...) processed by background jobs, by kind.")
+describe("stlmanager_job_seconds_total", "counter", "Run time of background jobs, by kind.")
+describe("stlmanager_cache_requests_total", "counter", "Cache lookups by cache and result (hit, miss).")
+describe("stlmanager_cache_entries", "gauge", "Entries currently held by in-memory caches.")
+describe("stlmanager_cache_bytes", "gauge", "Approximate size of in-memory caches.")
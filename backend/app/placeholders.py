@@ -0,0 +1,178 @@
+import base64
+import io
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from . import detail_cache, folder_snapshot, folder_store, jobs
+from .db import get_connection
+
+try:  # Optional dependency: no placeholders without Pillow
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover
+    Image = None
+
+# Tiny inline previews of folder thumbnails for the home grid.
+#
+# Each effective thumbnail (folder_index.thumbnail_path, or the user's
+# preview_overrides entry) gets a SIZE px data URI (WebP, PNG when Pillow lacks
+# WebP; ~150-300 bytes) returned inline as `placeholder` by /folders/ and
+# /folders/detail, so tiles paint something before the real image arrives.
+# Blurhash would be smaller but needs a decoder in the browser; a data URI is
+# usable as-is in <img src>.
+#
+# Rendering runs as a background job ("placeholders") in a process pool, queued
+# by the indexers and the preview/upload endpoints (schedule()). folder_index
+# remembers which thumbnail its placeholder was made from (placeholder_src), so
+# a reindex that picks another thumbnail makes it pending again without any of
+# the upserts knowing about it; an override row is replaced (placeholder NULL)
+# whenever the preview changes. Unreadable images get '' and are not retried.
+#
+# Enabled by default when Pillow is installed; PLACEHOLDERS=0 turns it off.
+
+ENABLED = Image is not None and os.getenv("PLACEHOLDERS", "1").lower() not in ("0", "false", "no", "off")
+SIZE = max(4, int(os.getenv("PLACEHOLDER_SIZE", "16")))
+WORKERS = max(1, int(os.getenv("PLACEHOLDER_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+_DB_BATCH = 200
+# Above this many updated rows the snapshot is rebuilt instead of refreshed row by row
+_REFRESH_MAX = 500
+
+
+def render(path: str) -> str:
+    """Data URI of a SIZE px version of the image at `path`, or '' if it cannot be read."""
+    try:
+        with Image.open(path) as im:
+            # JPEG: let the decoder downscale by up to 8x instead of decoding full size
+            im.draft("RGB", (SIZE * 4, SIZE * 4))
+            im = ImageOps.exif_transpose(im).convert("RGB")
+            im.thumbnail((SIZE, SIZE))
+            buf = io.BytesIO()
+            if features.check("webp"):
+                im.save(buf, "WEBP", quality=50)
+                mime = "image/webp"
+            else:
+                im.save(buf, "PNG", optimize=True)
+                mime = "image/png"
+    except Exception:
+        return ""
+    return f"data:{mime};base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def _pending(cur) -> list[tuple]:
+    """(table, folder_id, stored thumbnail, absolute thumbnail, folder path) still lacking a placeholder."""
+    cur.execute(
+        f"""
+        SELECT 'fi', fi.id, fi.thumbnail_path, {folder_store.thumb_sql("fi.thumbnail_path")}, {folder_store.PATH_SQL}
+        FROM folder_index fi
+        JOIN collection_roots cr ON cr.id = fi.root_id
+        LEFT JOIN preview_overrides po ON po.folder_id = fi.id
+        WHERE po.folder_id IS NULL
+          AND fi.thumbnail_path IS NOT NULL AND fi.thumbnail_path != ''
+          AND fi.placeholder_src IS NOT fi.thumbnail_path
+        """
+    )
+    todo = [tuple(r) for r in cur.fetchall()]
+    cur.execute(
+        f"""
+        SELECT 'po', po.folder_id, po.thumbnail_path, {folder_store.thumb_sql("po.thumbnail_path")}, {folder_store.PATH_SQL}
+        FROM preview_overrides po
+        JOIN folder_index fi ON fi.id = po.folder_id
+        JOIN collection_roots cr ON cr.id = fi.root_id
+        WHERE po.placeholder IS NULL AND po.thumbnail_path IS NOT NULL AND po.thumbnail_path != ''
+        """
+    )
+    todo += [tuple(r) for r in cur.fetchall()]
+    return todo
+
+
+def _map_bounded(pool: ProcessPoolExecutor, items: list[tuple]):
+    """Yield (item, render(item file)) in completion order, with a bounded number in flight."""
+    it = iter(items)
+    pending = {pool.submit(render, x[3]): x for x in itertools.islice(it, WORKERS * 4)}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            item = pending.pop(f)
+            nxt = next(it, None)
+            if nxt is not None:
+                pending[pool.submit(render, nxt[3])] = nxt
+            try:
+                yield item, f.result()
+            except Exception:
+                yield item, ""
+
+
+def _flush(rows: list[tuple]) -> None:
+    conn = get_connection()
+    cur = conn.cursor()
+    for table, fid, src, _, _, data in rows:
+        # Guarded on the thumbnail it was made from: a preview changed meanwhile stays pending
+        if table == "fi":
+            cur.execute(
+                "UPDATE folder_index SET placeholder = ?, placeholder_src = ? WHERE id = ? AND thumbnail_path IS ?",
+                (data, src, fid, src),
+            )
+        else:
+            cur.execute(
+                "UPDATE preview_overrides SET placeholder = ? WHERE folder_id = ? AND thumbnail_path IS ?",
+                (data, fid, src),
+            )
+    conn.commit()
+    conn.close()
+
+
+def fill() -> dict:
+    """Render the missing placeholders (run as a job, see schedule())."""
+    if not ENABLED:
+        return {"enabled": False, "rendered": 0, "failed": 0}
+    conn = get_connection()
+    todo = _pending(conn.cursor())
+    conn.close()
+    rendered = failed = 0
+    batch: list[tuple] = []
+    paths: list[str] = []
+    # spawn: the API process is multi-threaded, forking it could inherit held locks
+    pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        for i, (item, data) in enumerate(_map_bounded(pool, todo)):
+            jobs.checkpoint(done=i, total=len(todo), rendered=rendered, failed=failed)
+            if data:
+                rendered += 1
+            else:
+                failed += 1
+            batch.append((*item, data))
+            paths.append(item[4])
+            if len(batch) >= _DB_BATCH:
+                _flush(batch)
+                batch.clear()
+        _flush(batch)
+    finally:
+        # Also reached on cancel: queued renders are dropped, finished batches stay written
+        pool.shutdown(wait=True, cancel_futures=True)
+        if paths:
+            if len(paths) > _REFRESH_MAX:
+                folder_snapshot.invalidate()
+                detail_cache.invalidate()
+            else:
+                folder_snapshot.refresh(paths)
+                for p in paths:
+                    detail_cache.invalidate(p)
+    return {"enabled": True, "rendered": rendered, "failed": failed}
+
+
+def schedule(if_pending: bool = False) -> dict | None:
+    """Queue the placeholder job (deduplicated while one is queued or running).
+
+    With if_pending, only when some thumbnail still lacks a placeholder (startup backfill).
+    """
+    if not ENABLED:
+        return None
+    if if_pending:
+        conn = get_connection()
+        todo = _pending(conn.cursor())
+        conn.close()
+        if not todo:
+            return None
+    return jobs.submit("placeholders", fill)
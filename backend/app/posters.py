@@ -0,0 +1,258 @@
+import hashlib
+import os
+import shutil
+import subprocess
+
+from . import detail_cache, folder_snapshot, folder_store, jobs, metrics, placeholders, sprites, tracing
+from .db import get_connection
+from .media_index import GIF_EXT, VIDEO_EXT, SubtreeSummary, summarize
+
+# Still previews of projects that have GIFs or videos but no image.
+#
+# Such projects had no thumbnail, so the UI had to load a whole video or
+# animated GIF to show something. The "posters" job gives each of them a still
+# of its first GIF (else its first video), in walk order like first_image:
+# - GIF: the first frame is copied into a one-frame GIF in pure Python (header,
+#   colour tables, graphic control and image blocks; the LZW data is copied, not
+#   decoded), a few KB whatever the size of the animation;
+# - video: one frame grabbed by a local ffmpeg (FFMPEG_BIN, else ffmpeg on PATH)
+#   at POSTER_SEEK seconds, else the first frame; skipped when there is no ffmpeg.
+# Posters are cached under sprites/posters/ next to the other thumbnail
+# derivatives, named after the source path, mtime and size; a source that
+# cannot be converted leaves a .none marker so it is not retried (nor counted as
+# pending, like videos while there is no ffmpeg). The indexers
+# pick up an existing poster as the fallback thumbnail_path (cached(), no
+# extraction during indexing); the job fills the rest and then queues the
+# placeholders job.
+
+POSTER_DIR = os.path.join(sprites.CACHE_DIR, "posters")
+FFMPEG = os.getenv("FFMPEG_BIN") or shutil.which("ffmpeg")
+SEEK = os.getenv("POSTER_SEEK", "1")
+_FFMPEG_TIMEOUT = 30
+
+
+def _key(path: str) -> str | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    raw = f"{path}\0{st.st_mtime_ns}\0{st.st_size}"
+    return hashlib.sha1(raw.encode("utf-8", "surrogateescape")).hexdigest()
+
+
+def _dest(key: str, ext: str) -> str:
+    return os.path.join(POSTER_DIR, key[:2], key + ext)
+
+
+def source(summary: SubtreeSummary) -> str | None:
+    """First GIF, else first video, of a project (walk order), or None."""
+    if not (summary.gifs or summary.videos):
+        return None
+    first_video = None
+    for d, _ in summary.media_dirs:
+        metrics.fs("scandir", d)
+        try:
+            with tracing.span("fs", "scandir", path=d), os.scandir(d) as it:
+                for e in it:
+                    ext = os.path.splitext(e.name)[1].lower()
+                    if ext in GIF_EXT:
+                        return e.path
+                    if ext in VIDEO_EXT and first_video is None:
+                        first_video = e.path
+        except OSError:
+            continue
+    return first_video
+
+
+def cached(summary: SubtreeSummary) -> str | None:
+    """Poster already extracted for a project without images, else None (indexers: never extracts)."""
+    src = source(summary)
+    key = _key(src) if src else None
+    if key is None:
+        return None
+    ext = ".gif" if os.path.splitext(src)[1].lower() in GIF_EXT else ".jpg"
+    dest = _dest(key, ext)
+    return dest if os.path.isfile(dest) else None
+
+
+def _skip_sub_blocks(fh, out: list[bytes]) -> bool:
+    while True:
+        n = fh.read(1)
+        if not n:
+            return False
+        out.append(n)
+        if n[0] == 0:
+            return True
+        block = fh.read(n[0])
+        if len(block) < n[0]:
+            return False
+        out.append(block)
+
+
+def gif_first_frame(path: str) -> bytes | None:
+    """Single-frame GIF holding the first frame of `path`, or None if it is not a readable GIF."""
+    try:
+        with open(path, "rb") as fh:
+            head = fh.read(13)
+            if len(head) < 13 or head[:6] not in (b"GIF87a", b"GIF89a"):
+                return None
+            out = [b"GIF89a", head[6:13]]
+            if head[10] & 0x80:
+                out.append(fh.read(3 << ((head[10] & 0x07) + 1)))
+            gce: list[bytes] = []
+            while True:
+                b = fh.read(1)
+                if b == b"\x21":
+                    label = fh.read(1)
+                    ext = [b, label]
+                    if not label or not _skip_sub_blocks(fh, ext):
+                        return None
+                    # Graphic control (transparency) of the frame that follows; other extensions dropped
+                    if label == b"\xf9":
+                        gce = ext
+                elif b == b"\x2c":
+                    desc = fh.read(9)
+                    if len(desc) < 9:
+                        return None
+                    out += gce
+                    out += [b, desc]
+                    if desc[8] & 0x80:
+                        out.append(fh.read(3 << ((desc[8] & 0x07) + 1)))
+                    lzw_min = fh.read(1)
+                    if not lzw_min:
+                        return None
+                    out.append(lzw_min)
+                    if not _skip_sub_blocks(fh, out):
+                        return None
+                    out.append(b"\x3b")
+                    return b"".join(out)
+                else:
+                    return None
+    except OSError:
+        return None
+
+
+def _video_frame(path: str, dest: str) -> bool:
+    if not FFMPEG:
+        return False
+    tmp = dest + ".tmp.jpg"
+    # -ss before -i: fast seek; videos shorter than SEEK give no frame, retried at 0
+    for seek in (SEEK, "0"):
+        try:
+            subprocess.run(
+                [FFMPEG, "-v", "error", "-nostdin", "-y", "-ss", seek, "-i", path,
+                 "-frames:v", "1", "-vf", "scale='min(960,iw)':-2", "-q:v", "4", tmp],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=_FFMPEG_TIMEOUT, check=False,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"[posters] ffmpeg failed for '{path}': {e}")
+            return False
+        if os.path.isfile(tmp) and os.path.getsize(tmp) > 0:
+            os.replace(tmp, dest)
+            return True
+    return False
+
+
+def extract(src: str) -> str | None:
+    """Poster of `src` (cached), extracted on first use. None when it cannot be made."""
+    key = _key(src)
+    if key is None:
+        return None
+    is_gif = os.path.splitext(src)[1].lower() in GIF_EXT
+    dest = _dest(key, ".gif" if is_gif else ".jpg")
+    if os.path.isfile(dest):
+        return dest
+    marker = _dest(key, ".none")
+    if os.path.exists(marker):
+        return None
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if is_gif:
+        data = gif_first_frame(src)
+        if data:
+            tmp = dest + ".tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, dest)
+            return dest
+    else:
+        if not FFMPEG:
+            # Not a failure of this file: retried once ffmpeg is installed
+            return None
+        if _video_frame(src, dest):
+            return dest
+    open(marker, "wb").close()
+    return None
+
+
+def _hopeless(src: str) -> bool:
+    """Poster of `src` known not to be makeable: unreadable, .none marker, or a video without ffmpeg."""
+    key = _key(src)
+    if key is None or os.path.exists(_dest(key, ".none")):
+        return True
+    return not FFMPEG and os.path.splitext(src)[1].lower() not in GIF_EXT
+
+
+def _pending(conn) -> list[tuple[int, str, str]]:
+    """(id, path, source) of the projects without thumbnail whose poster can still be made.
+
+    Projects whose source already failed (or only has videos while there is no
+    ffmpeg) are left out, so that startup and every indexer run do not queue
+    them again.
+    """
+    cur = conn.cursor()
+    media = "(fi.gifs > 0 OR fi.videos > 0)" if FFMPEG else "fi.gifs > 0"
+    cur.execute(
+        f"""
+        SELECT fi.id, {folder_store.PATH_SQL}
+        FROM folder_index fi
+        JOIN collection_roots cr ON cr.id = fi.root_id
+        WHERE (fi.thumbnail_path IS NULL OR fi.thumbnail_path = '') AND {media}
+        """
+    )
+    todo = []
+    for fid, path in cur.fetchall():
+        src = source(summarize(path, conn))
+        if src and not _hopeless(src):
+            todo.append((fid, path, src))
+    return todo
+
+
+def fill() -> dict:
+    """Extract the missing posters (run as a job, see schedule()), then queue the placeholders."""
+    conn = get_connection()
+    todo = _pending(conn)
+    made = failed = 0
+    paths: list[str] = []
+    try:
+        for i, (fid, path, src) in enumerate(todo):
+            jobs.checkpoint(done=i, total=len(todo), made=made, failed=failed)
+            poster = extract(src)
+            if poster is None:
+                failed += 1
+                continue
+            conn.execute(
+                "UPDATE folder_index SET thumbnail_path = ? WHERE id = ? AND (thumbnail_path IS NULL OR thumbnail_path = '')",
+                (poster, fid),
+            )
+            conn.commit()
+            made += 1
+            paths.append(path)
+    finally:
+        conn.close()
+        if paths:
+            folder_snapshot.refresh(paths)
+            for p in paths:
+                detail_cache.invalidate(p)
+    placeholders.schedule()
+    return {"made": made, "failed": failed, "ffmpeg": bool(FFMPEG)}
+
+
+def schedule(if_pending: bool = False) -> dict | None:
+    """Queue the poster job (deduplicated while one is queued or running); it queues the placeholders."""
+    if if_pending:
+        conn = get_connection()
+        todo = _pending(conn)
+        conn.close()
+        if not todo:
+            return placeholders.schedule(if_pending=True)
+    return jobs.submit("posters", fill)
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+from typing import Callable
+
+from . import folder_store
+
+# Folder move/rename propagation.
+#
+# folder_index is keyed by (root_id, rel) with thumbnails relative to the folder
+# and preview_overrides by folder id (see folder_store), so a rename is one
+# keyed update of rel and a remount one update of collection_roots. The caches
+# still keyed by absolute path (dir_summary, image_meta, projects) are re-keyed
+# with one statement each over the range [old + sep, old + chr(ord(sep) + 1)),
+# which SQLite answers from their path index (no LIKE / REPLACE scan). In-memory
+# caches register with on_move() and are told once the caller has committed
+# (notify()).
+
+_listeners: list[Callable[[str, str], None]] = []
+
+# Remount detection: share of sampled indexed folders that must exist under the new root
+_REMOUNT_SAMPLE = 64
+_REMOUNT_MATCH = 0.8
+
+
+def on_move(fn: Callable[[str, str], None]) -> Callable[[str, str], None]:
+    """Register fn(old_path, new_path), called after a folder move is committed."""
+    _listeners.append(fn)
+    return fn
+
+
+# projects.dir is stored with "/" whatever the platform (see routers/scan), folder rels with os.sep
+_DIR_SEP = "/"
+
+
+def _dir_form(rel: str) -> str:
+    return rel.replace(os.sep, _DIR_SEP)
+
+
+def _bounds(path: str) -> tuple[str, str]:
+    return path + os.sep, path + chr(ord(os.sep) + 1)
+
+
+def move_tree(cur: sqlite3.Cursor, old: str, new: str) -> dict:
+    """Re-key the path-keyed caches (dir_summary, image_meta, projects.path) of everything at or below `old`."""
+    lo, hi = _bounds(old)
+    new_lo, new_hi = _bounds(new)
+    # substr() is 1-based: new || substr(p, cut) turns old[/...] into new[/...]
+    cut = len(old) + 1
+    counts: dict[str, int] = {}
+    # Cached media summaries move with their directories (no rescan needed)
+    cur.execute("DELETE FROM dir_summary WHERE path = ? OR (path >= ? AND path < ?)", (new, new_lo, new_hi))
+    cur.execute(
+        "UPDATE dir_summary SET path = ? || substr(path, ?) WHERE path = ? OR (path >= ? AND path < ?)",
+        (new, cut, old, lo, hi),
+    )
+    counts["dir_summary"] = cur.rowcount
+    # Image headers are keyed by file path, always below a folder
+    cur.execute("DELETE FROM image_meta WHERE path >= ? AND path < ?", (new_lo, new_hi))
+    cur.execute("UPDATE image_meta SET path = ? || substr(path, ?) WHERE path >= ? AND path < ?", (new, cut, lo, hi))
+    counts["image_meta"] = cur.rowcount
+    cur.execute("DELETE FROM projects WHERE path >= ? AND path < ?", (new_lo, new_hi))
+    cur.execute("UPDATE projects SET path = ? || substr(path, ?) WHERE path >= ? AND path < ?", (new, cut, lo, hi))
+    counts["projects"] = cur.rowcount
+    return counts
+
+
+def move_folder(cur: sqlite3.Cursor, old: str, new: str) -> dict:
+    """Point every index row of folder `old` (and below) at `new`. The caller commits."""
+    rid, old_rel = folder_store.key(cur, old)
+    _, new_rel = folder_store.key(cur, new)
+    counts: dict[str, int] = {}
+
+    # Thumbnails are relative to the folder and preview_overrides keyed by its id: only rel/name change
+    cur.execute(
+        "UPDATE folder_index SET rel = ?, name = ? WHERE root_id = ? AND rel = ?",
+        (new_rel, os.path.basename(new), rid, old_rel),
+    )
+    counts["folder_index"] = cur.rowcount
+
+    counts.update(move_tree(cur, old, new))
+    # Legacy per-STL table: `dir` is relative to COLLECTION_ROOT
+    if old_rel and new_rel:
+        old_dir, new_dir = _dir_form(old_rel), _dir_form(new_rel)
+        n = len(old_dir) + 1
+        lo, hi = _bounds(new)
+        cur.execute(
+            """
+            UPDATE projects SET dir = CASE WHEN dir = ? THEN ? ELSE ? || substr(dir, ?) END
+            WHERE path >= ? AND path < ? AND (dir = ? OR substr(dir, 1, ?) = ?)
+            """,
+            (old_dir, new_dir, new_dir, n, lo, hi, old_dir, n, old_dir + _DIR_SEP),
+        )
+    return counts
+
+
+def attach_root(cur: sqlite3.Cursor, root: str | None) -> int:
+    """Register the configured collection root at startup.
+
+    A root seen for the first time whose content matches the folders indexed
+    under a known root is that collection remounted elsewhere: the known root's
+    path is swapped in place (folder rows, ratings, overrides and tag counts are
+    kept, the path-keyed caches are re-keyed) instead of a full reindex.
+    """
+    r = folder_store.norm_root(root)
+    cur.execute("SELECT id FROM collection_roots WHERE path = ?", (r,))
+    row = cur.fetchone()
+    if row is not None:
+        return row[0]
+    cur.execute("SELECT id, path FROM collection_roots ORDER BY id DESC")
+    for rid, old in cur.fetchall():
+        cur.execute("SELECT rel FROM folder_index WHERE root_id = ? ORDER BY random() LIMIT ?", (rid, _REMOUNT_SAMPLE))
+        rels = [x[0] for x in cur.fetchall()]
+        if not rels:
+            continue
+        found = sum(1 for rel in rels if os.path.isdir(folder_store.abs_path(r, rel)))
+        if found >= _REMOUNT_MATCH * len(rels):
+            cur.execute("UPDATE collection_roots SET path = ? WHERE id = ?", (r, rid))
+            move_tree(cur, old, r)
+            folder_store.forget_roots()
+            print(f"[db] collection root moved: '{old}' -> '{r}' (index kept)")
+            return rid
+    return folder_store.root_id(cur, r)
+
+
+def notify(old: str, new: str) -> None:
+    """Tell in-memory caches about a committed move."""
+    for fn in list(_listeners):
+        try:
+            fn(old, new)
+        except Exception as e:
+            print(f"[relocate] cache update failed for '{old}' -> '{new}': {e}")
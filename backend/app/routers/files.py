@@ -3,6 +3,8 @@ from fastapi.responses import FileResponse
 from pathlib import Path
 import os
 
+from .. import posters
+
 router = APIRouter()
 
 @router.get("/")
@@ -13,11 +15,14 @@ def get_file(path: str = Query(..., description="Absolute file path under COLLEC
     root_path = Path(root).resolve()
 
     target = Path(path).resolve()
-    # Security: only allow files under COLLECTION_ROOT
+    # Security: only allow files under COLLECTION_ROOT (or generated posters, see app/posters.py)
     try:
         target.relative_to(root_path)
     except Exception:
-        raise HTTPException(status_code=403, detail="Accès refusé")
+        try:
+            target.relative_to(Path(posters.POSTER_DIR).resolve())
+        except Exception:
+            raise HTTPException(status_code=403, detail="Accès refusé")
 
     if not target.exists() or not target.is_file():
         raise HTTPException(status_code=404, detail="Fichier introuvable")
@@ -1,79 +1,33 @@
 import os
 from pathlib import Path
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, File
 from typing import List, Optional, Callable
 import json
 from ..db import get_connection
+from .. import jobs, detail_cache, dir_listing, duplicates, fastjson, image_meta, media_index, folder_snapshot, folder_store, metrics, placeholders, posters, relocate, sprites, tag_index, tag_suggest, sidecar, tracing
+from ..media_index import IMAGE_EXT, GIF_EXT
+import asyncio
 import shutil
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from starlette.responses import StreamingResponse
+from starlette.responses import FileResponse, Response, StreamingResponse
 
 router = APIRouter()
 
-IMAGE_EXT = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
-GIF_EXT = {".gif"}
-VIDEO_EXT = {".mp4", ".webm", ".mov", ".m4v"}
-ARCHIVE_EXT = {".zip", ".7z", ".rar"}
 
-
-def count_media(folder: Path):
-    images = 0
-    gifs = 0
-    videos = 0
-    archives = 0
-    stls = 0
-    max_mtime = 0.0
-    try:
-        for entry in os.scandir(folder):
-            try:
-                if entry.is_file():
-                    m = entry.stat().st_mtime
-                    if m > max_mtime:
-                        max_mtime = m
-                    ext = Path(entry.name).suffix.lower()
-                    if ext in IMAGE_EXT:
-                        images += 1
-                    elif ext in GIF_EXT:
-                        gifs += 1
-                    elif ext in VIDEO_EXT:
-                        videos += 1
-                    elif ext in ARCHIVE_EXT:
-                        archives += 1
-                    elif ext == ".stl":
-                        stls += 1
-            except PermissionError:
-                continue
-    except PermissionError:
-        pass
+def count_media(folder: Path, conn=None):
+    """Recursive media counts of a project folder (cached per sub-directory, see media_index)."""
+    summary = media_index.summarize(folder, conn)
+    max_mtime = summary.latest_mtime or 0.0
     # Fallback to folder mtime if no files found
     try:
         if max_mtime == 0.0 and folder.exists():
             max_mtime = folder.stat().st_mtime
     except Exception:
         pass
-    return images, gifs, videos, archives, stls, max_mtime
-
-
-def _created_at_from_images(folder: Path) -> str | None:
-    try:
-        min_time: float | None = None
-        for entry in os.scandir(folder):
-            if entry.is_file():
-                ext = Path(entry.name).suffix.lower()
-                if ext in IMAGE_EXT or ext in GIF_EXT:
-                    try:
-                        # Use modification time instead of ctime (ctime is change time on Linux/CIFS)
-                        mt = entry.stat().st_mtime
-                        if isinstance(mt, (int, float)):
-                            if min_time is None or mt < min_time:
-                                min_time = mt
-                    except Exception:
-                        continue
-        if min_time is not None:
-            return datetime.fromtimestamp(min_time).isoformat()
-    except PermissionError:
-        pass
-    return None
+    return summary.images, summary.gifs, summary.videos, summary.archives, summary.stls, max_mtime
 
 
 @router.get("/")
@@ -88,6 +42,18 @@ def list_folders(
     to_print: bool | None = Query(None, description="Filtrer par à imprimer (true/false)"),
     rating: int | None = Query(None, ge=1, le=5, description="Filtrer par note (1-5 étoiles)"),
 ):
+    return fastjson.response(_list_folders(sort=sort, order=order, page=page, limit=limit, q=q, tags=tags,
+                                           printed=printed, to_print=to_print, rating=rating))
+
+
+def _list_folders(sort: str = "name", order: str = "asc", page: int = 1, limit: int = 24, q: str | None = None,
+                  tags: list[str] | None = None, printed: bool | None = None, to_print: bool | None = None,
+                  rating: int | None = None) -> dict:
+    """Page of folder_index as {"items", "total"} (GET /folders/, also used by /folders/sprite)."""
+    # Fast path: in-memory columnar snapshot (FOLDER_SNAPSHOT=1)
+    snap = folder_snapshot.query(sort=sort, order=order, page=page, limit=limit, q=q, tags=tags, printed=printed, to_print=to_print, rating=rating)
+    if snap is not None:
+        return snap
     conn = get_connection()
     cur = conn.cursor()
     # WHERE clauses: one for total (no alias), one for page query (with alias 'fi')
@@ -99,8 +65,8 @@ def list_folders(
         like = f"%{q.lower()}%"
         params_total += [like, like]
         params_page += [like, like]
-        where_total_parts.append("(LOWER(name) LIKE ? OR LOWER(path) LIKE ?)" )
-        where_page_parts.append("(LOWER(fi.name) LIKE ? OR LOWER(fi.path) LIKE ?)")
+        where_total_parts.append("(LOWER(name) LIKE ? OR LOWER(rel) LIKE ?)" )
+        where_page_parts.append("(LOWER(fi.name) LIKE ? OR LOWER(fi.rel) LIKE ?)")
     # Tags filtering: require each tag to be present as whole token in CSV
     if tags:
         for t in tags:
@@ -160,11 +126,7 @@ def list_folders(
     offset = (page - 1) * limit
     cur.execute(
         f"""
-        SELECT fi.name, fi.path, fi.rel, fi.mtime, fi.images, fi.gifs, fi.videos, fi.archives, fi.stls,
-               fi.tags, fi.rating, fi.created_at, fi.modified_at, fi.printed, fi.to_print,
-               COALESCE(po.thumbnail_path, fi.thumbnail_path) AS thumbnail_path
-        FROM folder_index fi
-        LEFT JOIN preview_overrides po ON po.path = fi.path
+        {folder_store.SELECT_SQL}
         {where_clause_page}
         ORDER BY {order_by}
         LIMIT ? OFFSET ?
@@ -195,6 +157,62 @@ def list_folders(
     return {"items": items, "total": total}
 
 
+@router.get("/sprite")
+def get_folders_sprite(
+    sort: str = Query("name", description="Tri: name|date|rating|created|modified"),
+    order: str = Query("asc", description="Ordre: asc|desc"),
+    page: int = Query(1, ge=1, description="Numéro de page (1-based)"),
+    limit: int = Query(24, ge=1, le=200, description="Taille de page"),
+    q: str | None = Query(None, description="Filtre texte (nom/chemin)"),
+    tags: list[str] | None = Query(None, description="Filtre par tags (cumulatif)"),
+    printed: bool | None = Query(None, description="Filtrer par imprimé (true/false)"),
+    to_print: bool | None = Query(None, description="Filtrer par à imprimer (true/false)"),
+    rating: int | None = Query(None, ge=1, le=5, description="Filtrer par note (1-5 étoiles)"),
+    paths: list[str] | None = Query(None, description="Projets explicites (chemins absolus, 200 max) au lieu des paramètres de liste"),
+):
+    """Planche unique des miniatures d'une page de /folders/ + coordonnées de chaque projet.
+
+    Même pagination/filtres que GET /folders/ (ou une liste de chemins). L'image est servie
+    par /folders/sprite/{sprite}, nom dérivé du contenu: réutilisée tant qu'aucune miniature
+    de la page ne change.
+    """
+    if not sprites.ENABLED:
+        raise HTTPException(status_code=400, detail="Planches indisponibles (Pillow absent)")
+    if paths:
+        if len(paths) > 200:
+            raise HTTPException(status_code=400, detail="200 chemins maximum")
+        conn = get_connection()
+        cur = conn.cursor()
+        rid = folder_store.root_id(cur)
+        rels = [folder_store.key(cur, p)[1] for p in paths]
+        wanted = [r for r in rels if r]
+        cur.execute(
+            f"{folder_store.SELECT_SQL} WHERE fi.root_id = ? AND fi.rel IN ({','.join('?' * len(wanted))})",
+            [rid, *wanted],
+        )
+        by_path = {r["path"]: dict(r) for r in cur.fetchall()}
+        conn.close()
+        items = [by_path[p] for p in paths if p in by_path]
+    else:
+        items = _list_folders(sort=sort, order=order, page=page, limit=limit, q=q, tags=tags,
+                              printed=printed, to_print=to_print, rating=rating)["items"]
+    try:
+        out = sprites.build(items)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur génération planche: {e}")
+    out["url"] = f"/folders/sprite/{out['sprite']}"
+    return out
+
+
+@router.get("/sprite/{name}")
+def get_folders_sprite_image(name: str):
+    path = sprites.sheet_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Planche introuvable")
+    # Nom = empreinte du contenu: jamais modifié, cache navigateur illimité
+    return FileResponse(path, media_type="image/webp", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
 @router.get("/usage")
 def get_disk_usage():
     root = os.getenv("COLLECTION_ROOT")
@@ -247,6 +265,7 @@ def upload_project(files: List[UploadFile] = File(...)):
 
     # Ensure metadata and index for each touched project
     touched = 0
+    changed_tags: list[str] = []
     try:
         conn = get_connection()
         cur = conn.cursor()
@@ -257,9 +276,12 @@ def upload_project(files: List[UploadFile] = File(...)):
                 if not meta_path.exists():
                     meta = {"added_at": now}
                     meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+                    metrics.fs("json_write", meta_path)
                 else:
                     try:
-                        raw = meta_path.read_text(encoding="utf-8")
+                        metrics.fs("json_read", meta_path)
+                        with tracing.span("fs", "json_read", path=meta_path):
+                            raw = meta_path.read_text(encoding="utf-8")
                         meta = json.loads(raw) if raw.strip() else {}
                     except Exception:
                         meta = {}
@@ -268,19 +290,15 @@ def upload_project(files: List[UploadFile] = File(...)):
                     if not meta.get("added_at"):
                         meta["added_at"] = now
                         meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+                        metrics.fs("json_write", meta_path)
             except Exception:
                 pass
 
             try:
-                rec = _build_folder_record(folder)
-                cur.execute(
-                    """
-                    INSERT OR REPLACE INTO folder_index
-                    (path, name, rel, mtime, images, gifs, videos, archives, stls, tags, rating, thumbnail_path, created_at, modified_at, printed)
-                    VALUES (:path, :name, :rel, :mtime, :images, :gifs, :videos, :archives, :stls, :tags, :rating, :thumbnail_path, :created_at, :modified_at, :printed)
-                    """,
-                    rec,
-                )
+                rec = _build_folder_record(folder, conn)
+                old_tags = tag_index.tags_of(cur, folder_store.key(cur, rec["path"]))
+                folder_store.upsert(cur, rec)
+                changed_tags += tag_index.apply_change(cur, old_tags, rec["tags"])
                 touched += 1
             except Exception:
                 pass
@@ -288,6 +306,11 @@ def upload_project(files: List[UploadFile] = File(...)):
         conn.close()
     except Exception:
         pass
+    folder_snapshot.refresh(projects)
+    for p in projects:
+        detail_cache.invalidate(p)
+    tag_suggest.refresh(changed_tags)
+    posters.schedule()
 
     return {"written": written, "projects": list(projects), "indexed": touched}
 
@@ -346,7 +369,9 @@ def upload_to_project(path: str = Query(..., description="Chemin absolu du proje
         meta: dict = {}
         if meta_path.exists():
             try:
-                meta = json.loads(meta_path.read_text(encoding="utf-8")) or {}
+                metrics.fs("json_read", meta_path)
+                with tracing.span("fs", "json_read", path=meta_path):
+                    meta = json.loads(meta_path.read_text(encoding="utf-8")) or {}
             except Exception:
                 meta = {}
         if not isinstance(meta, dict):
@@ -356,6 +381,7 @@ def upload_to_project(path: str = Query(..., description="Chemin absolu du proje
         meta["modified_at"] = datetime.utcnow().isoformat()
         try:
             meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+            metrics.fs("json_write", meta_path)
         except Exception:
             pass
     except Exception:
@@ -364,24 +390,30 @@ def upload_to_project(path: str = Query(..., description="Chemin absolu du proje
     try:
         conn = get_connection()
         cur = conn.cursor()
-        rec = _build_folder_record(folder_path)
-        cur.execute(
-            """
-            INSERT OR REPLACE INTO folder_index
-            (path, name, rel, mtime, images, gifs, videos, archives, stls, tags, rating, thumbnail_path, created_at, modified_at, printed, to_print)
-            VALUES (:path, :name, :rel, :mtime, :images, :gifs, :videos, :archives, :stls, :tags, :rating, :thumbnail_path, :created_at, :modified_at, :printed, :to_print)
-            """,
-            rec,
-        )
+        rec = _build_folder_record(folder_path, conn)
+        old_tags = tag_index.tags_of(cur, folder_store.key(cur, rec["path"]))
+        folder_store.upsert(cur, rec)
+        changed_tags = tag_index.apply_change(cur, old_tags, rec["tags"])
         conn.commit()
         conn.close()
+        tag_suggest.refresh(changed_tags)
     except Exception:
         pass
+    folder_snapshot.refresh([str(folder_path)])
+    detail_cache.invalidate(str(folder_path))
+    posters.schedule()
 
     return {"written": written}
 
-def _build_folder_record(fpath: Path):
-    images, gifs, videos, archives, stls, folder_mtime = count_media(fpath)
+def _build_folder_record(fpath: Path, conn=None):
+    summary = media_index.summarize(fpath, conn)
+    images, gifs, videos, archives, stls = summary.images, summary.gifs, summary.videos, summary.archives, summary.stls
+    folder_mtime = summary.latest_mtime
+    if folder_mtime is None:
+        try:
+            folder_mtime = fpath.stat().st_mtime
+        except Exception:
+            folder_mtime = None
     # metadata
     meta_path = fpath / ".stl_collect.json"
     tags_list = []
@@ -394,7 +426,8 @@ def _build_folder_record(fpath: Path):
     to_print_flag = 0
     if meta_path.exists() and meta_path.is_file():
         try:
-            with open(meta_path, "r", encoding="utf-8") as fh:
+            with tracing.span("fs", "json_read", path=meta_path), open(meta_path, "r", encoding="utf-8") as fh:
+                metrics.fs("json_read", meta_path)
                 meta = json.load(fh)
             raw_tags = meta.get("tags")
             if isinstance(raw_tags, list):
@@ -451,25 +484,22 @@ def _build_folder_record(fpath: Path):
             pass
     # Fallback for created_at: earliest image/gif ctime, else folder ctime
     if not created_at:
-        created_at = _created_at_from_images(fpath)
+        created_at = sidecar.created_at_from_images(fpath)
     if not created_at:
         try:
             created_at = datetime.fromtimestamp(fpath.stat().st_ctime).isoformat()
         except Exception:
             created_at = None
     if thumbnail_path is None:
-        try:
-            for e in os.scandir(fpath):
-                if e.is_file() and Path(e.name).suffix.lower() in IMAGE_EXT:
-                    thumbnail_path = str(Path(e.path))
-                    break
-        except PermissionError:
-            pass
+        # First image of the walk (top level first, then subfolders)
+        thumbnail_path = summary.first_image
+    if thumbnail_path is None:
+        # GIF/vidéo seulement: poster déjà extrait par le job posters
+        thumbnail_path = posters.cached(summary)
     tags_text = ",".join(tags_list) if tags_list else None
     return {
         "path": str(fpath),
         "name": fpath.name,
-        "rel": str(fpath),
         "mtime": float(folder_mtime) if isinstance(folder_mtime, (int, float)) else None,
         "images": images,
         "gifs": gifs,
@@ -487,7 +517,11 @@ def _build_folder_record(fpath: Path):
 
 
 @router.post("/reindex")
-def reindex_folders():
+def reindex_folders(
+    background: bool = Query(False, description="Exécuter en tâche de fond (renvoie un job_id, suivi via /jobs)"),
+):
+    if background:
+        return jobs.submit("reindex", lambda: reindex_folders(background=False))
     root = os.getenv("COLLECTION_ROOT")
     if not root:
         raise HTTPException(status_code=400, detail="COLLECTION_ROOT non défini")
@@ -497,12 +531,15 @@ def reindex_folders():
 
     conn = get_connection()
     cur = conn.cursor()
-    # Clear existing index
-    cur.execute("DELETE FROM folder_index")
+    # Rows are upserted (their id, and the preview override keyed on it, survive), the rest is dropped at the end
+    seen_ids: set[int] = set()
     added = 0
     failed = 0
     try:
-        for entry in os.scandir(root_path):
+        metrics.fs("scandir", root_path)
+        entries = list(os.scandir(root_path))
+        for i, entry in enumerate(entries):
+            jobs.checkpoint(done=i, total=len(entries), indexed=added, failed=failed)
             try:
                 if not entry.is_dir():
                     continue
@@ -515,9 +552,12 @@ def reindex_folders():
                     if not meta_path.exists():
                         meta = {"added_at": datetime.utcnow().isoformat()}
                         meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+                        metrics.fs("json_write", meta_path)
                     else:
                         try:
-                            raw = meta_path.read_text(encoding="utf-8")
+                            metrics.fs("json_read", meta_path)
+                            with tracing.span("fs", "json_read", path=meta_path):
+                                raw = meta_path.read_text(encoding="utf-8")
                             meta = json.loads(raw) if raw.strip() else {}
                         except Exception:
                             meta = {}
@@ -526,17 +566,13 @@ def reindex_folders():
                         if not meta.get("added_at"):
                             meta["added_at"] = datetime.utcnow().isoformat()
                             meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+                            metrics.fs("json_write", meta_path)
                 except Exception:
                     pass
-                rec = _build_folder_record(fpath)
-                cur.execute(
-                    """
-                    INSERT OR REPLACE INTO folder_index
-                    (path, name, rel, mtime, images, gifs, videos, archives, stls, tags, rating, thumbnail_path, created_at, modified_at, printed, to_print)
-                    VALUES (:path, :name, :rel, :mtime, :images, :gifs, :videos, :archives, :stls, :tags, :rating, :thumbnail_path, :created_at, :modified_at, :printed, :to_print)
-                    """,
-                    rec,
-                )
+                rec = _build_folder_record(fpath, conn)
+                params = folder_store.record_params(cur, rec)
+                cur.execute(folder_store.UPSERT_SQL + " RETURNING id", params)
+                seen_ids.add(cur.fetchone()[0])
                 added += 1
             except PermissionError:
                 continue
@@ -549,13 +585,28 @@ def reindex_folders():
                 failed += 1
     except PermissionError:
         pass
+    cur.execute("SELECT id FROM folder_index")
+    gone = [(r[0],) for r in cur.fetchall() if r[0] not in seen_ids]
+    cur.executemany("DELETE FROM folder_index WHERE id = ?", gone)
+    cur.executemany("DELETE FROM preview_overrides WHERE folder_id = ?", gone)
+    cur.execute(f"SELECT {folder_store.PATH_SQL} FROM folder_index fi JOIN collection_roots cr ON cr.id = fi.root_id")
+    media_index.prune(conn, root_path, {r[0] for r in cur.fetchall()})
+    tag_index.rebuild(cur)
     conn.commit()
     conn.close()
+    folder_snapshot.invalidate()
+    detail_cache.invalidate()
+    tag_suggest.invalidate()
+    posters.schedule()
     return {"indexed": added, "failed": failed}
 
 
 @router.post("/reindex-incremental")
-def reindex_folders_incremental():
+def reindex_folders_incremental(
+    background: bool = Query(False, description="Exécuter en tâche de fond (renvoie un job_id, suivi via /jobs)"),
+):
+    if background:
+        return jobs.submit("reindex-incremental", lambda: reindex_folders_incremental(background=False))
     root = os.getenv("COLLECTION_ROOT")
     if not root:
         raise HTTPException(status_code=400, detail="COLLECTION_ROOT non défini")
@@ -566,9 +617,15 @@ def reindex_folders_incremental():
     conn = get_connection()
     cur = conn.cursor()
 
-    # Load current index (path -> mtime)
-    cur.execute("SELECT path, mtime FROM folder_index")
-    existing = {row[0]: row[1] for row in cur.fetchall()}
+    # Load current index (path -> mtime, path -> tags, path -> id)
+    cur.execute(f"SELECT {folder_store.PATH_SQL}, fi.mtime, fi.tags, fi.id FROM folder_index fi JOIN collection_roots cr ON cr.id = fi.root_id")
+    existing = {}
+    existing_tags = {}
+    existing_ids = {}
+    for row in cur.fetchall():
+        existing[row[0]] = row[1]
+        existing_tags[row[0]] = row[2]
+        existing_ids[row[0]] = row[3]
 
     seen_paths: set[str] = set()
     added = 0
@@ -576,7 +633,10 @@ def reindex_folders_incremental():
     skipped = 0
 
     try:
-        for entry in os.scandir(root_path):
+        metrics.fs("scandir", root_path)
+        entries = list(os.scandir(root_path))
+        for i, entry in enumerate(entries):
+            jobs.checkpoint(done=i, total=len(entries), added=added, updated=updated, skipped=skipped)
             if not entry.is_dir():
                 continue
             if entry.name.startswith('.'):
@@ -589,9 +649,12 @@ def reindex_folders_incremental():
                 if not meta_path.exists():
                     meta = {"added_at": datetime.utcnow().isoformat()}
                     meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+                    metrics.fs("json_write", meta_path)
                 else:
                     try:
-                        raw = meta_path.read_text(encoding="utf-8")
+                        metrics.fs("json_read", meta_path)
+                        with tracing.span("fs", "json_read", path=meta_path):
+                            raw = meta_path.read_text(encoding="utf-8")
                         meta = json.loads(raw) if raw.strip() else {}
                     except Exception:
                         meta = {}
@@ -600,9 +663,10 @@ def reindex_folders_incremental():
                     if not meta.get("added_at"):
                         meta["added_at"] = datetime.utcnow().isoformat()
                         meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+                        metrics.fs("json_write", meta_path)
             except Exception:
                 pass
-            rec = _build_folder_record(Path(entry.path))
+            rec = _build_folder_record(Path(entry.path), conn)
             seen_paths.add(fpath)
             prev_mtime = existing.get(fpath)
             # If unchanged mtime, skip (fast path)
@@ -610,14 +674,8 @@ def reindex_folders_incremental():
                 skipped += 1
                 continue
 
-            cur.execute(
-                """
-                INSERT OR REPLACE INTO folder_index
-                (path, name, rel, mtime, images, gifs, videos, archives, stls, tags, rating, thumbnail_path, created_at, modified_at, printed, to_print)
-                VALUES (:path, :name, :rel, :mtime, :images, :gifs, :videos, :archives, :stls, :tags, :rating, :thumbnail_path, :created_at, :modified_at, :printed, :to_print)
-                """,
-                rec,
-            )
+            folder_store.upsert(cur, rec)
+            tag_index.apply_change(cur, existing_tags.get(fpath), rec["tags"])
             if prev_mtime is None:
                 added += 1
             else:
@@ -629,11 +687,22 @@ def reindex_folders_incremental():
     to_remove = [p for p in existing.keys() if p not in seen_paths]
     removed = 0
     if to_remove:
-        cur.executemany("DELETE FROM folder_index WHERE path = ?", [(p,) for p in to_remove])
+        gone = [(existing_ids[p],) for p in to_remove]
+        cur.executemany("DELETE FROM folder_index WHERE id = ?", gone)
+        cur.executemany("DELETE FROM preview_overrides WHERE folder_id = ?", gone)
+        for p in to_remove:
+            tag_index.apply_change(cur, existing_tags.get(p), None)
+            media_index.forget(conn, p)
+            image_meta.forget(conn, p)
         removed = len(to_remove)
 
     conn.commit()
     conn.close()
+    if added or updated or removed:
+        folder_snapshot.invalidate()
+        detail_cache.invalidate()
+        tag_suggest.invalidate()
+        posters.schedule()
     return {"added": added, "updated": updated, "removed": removed, "skipped": skipped}
 
 
@@ -657,7 +726,8 @@ def set_folder_preview(
     meta: dict = {}
     if meta_path.exists() and meta_path.is_file():
         try:
-            with open(meta_path, "r", encoding="utf-8") as fh:
+            with tracing.span("fs", "json_read", path=meta_path), open(meta_path, "r", encoding="utf-8") as fh:
+                metrics.fs("json_read", meta_path)
                 meta = json.load(fh) or {}
         except Exception:
             meta = {}
@@ -665,7 +735,7 @@ def set_folder_preview(
     # Ensure dates
     try:
         if not meta.get("added_at"):
-            created = _created_at_from_images(folder_path)
+            created = sidecar.created_at_from_images(folder_path)
             if not created:
                 try:
                     created = datetime.fromtimestamp(folder_path.stat().st_ctime).isoformat()
@@ -678,6 +748,7 @@ def set_folder_preview(
     try:
         with open(meta_path, "w", encoding="utf-8") as fh:
             json.dump(meta, fh, ensure_ascii=False, indent=2)
+            metrics.fs("json_write", meta_path)
     except Exception:
         # Ignore write errors (e.g., read-only volume); we'll persist in DB overrides below
         pass
@@ -687,21 +758,20 @@ def set_folder_preview(
     try:
         conn = get_connection()
         cur = conn.cursor()
-        # Ensure overrides table exists (safety in case migration not applied yet)
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS preview_overrides (
-                path TEXT PRIMARY KEY,
-                thumbnail_path TEXT
-            );
-            """
-        )
+        key = folder_store.key(cur, path)
+        thumb_rel = folder_store.rel_thumb(path, thumb_path)
         # Update cache for immediate effect
-        cur.execute("UPDATE folder_index SET thumbnail_path = ? WHERE path = ?", (thumb_path, path))
+        cur.execute("UPDATE folder_index SET thumbnail_path = ? WHERE root_id = ? AND rel = ?", (thumb_rel, *key))
         # Also store user override so it persists even if JSON can't be written
-        cur.execute("INSERT OR REPLACE INTO preview_overrides(path, thumbnail_path) VALUES(?, ?)", (path, thumb_path))
+        cur.execute(
+            "INSERT OR REPLACE INTO preview_overrides(folder_id, thumbnail_path) SELECT id, ? FROM folder_index WHERE root_id = ? AND rel = ?",
+            (thumb_rel, *key),
+        )
         conn.commit()
         conn.close()
+        folder_snapshot.refresh([path])
+        detail_cache.invalidate(path)
+        placeholders.schedule()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur mise à jour index/override: {e}")
 
@@ -721,7 +791,8 @@ def set_folder_rating(
     meta: dict = {}
     if meta_path.exists() and meta_path.is_file():
         try:
-            with open(meta_path, "r", encoding="utf-8") as fh:
+            with tracing.span("fs", "json_read", path=meta_path), open(meta_path, "r", encoding="utf-8") as fh:
+                metrics.fs("json_read", meta_path)
                 meta = json.load(fh) or {}
         except Exception:
             meta = {}
@@ -737,16 +808,19 @@ def set_folder_rating(
     try:
         with open(meta_path, "w", encoding="utf-8") as fh:
             json.dump(meta, fh, ensure_ascii=False, indent=2)
+            metrics.fs("json_write", meta_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur écriture meta: {e}")
     # Update index
     try:
         conn = get_connection()
         cur = conn.cursor()
-        cur.execute("UPDATE folder_index SET rating = ? WHERE path = ?", (int(rating), path))
+        cur.execute("UPDATE folder_index SET rating = ? WHERE root_id = ? AND rel = ?", (int(rating), *folder_store.key(cur, path)))
         # keep tag_catalog untouched here
         conn.commit()
         conn.close()
+        folder_snapshot.refresh([path])
+        detail_cache.invalidate(path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur mise à jour index: {e}")
     return {"ok": True, "rating": int(rating)}
@@ -776,36 +850,16 @@ def rename_folder(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur renommage FS: {e}")
 
-    # Mettre à jour l'index (path, rel, name) et les chemins éventuels de miniature
-    root = os.getenv("COLLECTION_ROOT") or "/"
-    root_path = Path(root).resolve()
-    try:
-        new_rel = str(Path(new_path).resolve().relative_to(root_path))
-    except Exception:
-        new_rel = new_name
+    # Propager le renommage dans l'index (folder_index, overrides, dir_summary, projects) et les caches
     try:
         conn = get_connection()
         cur = conn.cursor()
-        # Mettre à jour l'entrée principale
-        cur.execute(
-            "UPDATE folder_index SET path = ?, rel = ?, name = ? WHERE path = ?",
-            (str(new_path), new_rel, new_name, str(folder_path)),
-        )
-        # Mettre à jour les éventuelles miniatures qui stockeraient un chemin absolu
-        try:
-            cur.execute(
-                "UPDATE folder_index SET thumbnail_path = REPLACE(COALESCE(thumbnail_path,''), ?, ?) WHERE thumbnail_path LIKE ?",
-                (str(folder_path) + os.sep, str(new_path) + os.sep, f"{str(folder_path)}%"),
-            )
-        except Exception:
-            pass
-        # Mettre à jour les overrides
-        try:
-            cur.execute("UPDATE preview_overrides SET path = ? WHERE path = ?", (str(new_path), str(folder_path)))
-        except Exception:
-            pass
+        new_rel = folder_store.key(cur, new_path)[1] or new_name
+        # Une mise à jour par table, sur la clé / la plage d'index du dossier (pas de LIKE ni REPLACE)
+        relocate.move_folder(cur, str(folder_path), str(new_path))
         conn.commit()
         conn.close()
+        relocate.notify(str(folder_path), str(new_path))
     except HTTPException:
         raise
     except Exception as e:
@@ -820,80 +874,10 @@ def _split_tags_csv(s: str | None) -> list[str]:
     return [t.strip() for t in s.split(',') if t and t.strip()]
 
 
-def _normalize_tags(raw) -> list[str]:
-    def uniq_preserve(seq):
-        seen = set()
-        out = []
-        for x in seq:
-            if x not in seen:
-                seen.add(x)
-                out.append(x)
-        return out
-
-    def try_parse_json_list(s: str):
-        try:
-            v = json.loads(s)
-            if isinstance(v, list):
-                return [str(t).strip() for t in v if str(t).strip()]
-            return None
-        except Exception:
-            return None
-
-    def strip_wrapping_quotes(s: str) -> str:
-        pairs = [("\"", "\""), ("'", "'"), ("“", "”"), ("‘", "’")]
-        changed = True
-        while changed and len(s) >= 2:
-            changed = False
-            for a, b in pairs:
-                if s.startswith(a) and s.endswith(b):
-                    s = s[len(a):-len(b)].strip()
-                    changed = True
-        # Handle escaped quotes at both ends like \"foo\"
-        if len(s) >= 4 and s.startswith('\\"') and s.endswith('\\"'):
-            s = s[2:-2].strip()
-        return s
-
-    if isinstance(raw, list):
-        joined = "".join([str(x) for x in raw])
-        if "[" in joined and "]" in joined and '\\"' in joined:
-            parsed = try_parse_json_list(joined)
-            if parsed is not None:
-                return uniq_preserve(parsed)
-        cleaned = []
-        for t in raw:
-            s = strip_wrapping_quotes(str(t).strip())
-            s = s.strip("[] ")
-            # After removing brackets, strip quotes again to catch cases like '["Tag1"'
-            s = strip_wrapping_quotes(s)
-            if s:
-                cleaned.append(s)
-        return uniq_preserve([c for c in cleaned if c])
-    if isinstance(raw, str):
-        s = raw.strip()
-        parsed = try_parse_json_list(s)
-        if parsed is not None:
-            return uniq_preserve(parsed)
-        s = s.strip("[]")
-        parts = [p.strip() for p in s.split(',')]
-        out = []
-        for p in parts:
-            p = strip_wrapping_quotes(p.strip())
-            if p:
-                out.append(p)
-        return uniq_preserve(out)
-    return []
-
-
 @router.get("/tags")
 def get_all_tags(q: str | None = Query(None, description="Filtre de préfixe/contient"), limit: int = Query(200, ge=1, le=5000)):
-    conn = get_connection()
-    cur = conn.cursor()
-    if q:
-        cur.execute("SELECT name FROM tag_catalog WHERE LOWER(name) LIKE ? ORDER BY name ASC LIMIT ?", (f"%{q.lower()}%", limit))
-    else:
-        cur.execute("SELECT name FROM tag_catalog ORDER BY name ASC LIMIT ?", (limit,))
-    tags = [r[0] for r in cur.fetchall()]
-    conn.close()
+    # In-memory index: prefix matches first, then substring, then fuzzy; each ranked by usage
+    tags = tag_suggest.suggest(q, limit)
     return {"tags": tags, "total": len(tags)}
 
 
@@ -907,31 +891,21 @@ def fix_tags_for_folder(path: str = Query(..., description="Chemin absolu du pro
         raise HTTPException(status_code=404, detail="Fichier .stl_collect.json introuvable dans le dossier")
     # Read
     try:
-        with meta_path.open("r", encoding="utf-8") as fh:
+        with tracing.span("fs", "json_read", path=meta_path), meta_path.open("r", encoding="utf-8") as fh:
+            metrics.fs("json_read", meta_path)
             meta = json.load(fh) or {}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lecture JSON échouée: {e}")
     # Normalize
-    new_tags = _normalize_tags(meta.get("tags"))
+    new_tags = sidecar.normalize_tags(meta.get("tags"))
     # If nothing changes, return
     old_repr = meta.get("tags")
     if isinstance(old_repr, list):
         old_list = [str(t).strip() for t in old_repr]
         if old_list == new_tags:
             return {"ok": True, "changed": False, "tags": new_tags}
-    # Backup
-    try:
-        bak = meta_path.with_suffix(meta_path.suffix + ".bak")
-        content = meta_path.read_text(encoding="utf-8")
-        if not bak.exists():
-            bak.write_text(content, encoding="utf-8")
-        else:
-            ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-            bak_ts = meta_path.with_suffix(meta_path.suffix + f".{ts}.bak")
-            bak_ts.write_text(content, encoding="utf-8")
-    except Exception as e:
-        # backup failure shouldn't block
-        pass
+    # Backup (failure shouldn't block)
+    sidecar.backup(meta_path)
     # Write
     meta["tags"] = new_tags
     # Ensure dates
@@ -945,6 +919,7 @@ def fix_tags_for_folder(path: str = Query(..., description="Chemin absolu du pro
     try:
         with meta_path.open("w", encoding="utf-8") as fh:
             json.dump(meta, fh, ensure_ascii=False, indent=2)
+            metrics.fs("json_write", meta_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Écriture JSON échouée: {e}")
     # Update DB
@@ -952,22 +927,73 @@ def fix_tags_for_folder(path: str = Query(..., description="Chemin absolu du pro
         conn = get_connection()
         cur = conn.cursor()
         csv_text = ",".join(new_tags) if new_tags else None
-        cur.execute("UPDATE folder_index SET tags = ? WHERE path = ?", (csv_text, path))
-        # Update tag catalog with any new tag
-        for t in new_tags:
-            try:
-                cur.execute("INSERT OR IGNORE INTO tag_catalog(name) VALUES(?)", (t,))
-            except Exception:
-                pass
+        # Also maintains tag_stats and tag_catalog
+        changed_tags = tag_index.update_folder_tags(cur, folder_store.key(cur, path), csv_text)
         conn.commit()
         conn.close()
+        folder_snapshot.refresh([path])
+        detail_cache.invalidate(path)
+        tag_suggest.refresh(changed_tags)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur mise à jour index: {e}")
     return {"ok": True, "changed": True, "tags": new_tags}
 
 
+# ------------------------
+# Collection-wide sidecar maintenance (fix-tags-all, backfill-dates-all)
+# ------------------------
+
+# Folders processed concurrently (sidecar read/rewrite and image scan are I/O bound)
+MAINT_WORKERS = max(1, int(os.getenv("MAINT_WORKERS", "8")))
+# folder_index rows written per transaction
+MAINT_DB_BATCH = 500
+
+
+def _project_dirs(root_path: Path) -> list[Path]:
+    out: list[Path] = []
+    metrics.fs("scandir", root_path)
+    for entry in os.scandir(root_path):
+        try:
+            if entry.is_dir() and not entry.name.startswith('.'):
+                out.append(Path(entry.path))
+        except OSError:
+            continue
+    return out
+
+
+def _map_bounded(fn: Callable, items: list):
+    """Yield fn(item) in completion order, with at most 2 * MAINT_WORKERS items in flight."""
+    it = iter(items)
+    pool = ThreadPoolExecutor(max_workers=MAINT_WORKERS)
+    try:
+        pending = {pool.submit(fn, x) for x in itertools.islice(it, MAINT_WORKERS * 2)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                nxt = next(it, None)
+                if nxt is not None:
+                    pending.add(pool.submit(fn, nxt))
+                yield f.result()
+    finally:
+        # Also reached when the consumer stops early (job cancelled, client gone)
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _ndjson(results, summary: Callable):
+    for r in results:
+        yield json.dumps(r, ensure_ascii=False) + "\n"
+    yield json.dumps({"summary": summary()}, ensure_ascii=False) + "\n"
+
+
 @router.post("/fix-tags-all")
-def fix_tags_all():
+def fix_tags_all(
+    background: bool = Query(False, description="Exécuter en tâche de fond (renvoie un job_id, suivi via /jobs)"),
+    dry_run: bool = Query(False, description="Ne rien écrire: diff avant/après par dossier en NDJSON (synchrone, pas avec background)"),
+):
+    if background and dry_run:
+        raise HTTPException(status_code=400, detail="dry_run renvoie un flux NDJSON: incompatible avec background")
+    if background:
+        return jobs.submit("fix-tags-all", lambda: fix_tags_all(background=False, dry_run=False))
     root = os.getenv("COLLECTION_ROOT")
     if not root:
         raise HTTPException(status_code=400, detail="COLLECTION_ROOT non défini")
@@ -975,111 +1001,140 @@ def fix_tags_all():
     if not root_path.exists() or not root_path.is_dir():
         raise HTTPException(status_code=400, detail="COLLECTION_ROOT introuvable")
 
-    checked = 0
-    fixed = 0
+    folders = _project_dirs(root_path)
+    stats = {"checked": 0, "fixed": 0, "errors": 0}
+
+    if dry_run:
+        def changed_only():
+            for res in _map_bounded(lambda f: sidecar.fix_tags(f, True), folders):
+                if res is None:
+                    continue
+                stats["checked"] += 1
+                if res.get("error"):
+                    stats["errors"] += 1
+                    yield res
+                elif res["changed"]:
+                    stats["fixed"] += 1
+                    yield res
+
+        return StreamingResponse(
+            _ndjson(changed_only(), lambda: {**stats, "folders": len(folders), "dry_run": True}),
+            media_type="application/x-ndjson",
+        )
+
     errors: list[str] = []
     updated_tags: set[str] = set()
+    pending: list[tuple[str, str | None]] = []
 
-    for entry in os.scandir(root_path):
-        if not entry.is_dir():
-            continue
-        if entry.name.startswith('.'):
-            continue
-        folder_path = Path(entry.path)
-        meta_path = folder_path / ".stl_collect.json"
-        if not meta_path.exists() or not meta_path.is_file():
-            continue
-        checked += 1
+    def flush():
+        # Keeps tag_stats/tag_catalog in step; one transaction per batch
+        if not pending:
+            return
         try:
-            with meta_path.open("r", encoding="utf-8") as fh:
-                meta = json.load(fh) or {}
+            conn = get_connection()
+            cur = conn.cursor()
+            for path, csv_text in pending:
+                tag_index.update_folder_tags(cur, folder_store.key(cur, path), csv_text)
+            conn.commit()
+            conn.close()
         except Exception as e:
-            errors.append(f"read:{meta_path}:{e}")
-            continue
+            errors.append(f"db:{pending[0][0]}..({len(pending)}):{e}")
+        pending.clear()
 
-        new_tags = _normalize_tags(meta.get("tags"))
-        old_repr = meta.get("tags")
-        need_write = True
-        if isinstance(old_repr, list):
-            if [str(t).strip() for t in old_repr] == new_tags:
-                need_write = False
-        if not new_tags and not isinstance(old_repr, str):
-            # nothing to do
-            need_write = False
-
-        if not need_write:
-            # still update DB to ensure consistency
-            try:
-                conn = get_connection()
-                cur = conn.cursor()
-                csv_text = ",".join(new_tags) if new_tags else None
-                cur.execute("UPDATE folder_index SET tags = ? WHERE path = ?", (csv_text, str(folder_path)))
-                conn.commit()
-                conn.close()
-            except Exception as e:
-                errors.append(f"db-update:{folder_path}:{e}")
+    for i, res in enumerate(_map_bounded(lambda f: sidecar.fix_tags(f, False), folders)):
+        jobs.checkpoint(done=i, total=len(folders), checked=stats["checked"], fixed=stats["fixed"], errors=len(errors))
+        if res is None:
             continue
+        stats["checked"] += 1
+        if res.get("error"):
+            errors.append(res["error"])
+            continue
+        if res["changed"]:
+            stats["fixed"] += 1
+            updated_tags.update(res["tags"])
+        # Unchanged sidecars still refresh the DB to ensure consistency
+        pending.append((res["path"], ",".join(res["tags"]) if res["tags"] else None))
+        if len(pending) >= MAINT_DB_BATCH:
+            flush()
+    flush()
+
+    folder_snapshot.invalidate()
+    detail_cache.invalidate()
+    tag_suggest.invalidate()
+    return {"ok": True, "checked": stats["checked"], "fixed": stats["fixed"], "errors": errors, "new_tags_indexed": len(updated_tags)}
+
+
+def _backfill_one(folder_path: Path, force_created: bool, dry_run: bool) -> dict | None:
+    """Fill added_at/modified_at of one sidecar. None when the folder has no sidecar."""
+    meta_path = folder_path / ".stl_collect.json"
+    if not meta_path.is_file():
+        return None
+    res: dict = {"path": str(folder_path), "changed": False}
+    try:
+        with tracing.span("fs", "json_read", path=meta_path), meta_path.open("r", encoding="utf-8") as fh:
+            metrics.fs("json_read", meta_path)
+            meta = json.load(fh) or {}
+    except Exception as e:
+        res["error"] = f"read:{meta_path}:{e}"
+        return res
 
-        # backup
-        try:
-            bak = meta_path.with_suffix(meta_path.suffix + ".bak")
-            content = meta_path.read_text(encoding="utf-8")
-            if not bak.exists():
-                bak.write_text(content, encoding="utf-8")
-            else:
-                ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-                bak_ts = meta_path.with_suffix(meta_path.suffix + f".{ts}.bak")
-                bak_ts.write_text(content, encoding="utf-8")
-        except Exception as e:
-            # backup failure tolerated
-            pass
+    before = dict(meta)
 
-        meta["tags"] = new_tags
-        # Ensure dates
+    # Compute desired created_at from earliest image/GIF, fallback to folder ctime, then now
+    desired_created: str | None = sidecar.created_at_from_images(folder_path)
+    if not desired_created:
         try:
-            if not meta.get("added_at"):
-                created = _created_at_from_images(folder_path)
-                if not created:
-                    try:
-                        created = datetime.fromtimestamp(folder_path.stat().st_ctime).isoformat()
-                    except Exception:
-                        created = None
-                meta["added_at"] = created or datetime.now().isoformat()
+            desired_created = datetime.fromtimestamp(folder_path.stat().st_ctime).isoformat()
         except Exception:
-            meta["added_at"] = datetime.now().isoformat()
+            desired_created = None
+    if not desired_created:
+        desired_created = datetime.now().isoformat()
+
+    # Set added_at
+    if force_created:
+        meta["added_at"] = desired_created
+    else:
+        if not meta.get("added_at"):
+            meta["added_at"] = desired_created
+
+    # Ensure modified_at only if missing
+    if not meta.get("modified_at"):
         meta["modified_at"] = datetime.now().isoformat()
-        try:
-            with meta_path.open("w", encoding="utf-8") as fh:
-                json.dump(meta, fh, ensure_ascii=False, indent=2)
-            fixed += 1
-        except Exception as e:
-            errors.append(f"write:{meta_path}:{e}")
-            continue
 
-        # update DB and tag catalog
-        try:
-            conn = get_connection()
-            cur = conn.cursor()
-            csv_text = ",".join(new_tags) if new_tags else None
-            cur.execute("UPDATE folder_index SET tags = ? WHERE path = ?", (csv_text, str(folder_path)))
-            for t in new_tags:
-                updated_tags.add(t)
-                try:
-                    cur.execute("INSERT OR IGNORE INTO tag_catalog(name) VALUES(?)", (t,))
-                except Exception:
-                    pass
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            errors.append(f"db:{folder_path}:{e}")
+    res["added_at"] = meta.get("added_at")
+    if not force_created and before == meta:
+        # Nothing to write and not forcing
+        return res
+    res["changed"] = True
+    if dry_run:
+        res["diff"] = sidecar.meta_diff(before, meta)
+        return res
 
-    return {"ok": True, "checked": checked, "fixed": fixed, "errors": errors, "new_tags_indexed": len(updated_tags)}
+    sidecar.backup(meta_path)
+    try:
+        with meta_path.open("w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False, indent=2)
+            metrics.fs("json_write", meta_path)
+    except Exception as e:
+        res["changed"] = False
+        res["error"] = f"write:{meta_path}:{e}"
+    return res
 
 
 @router.post("/backfill-dates-all")
 def backfill_dates_all(
-    force_created: bool = Query(False, alias="force_created", description="Forcer la mise à jour de added_at depuis la plus ancienne image/GIF")
+    force_created: bool = Query(False, alias="force_created", description="Forcer la mise à jour de added_at depuis la plus ancienne image/GIF"),
+    background: bool = Query(False, description="Exécuter en tâche de fond (renvoie un job_id, suivi via /jobs)"),
+    dry_run: bool = Query(False, description="Ne rien écrire: diff avant/après par dossier en NDJSON (synchrone, pas avec background)"),
 ):
+    if background and dry_run:
+        raise HTTPException(status_code=400, detail="dry_run renvoie un flux NDJSON: incompatible avec background")
+    if background:
+        return jobs.submit(
+            "backfill-dates-all",
+            lambda: backfill_dates_all(force_created=force_created, background=False, dry_run=False),
+            {"force_created": bool(force_created)},
+        )
     root = os.getenv("COLLECTION_ROOT")
     if not root:
         raise HTTPException(status_code=400, detail="COLLECTION_ROOT non défini")
@@ -1087,102 +1142,88 @@ def backfill_dates_all(
     if not root_path.exists() or not root_path.is_dir():
         raise HTTPException(status_code=400, detail="COLLECTION_ROOT introuvable")
 
-    checked = 0
-    updated = 0
+    folders = _project_dirs(root_path)
+    stats = {"checked": 0, "updated": 0, "errors": 0}
+
+    if dry_run:
+        def changed_only():
+            for res in _map_bounded(lambda f: _backfill_one(f, force_created, True), folders):
+                if res is None:
+                    continue
+                stats["checked"] += 1
+                if res.get("error"):
+                    stats["errors"] += 1
+                    yield res
+                elif res["changed"]:
+                    stats["updated"] += 1
+                    yield res
+
+        return StreamingResponse(
+            _ndjson(changed_only(), lambda: {**stats, "folders": len(folders), "dry_run": True}),
+            media_type="application/x-ndjson",
+        )
+
     errors: list[str] = []
+    # (created_at, path): forced values overwrite, others only fill a missing created_at
+    pending_fill: list[tuple] = []
+    pending_force: list[tuple] = []
 
-    for entry in os.scandir(root_path):
-        if not entry.is_dir() or entry.name.startswith('.'):
-            continue
-        folder_path = Path(entry.path)
-        meta_path = folder_path / ".stl_collect.json"
-        if not meta_path.exists() or not meta_path.is_file():
-            continue
-        checked += 1
+    def flush():
+        if not pending_fill and not pending_force:
+            return
         try:
-            with meta_path.open("r", encoding="utf-8") as fh:
-                meta = json.load(fh) or {}
+            conn = get_connection()
+            cur = conn.cursor()
+            if pending_fill:
+                cur.executemany(
+                    "UPDATE folder_index SET created_at = COALESCE(created_at, ?) WHERE root_id = ? AND rel = ?",
+                    [(c, *folder_store.key(cur, p)) for c, p in pending_fill],
+                )
+            if pending_force:
+                cur.executemany(
+                    "UPDATE folder_index SET created_at = ? WHERE root_id = ? AND rel = ?",
+                    [(c, *folder_store.key(cur, p)) for c, p in pending_force],
+                )
+            conn.commit()
+            conn.close()
         except Exception as e:
-            errors.append(f"read:{meta_path}:{e}")
-            continue
-
-        before = json.dumps(meta, sort_keys=True, ensure_ascii=False)
+            errors.append(f"db:{e}")
+        pending_fill.clear()
+        pending_force.clear()
 
-        # Compute desired created_at from earliest image/GIF, fallback to folder ctime, then now
-        desired_created: str | None = _created_at_from_images(folder_path)
-        if not desired_created:
-            try:
-                desired_created = datetime.fromtimestamp(folder_path.stat().st_ctime).isoformat()
-            except Exception:
-                desired_created = None
-        if not desired_created:
-            desired_created = datetime.now().isoformat()
-
-        # Set added_at
-        if force_created:
-            meta["added_at"] = desired_created
-        else:
-            if not meta.get("added_at"):
-                meta["added_at"] = desired_created
-
-        # Ensure modified_at only if missing
-        if not meta.get("modified_at"):
-            meta["modified_at"] = datetime.now().isoformat()
-
-        after = json.dumps(meta, sort_keys=True, ensure_ascii=False)
-        if not force_created and before == after:
-            # Nothing to write and not forcing
-            # But still ensure DB has created_at if missing
-            try:
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute("UPDATE folder_index SET created_at = COALESCE(created_at, ?) WHERE path = ?", (meta.get("added_at"), str(folder_path)))
-                conn.commit()
-                conn.close()
-            except Exception:
-                pass
+    for i, res in enumerate(_map_bounded(lambda f: _backfill_one(f, force_created, False), folders)):
+        jobs.checkpoint(done=i, total=len(folders), checked=stats["checked"], updated=stats["updated"], errors=len(errors))
+        if res is None:
             continue
-
-        # backup
-        try:
-            bak = meta_path.with_suffix(meta_path.suffix + ".bak")
-            content = meta_path.read_text(encoding="utf-8")
-            if not bak.exists():
-                bak.write_text(content, encoding="utf-8")
-            else:
-                ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-                bak_ts = meta_path.with_suffix(meta_path.suffix + f".{ts}.bak")
-                bak_ts.write_text(content, encoding="utf-8")
-        except Exception:
-            pass
-
-        try:
-            with meta_path.open("w", encoding="utf-8") as fh:
-                json.dump(meta, fh, ensure_ascii=False, indent=2)
-            updated += 1
-        except Exception as e:
-            errors.append(f"write:{meta_path}:{e}")
+        stats["checked"] += 1
+        if res.get("error"):
+            errors.append(res["error"])
             continue
+        if res["changed"]:
+            stats["updated"] += 1
+        if res["changed"] and force_created:
+            pending_force.append((res["added_at"], res["path"]))
+        else:
+            pending_fill.append((res["added_at"], res["path"]))
+        if len(pending_fill) + len(pending_force) >= MAINT_DB_BATCH:
+            flush()
+    flush()
 
-    return {"ok": True, "checked": checked, "updated": updated, "errors": errors}
+    folder_snapshot.invalidate()
+    detail_cache.invalidate()
+    return {"ok": True, "checked": stats["checked"], "updated": stats["updated"], "errors": errors}
 
+# tag_catalog and tag_stats are maintained by every tag write (see tag_index);
+# these endpoints rebuild / check them against folder_index with set-based SQL.
 @router.post("/tags/reindex")
+@router.post("/tags/reindex-full")
 def tags_reindex_full():
     conn = get_connection()
     cur = conn.cursor()
-    # Clear catalog
-    cur.execute("DELETE FROM tag_catalog")
-    # Gather all tags from folder_index
-    cur.execute("SELECT tags FROM folder_index WHERE tags IS NOT NULL AND tags != ''")
-    seen: set[str] = set()
-    for (csv_text,) in cur.fetchall():
-        for t in _split_tags_csv(csv_text):
-            if t not in seen:
-                seen.add(t)
-    cur.executemany("INSERT OR IGNORE INTO tag_catalog(name) VALUES(?)", [(t,) for t in seen])
+    total = tag_index.rebuild(cur)
     conn.commit()
-    total = len(seen)
     conn.close()
+    tag_suggest.invalidate()
     return {"indexed": total}
 
 
@@ -1190,24 +1231,12 @@ def tags_reindex_full():
 def tags_reindex_incremental():
     conn = get_connection()
     cur = conn.cursor()
-    # Load existing names
-    cur.execute("SELECT name FROM tag_catalog")
-    existing = {row[0] for row in cur.fetchall()}
-    # Scan folder_index and insert missing
-    cur.execute("SELECT tags FROM folder_index WHERE tags IS NOT NULL AND tags != ''")
-    added = 0
-    for (csv_text,) in cur.fetchall():
-        for t in _split_tags_csv(csv_text):
-            if t not in existing:
-                try:
-                    cur.execute("INSERT OR IGNORE INTO tag_catalog(name) VALUES(?)", (t,))
-                    added += 1
-                    existing.add(t)
-                except Exception:
-                    pass
+    stats = tag_index.check(cur)
     conn.commit()
     conn.close()
-    return {"added": added, "total": len(existing)}
+    if stats["added"] or stats["removed"] or stats["repaired"]:
+        tag_suggest.invalidate()
+    return stats
 
 
 @router.post("/tags/add")
@@ -1225,7 +1254,8 @@ def add_tag_to_folder(
     meta: dict = {}
     if meta_path.exists() and meta_path.is_file():
         try:
-            with open(meta_path, "r", encoding="utf-8") as fh:
+            with tracing.span("fs", "json_read", path=meta_path), open(meta_path, "r", encoding="utf-8") as fh:
+                metrics.fs("json_read", meta_path)
                 meta = json.load(fh) or {}
         except Exception:
             meta = {}
@@ -1249,6 +1279,7 @@ def add_tag_to_folder(
     try:
         with open(meta_path, "w", encoding="utf-8") as fh:
             json.dump(meta, fh, ensure_ascii=False, indent=2)
+            metrics.fs("json_write", meta_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur écriture meta: {e}")
     # Update DB
@@ -1256,11 +1287,13 @@ def add_tag_to_folder(
         conn = get_connection()
         cur = conn.cursor()
         csv_text = ",".join(current) if current else None
-        cur.execute("UPDATE folder_index SET tags = ? WHERE path = ?", (csv_text, path))
-        # Update tag catalog
-        cur.execute("INSERT OR IGNORE INTO tag_catalog(name) VALUES(?)", (tag,))
+        # Also maintains tag_stats and tag_catalog
+        changed_tags = tag_index.update_folder_tags(cur, folder_store.key(cur, path), csv_text)
         conn.commit()
         conn.close()
+        folder_snapshot.refresh([path])
+        detail_cache.invalidate(path)
+        tag_suggest.refresh(changed_tags)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur mise à jour index: {e}")
     return {"ok": True, "tags": current}
@@ -1281,7 +1314,8 @@ def remove_tag_from_folder(
     meta: dict = {}
     if meta_path.exists() and meta_path.is_file():
         try:
-            with open(meta_path, "r", encoding="utf-8") as fh:
+            with tracing.span("fs", "json_read", path=meta_path), open(meta_path, "r", encoding="utf-8") as fh:
+                metrics.fs("json_read", meta_path)
                 meta = json.load(fh) or {}
         except Exception:
             meta = {}
@@ -1304,6 +1338,7 @@ def remove_tag_from_folder(
     try:
         with open(meta_path, "w", encoding="utf-8") as fh:
             json.dump(meta, fh, ensure_ascii=False, indent=2)
+            metrics.fs("json_write", meta_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur écriture meta: {e}")
     # Update DB
@@ -1311,30 +1346,40 @@ def remove_tag_from_folder(
         conn = get_connection()
         cur = conn.cursor()
         csv_text = ",".join(new_tags) if new_tags else None
-        cur.execute("UPDATE folder_index SET tags = ? WHERE path = ?", (csv_text, path))
+        changed_tags = tag_index.update_folder_tags(cur, folder_store.key(cur, path), csv_text)
         conn.commit()
         conn.close()
+        folder_snapshot.refresh([path])
+        detail_cache.invalidate(path)
+        tag_suggest.refresh(changed_tags)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur mise à jour index: {e}")
     return {"ok": True, "tags": new_tags}
 
 
 @router.get("/detail")
-def get_folder_detail(path: str = Query(..., description="Chemin absolu d'un projet (depuis folder_index)")):
+def get_folder_detail(
+    path: str = Query(..., description="Chemin absolu d'un projet (depuis folder_index)"),
+    media_type: str | None = Query(None, description="Ne lister qu'un type de média: images|gifs|videos|archives|stls|others"),
+    offset: int = Query(0, ge=0, description="Début de la page de médias (par type)"),
+    limit: int | None = Query(None, ge=1, le=5000, description="Taille de la page de médias (par type); absent = tout"),
+):
+    if media_type is not None and media_type not in dir_listing.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="media_type invalide")
+    # Payload en cache tant que l'empreinte (mtime dossier + sidecar) n'a pas bougé
+    cache_key = (path, media_type, offset, limit)
+    fp = detail_cache.fingerprint(path)
+    cached = detail_cache.get(cache_key, fp)
+    if cached is not None:
+        # Tailles d'archives relues: une archive réécrite sur place ne change pas l'empreinte
+        archives = cached["media"].get("archives")
+        if archives:
+            cached = {**cached, "media_sizes": {"archives": dir_listing.archive_sizes(path, archives)}}
+        return fastjson.response(cached)
     # Sécurité: le chemin doit exister dans l'index pour être autorisé
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT fi.name, fi.path, fi.rel, fi.mtime, fi.images, fi.gifs, fi.videos, fi.archives, fi.stls,
-               fi.tags, fi.rating, fi.created_at, fi.modified_at, fi.printed, fi.to_print,
-               COALESCE(po.thumbnail_path, fi.thumbnail_path) AS thumbnail_path
-        FROM folder_index fi
-        LEFT JOIN preview_overrides po ON po.path = fi.path
-        WHERE fi.path = ?
-        """,
-        (path,),
-    )
+    cur.execute(folder_store.SELECT_SQL + " WHERE fi.root_id = ? AND fi.rel = ?", folder_store.key(cur, path))
     row = cur.fetchone()
     conn.close()
     if not row:
@@ -1349,68 +1394,58 @@ def get_folder_detail(path: str = Query(..., description="Chemin absolu d'un pro
         "stls": base.pop("stls"),
     }
 
-    # Scan du dossier cible uniquement pour lister les médias
+    # Listing du dossier cible uniquement (mis en cache sur son mtime), paginé par type
     folder_path = Path(path)
-    if not folder_path.exists() or not folder_path.is_dir():
+    try:
+        listing = dir_listing.get(str(folder_path))
+    except OSError:
         raise HTTPException(status_code=404, detail="Chemin du projet invalide")
 
-    images: list[str] = []
-    gifs: list[str] = []
-    videos: list[str] = []
-    archives: list[str] = []
-    archive_sizes: dict[str, int] = {}
-    stls: list[str] = []
-    others: list[str] = []
-    ignore_names = {"Thumbs.db", "desktop.ini"}
-    try:
-        for e in os.scandir(folder_path):
-            if not e.is_file():
-                continue
-            name = e.name
-            if name.startswith('.') or name in ignore_names:
-                continue
-            ext = Path(name).suffix.lower()
-            rel = name  # nom de fichier relatif au dossier
-            if ext in IMAGE_EXT:
-                images.append(rel)
-            elif ext in GIF_EXT:
-                gifs.append(rel)
-            elif ext in VIDEO_EXT:
-                videos.append(rel)
-            elif ext in ARCHIVE_EXT:
-                archives.append(rel)
-                try:
-                    archive_sizes[rel] = int(e.stat().st_size)
-                except Exception:
-                    pass
-            elif ext == ".stl":
-                stls.append(rel)
-            else:
-                others.append(rel)
-    except PermissionError:
-        pass
+    types = (media_type,) if media_type else dir_listing.MEDIA_TYPES
+    stop = offset + limit if limit is not None else None
+    media = {t: listing.media[t][offset:stop] for t in types}
+    archive_sizes = dir_listing.archive_sizes(str(folder_path), media.get("archives") or [])
+    # Dimensions / orientation / frames des images et GIF de la page (lues dans les en-têtes, en cache)
+    dims = image_meta.lookup(str(folder_path), (media.get("images") or []) + (media.get("gifs") or []))
 
     # Héro: miniature si dispo, sinon première image
     hero = base.get("thumbnail_path")
-    if not hero and images:
-        hero = str(folder_path / images[0])
+    if not hero and listing.media["images"]:
+        hero = str(folder_path / listing.media["images"][0])
 
-    return {
+    payload = {
         **base,
         "counts": counts,
-        "media": {
-            "images": images,
-            "gifs": gifs,
-            "videos": videos,
-            "archives": archives,
-            "stls": stls,
-            "others": others,
-        },
+        "media": media,
         "media_sizes": {
             "archives": archive_sizes,
         },
+        "media_dims": {
+            t: {n: dims[n] for n in media[t] if n in dims}
+            for t in ("images", "gifs") if t in media
+        },
         "hero": hero,
     }
+    if media_type is not None or limit is not None or offset:
+        # Totaux par type (dossier lui-même, non récursif) pour paginer la suite
+        payload["media_total"] = listing.totals()
+        payload["page"] = {"media_type": media_type, "offset": offset, "limit": limit}
+    detail_cache.put(cache_key, fp, payload)
+    return fastjson.response(payload)
+
+
+@router.get("/detail/cache")
+def get_detail_cache_stats():
+    """Statistiques du cache des payloads de détail (hits/misses, taille)."""
+    return detail_cache.stats()
+
+
+@router.post("/placeholders")
+def build_placeholders():
+    """(Re)lance en tâche de fond le calcul des aperçus basse définition manquants (nécessite Pillow)."""
+    if not placeholders.ENABLED:
+        raise HTTPException(status_code=400, detail="Aperçus désactivés (Pillow absent ou PLACEHOLDERS=0)")
+    return placeholders.schedule()
 
 
 @router.post("/set-printed")
@@ -1426,7 +1461,8 @@ def set_folder_printed(
     meta: dict = {}
     if meta_path.exists() and meta_path.is_file():
         try:
-            with open(meta_path, "r", encoding="utf-8") as fh:
+            with tracing.span("fs", "json_read", path=meta_path), open(meta_path, "r", encoding="utf-8") as fh:
+                metrics.fs("json_read", meta_path)
                 meta = json.load(fh) or {}
         except Exception:
             meta = {}
@@ -1442,15 +1478,18 @@ def set_folder_printed(
     try:
         with open(meta_path, "w", encoding="utf-8") as fh:
             json.dump(meta, fh, ensure_ascii=False, indent=2)
+            metrics.fs("json_write", meta_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur écriture meta: {e}")
     # Update index
     try:
         conn = get_connection()
         cur = conn.cursor()
-        cur.execute("UPDATE folder_index SET printed = ? WHERE path = ?", (1 if printed else 0, path))
+        cur.execute("UPDATE folder_index SET printed = ? WHERE root_id = ? AND rel = ?", (1 if printed else 0, *folder_store.key(cur, path)))
         conn.commit()
         conn.close()
+        folder_snapshot.refresh([path])
+        detail_cache.invalidate(path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur mise à jour index: {e}")
     return {"ok": True, "printed": bool(printed)}
@@ -1469,7 +1508,8 @@ def set_folder_to_print(
     meta: dict = {}
     if meta_path.exists() and meta_path.is_file():
         try:
-            with open(meta_path, "r", encoding="utf-8") as fh:
+            with tracing.span("fs", "json_read", path=meta_path), open(meta_path, "r", encoding="utf-8") as fh:
+                metrics.fs("json_read", meta_path)
                 meta = json.load(fh) or {}
         except Exception:
             meta = {}
@@ -1485,15 +1525,18 @@ def set_folder_to_print(
     try:
         with open(meta_path, "w", encoding="utf-8") as fh:
             json.dump(meta, fh, ensure_ascii=False, indent=2)
+            metrics.fs("json_write", meta_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur écriture meta: {e}")
     # Update index
     try:
         conn = get_connection()
         cur = conn.cursor()
-        cur.execute("UPDATE folder_index SET to_print = ? WHERE path = ?", (1 if to_print else 0, path))
+        cur.execute("UPDATE folder_index SET to_print = ? WHERE root_id = ? AND rel = ?", (1 if to_print else 0, *folder_store.key(cur, path)))
         conn.commit()
         conn.close()
+        folder_snapshot.refresh([path])
+        detail_cache.invalidate(path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur mise à jour index: {e}")
     return {"ok": True, "to_print": bool(to_print)}
@@ -1510,10 +1553,11 @@ def delete_file(file: str = Query(..., description="Chemin absolu du fichier à
         raise HTTPException(status_code=400, detail="COLLECTION_ROOT non défini")
     root_path = Path(root).resolve()
 
-    target = Path(file).resolve()
+    # Chemin tel que l'index le connaît (sous la racine normalisée, liens non résolus)
+    target = Path(os.path.normpath(file))
     # Sécurité: limiter aux fichiers sous la racine collection
     try:
-        target.relative_to(root_path)
+        target.resolve().relative_to(root_path)
     except Exception:
         raise HTTPException(status_code=403, detail="Accès refusé")
 
@@ -1521,6 +1565,9 @@ def delete_file(file: str = Query(..., description="Chemin absolu du fichier à
         raise HTTPException(status_code=404, detail="Fichier introuvable")
 
     folder_path = target.parent
+    # Vérifié avant de supprimer: le dossier doit avoir une clé d'index (root_id, rel)
+    if folder_store.rel_to(folder_store.norm_root(root), str(folder_path)) is None:
+        raise HTTPException(status_code=400, detail="Le fichier n'est pas dans un dossier de la collection")
     # Supprimer le fichier
     try:
         target.unlink()
@@ -1528,48 +1575,45 @@ def delete_file(file: str = Query(..., description="Chemin absolu du fichier à
         raise HTTPException(status_code=500, detail=f"Erreur suppression fichier: {e}")
 
     # Mettre à jour l'index pour le dossier parent
+    conn = None
     try:
         rec = _build_folder_record(folder_path)
         conn = get_connection()
         cur = conn.cursor()
+        key = folder_store.key(cur, rec["path"])
+        old_tags = tag_index.tags_of(cur, key)
+        folder_store.upsert(cur, rec)
+        changed_tags = tag_index.apply_change(cur, old_tags, rec["tags"])
+        # Si une preview_override pointait sur ce fichier supprimé, l'effacer
         cur.execute(
-            """
-            INSERT INTO folder_index(path, name, rel, mtime, images, gifs, videos, archives, stls, tags, rating, thumbnail_path)
-            VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
-            ON CONFLICT(path) DO UPDATE SET
-              name=excluded.name,
-              rel=excluded.rel,
-              mtime=excluded.mtime,
-              images=excluded.images,
-              gifs=excluded.gifs,
-              videos=excluded.videos,
-              archives=excluded.archives,
-              stls=excluded.stls,
-              tags=excluded.tags,
-              rating=COALESCE(folder_index.rating, excluded.rating),
-              thumbnail_path=excluded.thumbnail_path
-            """,
-            (
-                rec["path"], rec["name"], rec["rel"], rec["mtime"], rec["images"], rec["gifs"], rec["videos"], rec["archives"], rec["stls"], rec["tags"], rec["rating"], rec["thumbnail_path"],
-            ),
+            "DELETE FROM preview_overrides WHERE folder_id = (SELECT id FROM folder_index WHERE root_id = ? AND rel = ?) AND thumbnail_path = ?",
+            (*key, folder_store.rel_thumb(str(folder_path), str(target))),
         )
-        # Si une preview_override pointait sur ce fichier supprimé, l'effacer
-        cur.execute("DELETE FROM preview_overrides WHERE path = ? AND thumbnail_path = ?", (str(folder_path), str(target)))
+        image_meta.forget(conn, str(folder_path), target.name)
         conn.commit()
-        conn.close()
+        folder_snapshot.refresh([str(folder_path)])
+        detail_cache.invalidate(str(folder_path))
+        tag_suggest.refresh(changed_tags)
+        posters.schedule()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur mise à jour index: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
 
     # Recalculer hero (miniature effective): override si existe, sinon folder_index.thumbnail_path, sinon première image
     hero = rec.get("thumbnail_path")
     try:
         conn = get_connection()
         cur = conn.cursor()
-        cur.execute("SELECT thumbnail_path FROM preview_overrides WHERE path = ?", (str(folder_path),))
+        cur.execute(
+            "SELECT po.thumbnail_path FROM preview_overrides po JOIN folder_index fi ON fi.id = po.folder_id WHERE fi.root_id = ? AND fi.rel = ?",
+            folder_store.key(cur, folder_path),
+        )
         row = cur.fetchone()
         conn.close()
         if row and row[0]:
-            hero = row[0]
+            hero = str(folder_path / row[0])
     except Exception:
         pass
 
@@ -1618,10 +1662,18 @@ def delete_project(path: str = Query(..., description="Chemin absolu du projet (
     try:
         conn = get_connection()
         cur = conn.cursor()
-        cur.execute("DELETE FROM folder_index WHERE path = ?", (str(target),))
-        cur.execute("DELETE FROM preview_overrides WHERE path = ?", (str(target),))
+        key = folder_store.key(cur, path)
+        changed_tags = tag_index.apply_change(cur, tag_index.tags_of(cur, key), None)
+        cur.execute("DELETE FROM preview_overrides WHERE folder_id = (SELECT id FROM folder_index WHERE root_id = ? AND rel = ?)", key)
+        cur.execute("DELETE FROM folder_index WHERE root_id = ? AND rel = ?", key)
+        media_index.forget(conn, target)
+        image_meta.forget(conn, str(target))
         conn.commit()
         conn.close()
+        folder_snapshot.refresh([str(target), path])
+        detail_cache.invalidate(str(target))
+        detail_cache.invalidate(path)
+        tag_suggest.refresh(changed_tags)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur nettoyage index: {e}")
 
@@ -1629,10 +1681,15 @@ def delete_project(path: str = Query(..., description="Chemin absolu du projet (
 
 
 @router.post("/reset-collection")
-def reset_collection():
+def reset_collection(
+    background: bool = Query(False, description="Exécuter en tâche de fond (renvoie un job_id, suivi via /jobs)"),
+):
     """Vide l'index local (cache.db) pour la collection actuelle puis relance un réindex complet.
-    Utile après changement de COLLECTION_ROOT (montage différent).
+    Utile pour changer de collection: la même collection remontée ailleurs (nouveau COLLECTION_ROOT)
+    est reconnue au démarrage et garde son index (seule la racine change, voir relocate.attach_root).
     """
+    if background:
+        return jobs.submit("reset-collection", lambda: reset_collection(background=False))
     # Purge DB tables liées à l'index dossiers et overrides
     try:
         conn = get_connection()
@@ -1650,14 +1707,21 @@ def reset_collection():
             cur.execute("DELETE FROM tag_catalog")
         except Exception:
             pass
+        try:
+            cur.execute("DELETE FROM tag_stats")
+        except Exception:
+            pass
         conn.commit()
         conn.close()
+        folder_snapshot.invalidate()
+        detail_cache.invalidate()
+        tag_suggest.invalidate()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur purge index: {e}")
 
     # Réindexer entièrement la nouvelle collection
     try:
-        stats = reindex_folders()
+        stats = reindex_folders(background=False)
         # Ajouter un indicateur pour différencier l'opération
         if isinstance(stats, dict):
             stats["reset"] = True
@@ -1672,175 +1736,121 @@ def reset_collection():
 # Duplicates (REST + SSE)
 # ------------------------
 
-def _rows_with_tags():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT path, name, thumbnail_path, tags FROM folder_index")
-    rows = [dict(path=r[0], name=r[1], thumb=r[2], tags=_split_tags_csv(r[3])) for r in cur.fetchall()]
-    conn.close()
-    return rows
-
-def _compute_duplicates(min_shared: int, limit: int, excluded_tags: list[str] = None, report_progress: Optional[Callable] = None):
-    rows = _rows_with_tags()
-    # Normalize excluded tags
-    excluded_set = set((t or "").strip().lower() for t in (excluded_tags or []) if (t or "").strip())
-    # Build tag -> list of indices
-    tag_map: dict[str, list[int]] = {}
-    for idx, r in enumerate(rows):
-        for t in (r.get("tags") or []):
-            tv = (t or "").strip().lower()
-            if not tv or tv in excluded_set:
-                continue
-            tag_map.setdefault(tv, []).append(idx)
-    pair_counts: dict[tuple[int, int], int] = {}
-    pair_shared: dict[tuple[int, int], set[str]] = {}
-    tags_list = list(tag_map.items())
-    total_tags = max(1, len(tags_list))
-    for i, (tag, lst) in enumerate(tags_list):
-        lst = list(set(lst))
-        n = len(lst)
-        for a in range(n):
-            ia = lst[a]
-            for b in range(a + 1, n):
-                ib = lst[b]
-                k = (ia, ib) if ia < ib else (ib, ia)
-                pair_counts[k] = pair_counts.get(k, 0) + 1
-                s = pair_shared.get(k)
-                if s is None:
-                    s = set()
-                    pair_shared[k] = s
-                s.add(tag)
-        if report_progress and (i % 10 == 0 or i == total_tags - 1):
-            pct = int((i + 1) * 100 / total_tags)
-            try:
-                report_progress(pct, phase="counting")
-            except Exception:
-                pass
-    # Build pairs
-    pairs = []
-    for (ia, ib), cnt in pair_counts.items():
-        if cnt >= max(1, int(min_shared)):
-            a = rows[ia]
-            b = rows[ib]
-            shared = sorted(list(pair_shared.get((ia, ib)) or pair_shared.get((ib, ia)) or []))
-            pairs.append({
-                "a_path": a.get("path"),
-                "a_name": a.get("name"),
-                "a_thumb": a.get("thumb"),
-                "b_path": b.get("path"),
-                "b_name": b.get("name"),
-                "b_thumb": b.get("thumb"),
-                "score": int(cnt),
-                "shared": shared,
-            })
-    pairs.sort(key=lambda x: (-int(x.get("score") or 0), str(x.get("a_name") or ""), str(x.get("b_name") or "")))
-    total = len(pairs)
-    return pairs[: max(1, int(limit))], total
-
-
 @router.get("/tags-counts")
 def get_tags_counts(
     q: str | None = Query(None, description="Filtre de préfixe/contient"),
     limit: int = Query(2000, ge=1, le=20000, description="Nombre maximum de tags renvoyés"),
+    match: str = Query("contains", pattern="^(contains|prefix)$", description="contains: sous-chaîne, prefix: début du tag"),
 ):
+    # Served from tag_stats (maintained on every tag write), see tag_index
     try:
-        rows = _rows_with_tags()
-        counts: dict[str, int] = {}
-        for r in rows:
-            for t in (r.get("tags") or []):
-                tv = (t or "").strip()
-                if not tv:
-                    continue
-                counts[tv] = counts.get(tv, 0) + 1
-        # Filter and sort
-        items = list(counts.items())
+        conn = get_connection()
+        cur = conn.cursor()
+        where = ""
+        params: list = []
         if q and (q := q.strip().lower()):
-            items = [(name, cnt) for (name, cnt) in items if q in name.lower()]
-        # Sort by count desc then name asc
-        items.sort(key=lambda x: (-int(x[1] or 0), str(x[0]).lower()))
-        total = len(items)
-        items = items[: max(1, int(limit))]
-        return {"tags": [{"name": name, "count": int(cnt)} for name, cnt in items], "total": total}
+            if match == "prefix":
+                # Range on idx_tag_stats_lower
+                where = " WHERE lower_tag >= ? AND lower_tag < ?"
+                params = [q, q[:-1] + chr(ord(q[-1]) + 1)]
+            else:
+                where = " WHERE instr(lower_tag, ?) > 0"
+                params = [q]
+        cur.execute(f"SELECT COUNT(*) FROM tag_stats{where}", params)
+        total = int(cur.fetchone()[0])
+        cur.execute(
+            f"SELECT tag, count FROM tag_stats{where} ORDER BY count DESC, lower_tag ASC LIMIT ?",
+            params + [max(1, int(limit))],
+        )
+        items = [{"name": r[0], "count": int(r[1])} for r in cur.fetchall()]
+        conn.close()
+        return fastjson.response({"tags": items, "total": total})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur liste des tags: {e}")
 
 
+def _excluded(excluded_tags: str) -> list[str]:
+    return [t.strip() for t in excluded_tags.split(",") if t.strip()] if excluded_tags else []
+
+
+# Both duplicate endpoints run the engine (app/duplicates.py) in a worker thread
+# and stop it when the client disconnects (the engine checks `cancel` in its loops)
+
+
 @router.get("/duplicates")
-def get_duplicates(
+async def get_duplicates(
+    request: Request,
     min_shared: int = Query(3, ge=1, le=20, description="Nombre minimal de tags partagés"),
     limit: int = Query(200, ge=1, le=1000, description="Nombre maximum de paires renvoyées"),
     excluded_tags: str = Query("", description="Tags à exclure (séparés par des virgules)"),
 ):
+    cancel = threading.Event()
+    fut = asyncio.get_running_loop().run_in_executor(
+        None, duplicates.compute, min_shared, limit, _excluded(excluded_tags), cancel
+    )
     try:
-        excluded_list = [t.strip() for t in excluded_tags.split(",") if t.strip()] if excluded_tags else []
-        pairs, total = _compute_duplicates(min_shared=min_shared, limit=limit, excluded_tags=excluded_list)
-        return {"pairs": pairs, "total": total}
+        while not fut.done():
+            await asyncio.wait({fut}, timeout=0.25)
+            if not fut.done() and await request.is_disconnected():
+                cancel.set()
+        pairs, total = await fut
+    except duplicates.Cancelled:
+        # 499: client closed the request (nginx convention), for the logs and metrics
+        return Response(status_code=499)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur calcul doublons: {e}")
+    return fastjson.response({"pairs": pairs, "total": total})
 
 
 @router.get("/duplicates/stream")
-def stream_duplicates(
+async def stream_duplicates(
     min_shared: int = Query(3, ge=1, le=20),
     limit: int = Query(200, ge=1, le=1000),
     excluded_tags: str = Query("", description="Tags à exclure (séparés par des virgules)"),
 ):
-    def event_gen():
-        # progress events during counting
-        def _report(pct: int, phase: str = ""):
-            msg = {"progress_pct": int(pct), "phase": phase or "counting"}
-            yield f"event: progress\n" + f"data: {json.dumps(msg, ensure_ascii=False)}\n\n"
-        # First small debug
-        yield "event: debug\n" + f"data: {json.dumps({'note':'start'}, ensure_ascii=False)}\n\n"
-        # Compute
-        excluded_list = [t.strip() for t in excluded_tags.split(",") if t.strip()] if excluded_tags else []
-        excluded_set = set((t or "").strip().lower() for t in excluded_list if (t or "").strip())
-        rows = _rows_with_tags()
-        tag_map: dict[str, list[int]] = {}
-        for idx, r in enumerate(rows):
-            for t in (r.get("tags") or []):
-                tv = (t or "").strip().lower()
-                if not tv or tv in excluded_set:
-                    continue
-                tag_map.setdefault(tv, []).append(idx)
-        pair_counts: dict[tuple[int, int], int] = {}
-        pair_shared: dict[tuple[int, int], set[str]] = {}
-        tags_list = list(tag_map.items())
-        total_tags = max(1, len(tags_list))
-        for i, (tag, lst) in enumerate(tags_list):
-            lst = list(set(lst))
-            n = len(lst)
-            for a in range(n):
-                ia = lst[a]
-                for b in range(a + 1, n):
-                    ib = lst[b]
-                    k = (ia, ib) if ia < ib else (ib, ia)
-                    pair_counts[k] = pair_counts.get(k, 0) + 1
-                    s = pair_shared.get(k)
-                    if s is None:
-                        s = set()
-                        pair_shared[k] = s
-                    s.add(tag)
-            if i % 10 == 0 or i == total_tags - 1:
-                yield from _report(int((i + 1) * 100 / total_tags), phase="counting")
-        pairs_list = []
-        for (ia, ib), cnt in pair_counts.items():
-            if cnt >= max(1, int(min_shared)):
-                a = rows[ia]
-                b = rows[ib]
-                shared = sorted(list(pair_shared.get((ia, ib)) or pair_shared.get((ib, ia)) or []))
-                pairs_list.append({
-                    "a_path": a.get("path"),
-                    "a_name": a.get("name"),
-                    "a_thumb": a.get("thumb"),
-                    "b_path": b.get("path"),
-                    "b_name": b.get("name"),
-                    "b_thumb": b.get("thumb"),
-                    "score": int(cnt),
-                    "shared": shared,
-                })
-        pairs_list.sort(key=lambda x: (-int(x.get("score") or 0), str(x.get("a_name") or ""), str(x.get("b_name") or "")))
-        total = len(pairs_list)
-        pairs = pairs_list[: max(1, int(limit))]
-        yield "event: done\n" + f"data: {json.dumps({'pairs': pairs, 'total': total}, ensure_ascii=False)}\n\n"
+    # Events: progress (counting), pairs (next pairs in final order, as soon as
+    # they are known), done (total number of pairs over the threshold)
+    def _event(name: str, data) -> bytes:
+        # Compact JSON (no spaces, UTF-8) on a single data: line
+        return b"event: " + name.encode("ascii") + b"\ndata: " + fastjson.dumps(data) + b"\n\n"
+
+    loop = asyncio.get_running_loop()
+    excluded_list = _excluded(excluded_tags)
+
+    async def event_gen():
+        cancel = threading.Event()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def produce():
+            # Worker thread: engine events -> queue; None marks the end
+            try:
+                for ev in duplicates.iter_pairs(min_shared, limit, excluded_list, cancel):
+                    loop.call_soon_threadsafe(queue.put_nowait, ev)
+            except duplicates.Cancelled:
+                pass
+            except Exception as e:
+                print(f"[duplicates] stream failed: {e}")
+                loop.call_soon_threadsafe(queue.put_nowait, ("error", str(e)))
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        loop.run_in_executor(None, produce)
+        try:
+            # First small debug
+            yield _event("debug", {"note": "start"})
+            while (ev := await queue.get()) is not None:
+                kind, data = ev
+                if kind == "progress":
+                    yield _event("progress", {"progress_pct": data, "phase": "counting"})
+                elif kind == "pairs":
+                    yield _event("pairs", {"pairs": data})
+                elif kind == "total":
+                    yield _event("done", {"total": data})
+                else:
+                    yield _event("debug", {"error": data})
+        finally:
+            # Client gone (the response task is cancelled on disconnect, the
+            # worker stops at its next check) or stream done
+            cancel.set()
+
     return StreamingResponse(event_gen(), media_type="text/event-stream")
@@ -0,0 +1,84 @@
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Query
+from starlette.responses import StreamingResponse
+from .. import jobs
+
+router = APIRouter()
+
+# Seconds without news before a keep-alive comment on /stream
+_KEEPALIVE = 15.0
+
+
+@router.get("/")
+def list_jobs(
+    limit: int = Query(50, ge=1, le=500, description="Nombre maximum de jobs renvoyés"),
+    kind: str | None = Query(None, description="Filtrer par type de job (reindex, scan, ...)"),
+):
+    return {"items": jobs.list_jobs(limit=limit, kind=kind)}
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    snap = jobs.get(job_id)
+    if snap is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return snap
+
+
+@router.post("/{job_id}/cancel")
+def cancel_job(job_id: str):
+    snap = jobs.cancel(job_id)
+    if snap is None:
+        raise HTTPException(status_code=404, detail="Job introuvable ou déjà archivé")
+    return snap
+
+
+@router.get("/{job_id}/stream")
+async def stream_job(job_id: str):
+    first = jobs.get(job_id)
+    if first is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    loop = asyncio.get_running_loop()
+
+    def _event(name: str, snap: dict) -> str:
+        return f"event: {name}\n" + f"data: {json.dumps(snap, ensure_ascii=False, default=str)}\n\n"
+
+    async def event_gen():
+        # The job thread only sets an asyncio.Event: no threadpool worker is held while waiting
+        changed = asyncio.Event()
+
+        def on_change():
+            loop.call_soon_threadsafe(changed.set)
+
+        watching = jobs.watch(job_id, on_change)
+        try:
+            # Re-read once watching, so that a change in between is not missed
+            snap = jobs.get(job_id) or first
+            while True:
+                if snap.get("status") in jobs.FINAL_STATUSES:
+                    yield _event("done", snap)
+                    return
+                if not watching:
+                    # Job no longer in memory: send last persisted state and stop
+                    yield _event("done", jobs.get(job_id) or snap)
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Keep-alive for reverse proxies
+                    yield ": ping\n\n"
+                    continue
+                changed.clear()
+                nxt = jobs.get(job_id)
+                if nxt is None:
+                    yield _event("done", snap)
+                    return
+                snap = nxt
+                if snap.get("status") not in jobs.FINAL_STATUSES:
+                    yield _event("progress", snap)
+        finally:
+            if watching:
+                jobs.unwatch(job_id, on_change)
+
+    return StreamingResponse(event_gen(), media_type="text/event-stream")
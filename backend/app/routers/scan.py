@@ -1,21 +1,226 @@
 import os
+import time
 from datetime import datetime
 from pathlib import Path
 from fastapi import APIRouter, HTTPException
 from ..db import get_connection
+from .. import jobs, detail_cache, media_index, folder_snapshot, folder_store, metrics, posters, tag_index, tag_suggest, tracing
+from ..media_index import MEDIA_EXT, META_NAME, classify
 import json
 
 router = APIRouter()
 
-# Reuse same notion of media as folders router
-IMAGE_EXT = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
-GIF_EXT = {".gif"}
-VIDEO_EXT = {".mp4", ".webm", ".mov", ".m4v"}
-ARCHIVE_EXT = {".zip", ".7z", ".rar"}
-STL_EXT = {".stl"}
+# Rows buffered before an executemany flush
+BATCH_SIZE = 500
+# Rows written per transaction when syncing the projects table
+SYNC_CHUNK = 5000
+
+# The scan lists COLLECTION_ROOT once and feeds each top-level folder through the stages below:
+#   walk         -> recursive media summary (media_index.summarize: one os.scandir pass over
+#                   changed directories only, classification included)
+#   sidecar      -> create/patch .stl_collect.json where media exist, read project metadata
+#   folder_index -> batched upsert of top-level project folders
+#   projects     -> bulk diff of the legacy per-STL projects table (insert/update/delete)
+# Time spent in each stage is returned in `timings_ms`.
+
+
+class _StageTimer:
+    def __init__(self):
+        self.totals: dict[str, float] = {}
+
+    def add(self, stage: str, started: float) -> None:
+        self.totals[stage] = self.totals.get(stage, 0.0) + (time.perf_counter() - started)
+
+    def as_ms(self) -> dict[str, float]:
+        return {k: round(v * 1000.0, 2) for k, v in self.totals.items()}
+
+
+def _stl_row(fpath: Path, root_path: Path) -> tuple[str, str, str]:
+    try:
+        dir_only = str(fpath.relative_to(root_path).parent).replace("\\", "/")
+    except ValueError:
+        dir_only = ""
+    return str(fpath), fpath.stem, dir_only
+
+
+def _read_meta(meta_path: Path) -> dict | None:
+    try:
+        metrics.fs("json_read", meta_path)
+        with tracing.span("fs", "json_read", path=meta_path):
+            raw = meta_path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    meta = json.loads(raw) if raw.strip() else {}
+    return meta if isinstance(meta, dict) else {}
+
+
+def _ensure_meta(folder: Path, now: str, counters: dict) -> dict | None:
+    """Make sure `folder` holds a sidecar with added_at. Returns the (possibly new) metadata."""
+    meta_path = folder / META_NAME
+    try:
+        meta = _read_meta(meta_path)
+    except Exception:
+        # Unreadable sidecar: leave it alone rather than overwrite user data
+        return {}
+    try:
+        if meta is None:
+            meta = {"added_at": now}
+            meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+            metrics.fs("json_write", meta_path)
+            counters["meta_created"] += 1
+        elif not meta.get("added_at"):
+            meta["added_at"] = now
+            meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+            metrics.fs("json_write", meta_path)
+            counters["meta_patched"] += 1
+    except Exception:
+        # Non-fatal (read-only volume...)
+        pass
+    return meta
+
+
+def _folder_row(proj: media_index.SubtreeSummary, meta: dict | None, root_path: Path, root_id: int) -> tuple:
+    project_dir = Path(proj.path)
+    tags_text = None
+    rating = None
+    created_at = None
+    modified_at = None
+    thumb_path = None
+    if isinstance(meta, dict):
+        if isinstance(meta.get("tags"), list):
+            try:
+                tags_text = ",".join([str(t).strip() for t in meta.get("tags") if str(t).strip()]) or None
+            except Exception:
+                tags_text = None
+        r = meta.get("rating")
+        if isinstance(r, (int, float)):
+            rating = int(r)
+        created_at = meta.get("added_at") or None
+        modified_at = meta.get("modified_at") or None
+        # thumbnail from meta.preview_file
+        try:
+            pf = meta.get("preview_file")
+            if isinstance(pf, str) and pf.strip():
+                cand = project_dir / pf
+                if cand.is_file():
+                    thumb_path = str(cand)
+        except Exception:
+            pass
+    # If no explicit thumbnail from meta, use the first image met by the walk (top level first)
+    if thumb_path is None:
+        thumb_path = proj.first_image
+    if thumb_path is None:
+        # GIF/video only: poster already extracted by the posters job
+        thumb_path = posters.cached(proj)
+    rel = folder_store.rel_to(folder_store.norm_root(str(root_path)), str(project_dir))
+    mtime_val = proj.latest_mtime
+    if not isinstance(mtime_val, (int, float)):
+        try:
+            mtime_val = project_dir.stat().st_mtime
+        except OSError:
+            mtime_val = 0.0
+    return (
+        root_id, rel, project_dir.name, float(mtime_val),
+        proj.images, proj.gifs, proj.videos, proj.archives, proj.stls,
+        tags_text, rating, folder_store.rel_thumb(str(project_dir), thumb_path), created_at, modified_at,
+    )
+
+
+_FOLDER_UPSERT = """
+    INSERT INTO folder_index
+    (root_id, rel, name, mtime, images, gifs, videos, archives, stls, tags, rating, thumbnail_path, created_at, modified_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(root_id, rel) DO UPDATE SET
+      name=excluded.name,
+      mtime=excluded.mtime,
+      images=excluded.images,
+      gifs=excluded.gifs,
+      videos=excluded.videos,
+      archives=excluded.archives,
+      stls=excluded.stls,
+      tags=excluded.tags,
+      rating=COALESCE(folder_index.rating, excluded.rating),
+      thumbnail_path=COALESCE(excluded.thumbnail_path, folder_index.thumbnail_path),
+      created_at=COALESCE(folder_index.created_at, excluded.created_at),
+      modified_at=COALESCE(excluded.modified_at, folder_index.modified_at)
+"""
+
+
+def _flush_folders(cur, rows: list, timer: _StageTimer) -> None:
+    if not rows:
+        return
+    started = time.perf_counter()
+    try:
+        cur.executemany(_FOLDER_UPSERT, rows)
+    except Exception:
+        # Fall back to row by row so that one bad row does not drop the batch
+        for row in rows:
+            try:
+                cur.execute(_FOLDER_UPSERT, row)
+            except Exception:
+                pass
+    rows.clear()
+    timer.add("folder_index", started)
+
+
+class _ProjectsSync:
+    """Bulk synchronisation of the legacy `projects` table (one row per STL file).
+
+    The existing path -> (id, name, dir) map is loaded once, the walk only records
+    the STL files it sees, and apply() diffs both sides and writes inserts, updates
+    and deletes with executemany, SYNC_CHUNK rows per transaction. Rows under a
+    directory that could not be listed are never deleted.
+    """
+
+    def __init__(self, conn, timer: _StageTimer):
+        self.conn = conn
+        self.timer = timer
+        self.seen: dict[str, tuple[str, str]] = {}
+        started = time.perf_counter()
+        cur = conn.cursor()
+        cur.execute("SELECT path, id, name, dir FROM projects")
+        self.existing: dict[str, tuple[int, str, str]] = {r[0]: (r[1], r[2], r[3]) for r in cur.fetchall()}
+        timer.add("projects", started)
+
+    def add(self, row: tuple[str, str, str]) -> None:
+        path, name, dir_only = row
+        self.seen[path] = (name, dir_only)
+
+    def _chunked(self, sql: str, rows: list) -> None:
+        cur = self.conn.cursor()
+        for k in range(0, len(rows), SYNC_CHUNK):
+            cur.executemany(sql, rows[k:k + SYNC_CHUNK])
+            self.conn.commit()
+
+    def apply(self, now: str, failed_dirs: list[str]) -> dict:
+        started = time.perf_counter()
+        inserts = []
+        updates = []
+        unchanged = 0
+        for path, (name, dir_only) in self.seen.items():
+            prev = self.existing.get(path)
+            if prev is None:
+                inserts.append((path, name, dir_only, now, now))
+            elif prev[1] != name or prev[2] != dir_only:
+                updates.append((name, dir_only, now, prev[0]))
+            else:
+                unchanged += 1
+        prefixes = tuple(d.rstrip("/\\") + os.sep for d in failed_dirs)
+        deletes = [
+            (row[0],) for path, row in self.existing.items()
+            if path not in self.seen and not (prefixes and path.startswith(prefixes))
+        ]
+        self._chunked("INSERT OR IGNORE INTO projects(path, name, dir, first_scanned_at, updated_at) VALUES(?,?,?,?,?)", inserts)
+        self._chunked("UPDATE projects SET name = ?, dir = ?, updated_at = ? WHERE id = ?", updates)
+        self._chunked("DELETE FROM projects WHERE id = ?", deletes)
+        self.timer.add("projects", started)
+        return {"added": len(inserts), "updated": len(updates), "unchanged": unchanged, "removed": len(deletes)}
+
 
 @router.post("/scan")
-def scan_collection(force: bool = False):
+def scan_collection(force: bool = False, background: bool = False):
+    if background:
+        return jobs.submit("scan", lambda: scan_collection(force=force, background=False), {"force": bool(force)})
     root = os.getenv("COLLECTION_ROOT")
     if not root:
         raise HTTPException(status_code=400, detail="COLLECTION_ROOT non défini")
@@ -23,255 +228,106 @@ def scan_collection(force: bool = False):
     if not root_path.exists() or not root_path.is_dir():
         raise HTTPException(status_code=400, detail="COLLECTION_ROOT introuvable")
 
+    t0 = time.perf_counter()
+    timer = _StageTimer()
     conn = get_connection()
     cur = conn.cursor()
     now = datetime.utcnow().isoformat()
+    counters = {"meta_created": 0, "meta_patched": 0}
+    folder_rows: list = []
+    failed_dirs: list[str] = []
+    stl_sync = _ProjectsSync(conn, timer)
+    root_id = folder_store.root_id(cur, root)
 
-    added = 0
-    updated = 0
-    meta_created = 0
-    meta_patched = 0
-
-    # Pass 1: For each top-level project folder, if any media exists anywhere under it, ensure top-level meta with added_at
+    # Files directly under the root are not a project, but their STLs still feed `projects`
+    started = time.perf_counter()
+    top_dirs: list[str] = []
+    root_has_media = False
     try:
-        for entry in os.scandir(root_path):
-            if not entry.is_dir():
-                continue
-            if entry.name.startswith('.'):
-                continue
-            project_dir = Path(entry.path)
-            any_media = False
-            try:
-                for dp, dns, fns in os.walk(project_dir):
-                    for fn in fns:
-                        ext = Path(fn).suffix.lower()
-                        if ext in IMAGE_EXT or ext in GIF_EXT or ext in VIDEO_EXT or ext in ARCHIVE_EXT or ext in STL_EXT:
-                            any_media = True
-                            break
-                    if any_media:
-                        break
-            except PermissionError:
-                continue
-            if any_media:
-                meta_path = project_dir / ".stl_collect.json"
+        metrics.fs("scandir", root_path)
+        with os.scandir(root_path) as it:
+            for e in it:
                 try:
-                    if not meta_path.exists():
-                        meta = {"added_at": now}
-                        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-                        meta_created += 1
-                    else:
-                        raw = meta_path.read_text(encoding="utf-8")
-                        meta = json.loads(raw) if raw.strip() else {}
-                        if not isinstance(meta, dict):
-                            meta = {}
-                        if not meta.get("added_at"):
-                            meta["added_at"] = now
-                            meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-                            meta_patched += 1
-                except Exception:
-                    # Non-fatal
-                    pass
+                    # Symlinked project folders count, like in reindex (is_dir() follows
+                    # links); inside a project, links are not followed (media_index)
+                    if e.is_dir():
+                        top_dirs.append(e.path)
+                    elif e.is_file() and os.path.splitext(e.name)[1].lower() in MEDIA_EXT:
+                        root_has_media = True
+                        if classify(e.name) == "stls":
+                            stl_sync.add(_stl_row(Path(e.path), root_path))
+                except OSError:
+                    continue
     except PermissionError:
-        pass
-
-    # Pass 2: Upsert top-level project folders into folder_index so they appear immediately
-    try:
-        for entry in os.scandir(root_path):
-            if not entry.is_dir() or entry.name.startswith('.'):
-                continue
-            project_dir = Path(entry.path)
-            # Count media recursively
-            images = gifs = videos = archives = stls = 0
-            latest_mtime: float | None = None
-            try:
-                for dp, dns, fns in os.walk(project_dir):
-                    for fn in fns:
-                        ext = Path(fn).suffix.lower()
-                        p = Path(dp) / fn
-                        if ext in IMAGE_EXT:
-                            images += 1
-                        elif ext in GIF_EXT:
-                            gifs += 1
-                        elif ext in VIDEO_EXT:
-                            videos += 1
-                        elif ext in ARCHIVE_EXT:
-                            archives += 1
-                        elif ext in STL_EXT:
-                            stls += 1
-                        try:
-                            mt = p.stat().st_mtime
-                            if isinstance(mt, (int, float)):
-                                if latest_mtime is None or mt > latest_mtime:
-                                    latest_mtime = mt
-                        except Exception:
-                            pass
-            except PermissionError:
-                pass
+        failed_dirs.append(str(root_path))
+    timer.add("walk", started)
+    if root_has_media:
+        started = time.perf_counter()
+        _ensure_meta(root_path, now, counters)
+        timer.add("sidecar", started)
 
-            # Read metadata
-            meta_path = project_dir / ".stl_collect.json"
-            tags_text = None
-            rating = None
-            created_at = None
-            modified_at = None
-            thumb_path = None
-            if meta_path.exists():
-                try:
-                    raw = meta_path.read_text(encoding="utf-8")
-                    meta = json.loads(raw) if raw.strip() else {}
-                    if isinstance(meta, dict):
-                        if isinstance(meta.get("tags"), list):
-                            try:
-                                tags_text = ",".join([str(t).strip() for t in meta.get("tags") if str(t).strip()]) or None
-                            except Exception:
-                                tags_text = None
-                        r = meta.get("rating")
-                        if isinstance(r, (int, float)):
-                            rating = int(r)
-                        created_at = meta.get("added_at") or None
-                        modified_at = meta.get("modified_at") or None
-                        # thumbnail from meta.preview_file
-                        try:
-                            pf = meta.get("preview_file")
-                            if isinstance(pf, str) and pf.strip():
-                                cand = project_dir / pf
-                                if cand.exists() and cand.is_file():
-                                    thumb_path = str(cand)
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
+    folders = 0
+    dirs_scanned = 0
+    dirs_cached = 0
+    for i, top in enumerate(top_dirs):
+        jobs.checkpoint(done=i, total=len(top_dirs), folders=folders, stls=len(stl_sync.seen), **counters)
+        started = time.perf_counter()
+        summary = media_index.summarize(top, conn)
+        failed_dirs.extend(summary.unreadable)
+        dirs_scanned += summary.dirs_scanned
+        dirs_cached += summary.dirs_cached
+        for f in summary.stl_files:
+            stl_sync.add(_stl_row(Path(f), root_path))
+        timer.add("walk", started)
 
-            # If no explicit thumbnail from meta, pick the first image found (recursive)
-            if thumb_path is None:
+        # Hidden top-level folders are not projects (folder_index) but are still scanned for STLs
+        is_project = not os.path.basename(top).startswith('.')
+        started = time.perf_counter()
+        for dirpath, has_meta in summary.media_dirs:
+            if not has_meta and (dirpath != top or not is_project):
+                _ensure_meta(Path(dirpath), now, counters)
+        top_meta: dict | None = None
+        if is_project:
+            # Top-level sidecar: created if any media anywhere below, read in all cases
+            if summary.any_media:
+                top_meta = _ensure_meta(Path(top), now, counters)
+            else:
                 try:
-                    stop = False
-                    for dp, dns, fns in os.walk(project_dir):
-                        for fn in fns:
-                            if Path(fn).suffix.lower() in IMAGE_EXT:
-                                thumb_path = str(Path(dp) / fn)
-                                stop = True
-                                break
-                        if stop:
-                            break
+                    top_meta = _read_meta(Path(top) / META_NAME)
                 except Exception:
-                    pass
-
-            # Derive basics
-            rel = str(project_dir.relative_to(root_path)).replace("\\", "/")
-            name = project_dir.name
-            mtime_val = latest_mtime if isinstance(latest_mtime, (int, float)) else project_dir.stat().st_mtime
+                    top_meta = None
+        timer.add("sidecar", started)
 
-            try:
-                cur.execute(
-                    """
-                    INSERT INTO folder_index
-                    (path, name, rel, mtime, images, gifs, videos, archives, stls, tags, rating, thumbnail_path, created_at, modified_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(path) DO UPDATE SET
-                      name=excluded.name,
-                      rel=excluded.rel,
-                      mtime=excluded.mtime,
-                      images=excluded.images,
-                      gifs=excluded.gifs,
-                      videos=excluded.videos,
-                      archives=excluded.archives,
-                      stls=excluded.stls,
-                      tags=excluded.tags,
-                      rating=COALESCE(folder_index.rating, excluded.rating),
-                      thumbnail_path=COALESCE(excluded.thumbnail_path, folder_index.thumbnail_path),
-                      created_at=COALESCE(folder_index.created_at, excluded.created_at),
-                      modified_at=COALESCE(excluded.modified_at, folder_index.modified_at)
-                    """,
-                    (
-                        str(project_dir), name, rel, float(mtime_val),
-                        images, gifs, videos, archives, stls,
-                        tags_text, rating, thumb_path, created_at, modified_at,
-                    ),
-                )
-            except Exception:
-                # Don't break the scan if upsert fails
-                pass
+        if is_project:
+            folder_rows.append(_folder_row(summary, top_meta, root_path, root_id))
+            folders += 1
+            if len(folder_rows) >= BATCH_SIZE:
+                _flush_folders(cur, folder_rows, timer)
+        # Keep the cache writes of summarize() in small transactions
         conn.commit()
-    except PermissionError:
-        pass
-
-    # Pass 3: maintain legacy projects table per STL files (unchanged)
-    for dirpath, dirnames, filenames in os.walk(root):
-        # Ensure per-folder metadata if folder contains any media
-        try:
-            folder_path = Path(dirpath)
-            has_media = False
-            for fname in filenames:
-                ext = Path(fname).suffix.lower()
-                if ext in IMAGE_EXT or ext in GIF_EXT or ext in VIDEO_EXT or ext in ARCHIVE_EXT or ext in STL_EXT:
-                    has_media = True
-                    break
-            if has_media:
-                meta_path = folder_path / ".stl_collect.json"
-                if not meta_path.exists():
-                    meta = {"added_at": now}
-                    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-                else:
-                    try:
-                        raw = meta_path.read_text(encoding="utf-8")
-                        meta = json.loads(raw) if raw.strip() else {}
-                    except Exception:
-                        meta = {}
-                    if not isinstance(meta, dict):
-                        meta = {}
-                    if not meta.get("added_at"):
-                        meta["added_at"] = now
-                        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-        except Exception:
-            pass
-
-        for fname in filenames:
-            if not fname.lower().endswith(".stl"):
-                continue
-            fpath = Path(dirpath) / fname
-            rel = fpath.relative_to(root_path)
-            name = fpath.stem
-            dir_only = str(rel.parent).replace("\\", "/")
-
-            cur.execute("SELECT id, name, dir FROM projects WHERE path = ?", (str(fpath),))
-            row = cur.fetchone()
-            if row:
-                cur.execute(
-                    "UPDATE projects SET name = ?, dir = ?, updated_at = ? WHERE id = ?",
-                    (name, dir_only, now, row["id"]),
-                )
-                updated += 1
-            else:
-                cur.execute(
-                    "INSERT INTO projects(path, name, dir, first_scanned_at, updated_at) VALUES(?,?,?,?,?)",
-                    (str(fpath), name, dir_only, now, now),
-                )
-                added += 1
-
-                # Ensure project metadata file with added_at at first scan
-                try:
-                    folder_path = fpath.parent
-                    meta_path = folder_path / ".stl_collect.json"
-                    if not meta_path.exists():
-                        meta = {"added_at": now}
-                        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-                    else:
-                        # Patch in added_at if missing
-                        try:
-                            raw = meta_path.read_text(encoding="utf-8")
-                            meta = json.loads(raw) if raw.strip() else {}
-                        except Exception:
-                            meta = {}
-                        if not isinstance(meta, dict):
-                            meta = {}
-                        if not meta.get("added_at"):
-                            meta["added_at"] = now
-                            meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-                except Exception:
-                    # Non-fatal: continue scan even if metadata write fails
-                    pass
 
+    _flush_folders(cur, folder_rows, timer)
+    started = time.perf_counter()
+    tag_index.rebuild(cur)
+    timer.add("folder_index", started)
+    folder_snapshot.invalidate()
+    detail_cache.invalidate()
+    tag_suggest.invalidate()
+    media_index.prune(conn, root_path, set(top_dirs))
     conn.commit()
+    # Only diff once the whole tree was walked (a cancelled scan never deletes rows)
+    jobs.checkpoint(done=len(top_dirs), total=len(top_dirs), phase="projects")
+    sync_stats = stl_sync.apply(now, failed_dirs)
     conn.close()
-    return {"added": added, "updated": updated, "meta_created": meta_created, "meta_patched": meta_patched}
+    posters.schedule()
+    timings = timer.as_ms()
+    timings["total"] = round((time.perf_counter() - t0) * 1000.0, 2)
+    return {
+        **sync_stats,
+        **counters,
+        "folders": folders,
+        "dirs_scanned": dirs_scanned,
+        "dirs_cached": dirs_cached,
+        "unreadable_dirs": len(failed_dirs),
+        "timings_ms": timings,
+    }
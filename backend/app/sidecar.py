@@ -0,0 +1,185 @@
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+from . import metrics, tracing
+from .media_index import GIF_EXT, IMAGE_EXT, META_NAME
+
+# .stl_collect.json helpers shared by the API (folders router) and the offline
+# maintenance script (scripts/fix_tags_json.py), so that both leave the same
+# sidecars behind.
+
+
+def normalize_tags(raw) -> list[str]:
+    def uniq_preserve(seq):
+        seen = set()
+        out = []
+        for x in seq:
+            if x not in seen:
+                seen.add(x)
+                out.append(x)
+        return out
+
+    def try_parse_json_list(s: str):
+        try:
+            v = json.loads(s)
+            if isinstance(v, list):
+                return [str(t).strip() for t in v if str(t).strip()]
+            return None
+        except Exception:
+            return None
+
+    def strip_wrapping_quotes(s: str) -> str:
+        pairs = [("\"", "\""), ("'", "'"), ("“", "”"), ("‘", "’")]
+        changed = True
+        while changed and len(s) >= 2:
+            changed = False
+            for a, b in pairs:
+                if s.startswith(a) and s.endswith(b):
+                    s = s[len(a):-len(b)].strip()
+                    changed = True
+        # Handle escaped quotes at both ends like \"foo\"
+        if len(s) >= 4 and s.startswith('\\"') and s.endswith('\\"'):
+            s = s[2:-2].strip()
+        return s
+
+    if isinstance(raw, list):
+        joined = "".join([str(x) for x in raw])
+        if "[" in joined and "]" in joined and '\\"' in joined:
+            parsed = try_parse_json_list(joined)
+            if parsed is not None:
+                return uniq_preserve(parsed)
+        cleaned = []
+        for t in raw:
+            s = strip_wrapping_quotes(str(t).strip())
+            s = s.strip("[] ")
+            # After removing brackets, strip quotes again to catch cases like '["Tag1"'
+            s = strip_wrapping_quotes(s)
+            if s:
+                cleaned.append(s)
+        return uniq_preserve([c for c in cleaned if c])
+    if isinstance(raw, str):
+        s = raw.strip()
+        parsed = try_parse_json_list(s)
+        if parsed is not None:
+            return uniq_preserve(parsed)
+        s = s.strip("[]")
+        parts = [p.strip() for p in s.split(',')]
+        out = []
+        for p in parts:
+            p = strip_wrapping_quotes(p.strip())
+            if p:
+                out.append(p)
+        return uniq_preserve(out)
+    return []
+
+
+def tags_need_fix(raw, new_tags: list[str]) -> bool:
+    """Whether the stored `tags` value differs from its normalized form."""
+    if isinstance(raw, str):
+        # Any string form becomes a list
+        return True
+    if isinstance(raw, list):
+        return bool(new_tags) and [str(t).strip() for t in raw] != new_tags
+    return False
+
+
+def backup(meta_path: Path) -> None:
+    """Copy the sidecar to .bak (or a timestamped .bak when one already exists)."""
+    try:
+        bak = meta_path.with_suffix(meta_path.suffix + ".bak")
+        content = meta_path.read_text(encoding="utf-8")
+        if not bak.exists():
+            bak.write_text(content, encoding="utf-8")
+        else:
+            ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+            bak_ts = meta_path.with_suffix(meta_path.suffix + f".{ts}.bak")
+            bak_ts.write_text(content, encoding="utf-8")
+    except Exception:
+        # backup failure tolerated
+        pass
+
+
+def created_at_from_images(folder: Path) -> str | None:
+    """Date of the oldest image/GIF directly in `folder` (file mtime), None without any."""
+    try:
+        min_time: float | None = None
+        metrics.fs("scandir", folder)
+        for entry in os.scandir(folder):
+            if entry.is_file():
+                ext = Path(entry.name).suffix.lower()
+                if ext in IMAGE_EXT or ext in GIF_EXT:
+                    try:
+                        # Use modification time instead of ctime (ctime is change time on Linux/CIFS)
+                        mt = entry.stat().st_mtime
+                        if isinstance(mt, (int, float)):
+                            if min_time is None or mt < min_time:
+                                min_time = mt
+                    except Exception:
+                        continue
+        if min_time is not None:
+            return datetime.fromtimestamp(min_time).isoformat()
+    except PermissionError:
+        pass
+    return None
+
+
+def meta_diff(before: dict, after: dict, ignore: tuple = ()) -> dict:
+    keys = [k for k in dict.fromkeys(list(before) + list(after)) if k not in ignore]
+    return {k: {"before": before.get(k), "after": after.get(k)} for k in keys if before.get(k) != after.get(k)}
+
+
+def fix_tags(folder_path: Path, dry_run: bool) -> dict | None:
+    """Normalize the tags of one sidecar (and fill a missing added_at). None when the folder has no sidecar.
+
+    {"path", "changed", "tags"} plus "diff" (dry run), "bytes" (written) or "error".
+    """
+    meta_path = folder_path / META_NAME
+    if not meta_path.is_file():
+        return None
+    res: dict = {"path": str(folder_path), "changed": False}
+    try:
+        with tracing.span("fs", "json_read", path=meta_path), meta_path.open("r", encoding="utf-8") as fh:
+            metrics.fs("json_read", meta_path)
+            meta = json.load(fh) or {}
+    except Exception as e:
+        res["error"] = f"read:{meta_path}:{e}"
+        return res
+
+    new_tags = normalize_tags(meta.get("tags"))
+    res["tags"] = new_tags
+    if not tags_need_fix(meta.get("tags"), new_tags):
+        return res
+
+    before = dict(meta)
+    meta["tags"] = new_tags
+    # Ensure dates
+    try:
+        if not meta.get("added_at"):
+            created = created_at_from_images(folder_path)
+            if not created:
+                try:
+                    created = datetime.fromtimestamp(folder_path.stat().st_ctime).isoformat()
+                except Exception:
+                    created = None
+            meta["added_at"] = created or datetime.now().isoformat()
+    except Exception:
+        meta["added_at"] = datetime.now().isoformat()
+    res["changed"] = True
+    if dry_run:
+        res["diff"] = meta_diff(before, meta, ignore=("modified_at",))
+        return res
+
+    backup(meta_path)
+    meta["modified_at"] = datetime.now().isoformat()
+    data = json.dumps(meta, ensure_ascii=False, indent=2)
+    try:
+        with meta_path.open("w", encoding="utf-8") as fh:
+            fh.write(data)
+            metrics.fs("json_write", meta_path)
+        res["bytes"] = len(data.encode("utf-8"))
+    except Exception as e:
+        res["changed"] = False
+        res["error"] = f"write:{meta_path}:{e}"
+    return res
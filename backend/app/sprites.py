@@ -0,0 +1,172 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .db import CACHE_DB_PATH
+
+try:  # Optional dependency: no sprites without Pillow
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover
+    Image = None
+
+# Contact sheets of a page of project thumbnails.
+#
+# The home grid can fetch one sprite image per /folders/ page instead of one
+# /files/ request per tile. Every thumbnail is first reduced to a TILE_W x TILE_H
+# derivative (cropped like the grid's object-cover 3:4 cells) cached on disk
+# under sprites/thumbs/, named after the source path, mtime and size; a sprite is
+# then a plain paste of those tiles, cached under sprites/sheets/ with its
+# coordinate map and named after the ordered list of derivatives it contains.
+# Any item of the page whose thumbnail changes (other file, file rewritten)
+# gives another name, so a cached sprite is never stale and can be served as
+# immutable. Both directories live next to the SQLite cache and are trimmed to
+# the most recently used SPRITE_CACHE_FILES sprites and SPRITE_THUMB_FILES
+# derivatives.
+
+ENABLED = Image is not None
+TILE_W = max(16, int(os.getenv("SPRITE_TILE_WIDTH", "240")))
+TILE_H = max(16, int(os.getenv("SPRITE_TILE_HEIGHT", "320")))
+COLUMNS = 10
+MAX_SPRITES = max(1, int(os.getenv("SPRITE_CACHE_FILES", "200")))
+MAX_THUMBS = max(1, int(os.getenv("SPRITE_THUMB_FILES", "20000")))
+
+# Thumbnail derivatives (also used by posters)
+CACHE_DIR = os.path.join(os.path.dirname(CACHE_DB_PATH), "sprites")
+THUMB_DIR = os.path.join(CACHE_DIR, "thumbs")
+SPRITE_DIR = os.path.join(CACHE_DIR, "sheets")
+
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="stlmanager-sprites")
+_trim_lock = threading.Lock()
+# Derivatives written since the thumbs/ directory was last trimmed (walking it is not free)
+_made = 0
+_TRIM_EVERY = 500
+
+
+def _thumb_key(path: str) -> str | None:
+    """Name of the derivative of `path` (None if the file is gone)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    raw = f"{path}\0{st.st_mtime_ns}\0{st.st_size}\0{TILE_W}x{TILE_H}"
+    return hashlib.sha1(raw.encode("utf-8", "surrogateescape")).hexdigest()
+
+
+def _write_atomic(im, dest: str, **kw) -> None:
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{threading.get_ident()}.tmp"
+    im.save(tmp, "WEBP", **kw)
+    os.replace(tmp, dest)
+
+
+def _derivative(path: str, key: str) -> tuple[str | None, bool]:
+    """(cached tile of the image at `path`, rendered now?); the tile is rendered on first use."""
+    dest = os.path.join(THUMB_DIR, key[:2], key + ".webp")
+    if os.path.exists(dest):
+        return dest, False
+    try:
+        with Image.open(path) as im:
+            im.draft("RGB", (TILE_W * 2, TILE_H * 2))
+            im = ImageOps.exif_transpose(im).convert("RGB")
+            tile = ImageOps.fit(im, (TILE_W, TILE_H), Image.LANCZOS)
+        _write_atomic(tile, dest, quality=80)
+    except Exception as e:
+        print(f"[sprites] thumbnail skipped for '{path}': {e}")
+        return None, False
+    return dest, True
+
+
+def _trim(directory: str, keep: int) -> None:
+    """Drop the oldest files of `directory` (recursively) beyond `keep`."""
+    with _trim_lock:
+        files = []
+        for d, _, names in os.walk(directory):
+            for n in names:
+                p = os.path.join(d, n)
+                try:
+                    files.append((os.stat(p).st_mtime, p))
+                except OSError:
+                    pass
+        if len(files) <= keep:
+            return
+        files.sort()
+        for _, p in files[: len(files) - keep]:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+def sheet_path(name: str) -> str | None:
+    """Path of a cached sprite from its public name, None when unknown or malformed."""
+    stem, ext = os.path.splitext(name)
+    if ext != ".webp" or len(stem) != 40 or any(c not in "0123456789abcdef" for c in stem):
+        return None
+    p = os.path.join(SPRITE_DIR, name)
+    return p if os.path.isfile(p) else None
+
+
+def build(items: list[dict]) -> dict:
+    """Sprite of the thumbnails of `items` (dicts with path and thumbnail_path), built or reused.
+
+    Returns {"sprite": name, "tile", "columns", "width", "height", "items": {path: {x, y, w, h}}};
+    items without a usable thumbnail are left out of the map (the client keeps /files/ for them).
+    """
+    global _made
+    keyed = []
+    for it in items:
+        thumb = it.get("thumbnail_path")
+        key = _thumb_key(thumb) if thumb else None
+        if key:
+            keyed.append((it["path"], thumb, key))
+
+    name = hashlib.sha1("\n".join(f"{p}\0{k}" for p, _, k in keyed).encode("utf-8", "surrogateescape")).hexdigest() + ".webp"
+    dest = os.path.join(SPRITE_DIR, name)
+    try:
+        with open(dest + ".json", "r", encoding="utf-8") as fh:
+            layout = json.load(fh)
+        if os.path.isfile(dest):
+            # Keeps recently used sprites out of _trim()
+            os.utime(dest)
+            os.utime(dest + ".json")
+            return {"sprite": name, **layout}
+    except (OSError, ValueError):
+        pass
+
+    # Derivatives are made in parallel (Pillow releases the GIL while decoding)
+    made = list(_pool.map(lambda x: _derivative(x[1], x[2]), keyed))
+    # Thumbnails that cannot be read get no slot
+    tiles = [(p, d) for (p, _, _), (d, _) in zip(keyed, made) if d]
+    columns = min(COLUMNS, max(1, len(tiles)))
+    rows = max(1, math.ceil(len(tiles) / columns))
+    coords = {}
+    sheet = Image.new("RGB", (columns * TILE_W, rows * TILE_H), (24, 24, 27))
+    for i, (p, d) in enumerate(tiles):
+        x, y = (i % columns) * TILE_W, (i // columns) * TILE_H
+        coords[p] = {"x": x, "y": y, "w": TILE_W, "h": TILE_H}
+        with Image.open(d) as tile:
+            sheet.paste(tile, (x, y))
+    layout = {
+        "tile": {"w": TILE_W, "h": TILE_H},
+        "columns": columns,
+        "width": columns * TILE_W,
+        "height": rows * TILE_H,
+        "items": coords,
+    }
+    _write_atomic(sheet, dest, quality=80)
+    with open(dest + ".json", "w", encoding="utf-8") as fh:
+        json.dump(layout, fh, ensure_ascii=False)
+    # Sprite + its layout file
+    _trim(SPRITE_DIR, MAX_SPRITES * 2)
+    # Counted here, not in the pool threads; build() itself runs on several request threads
+    with _trim_lock:
+        _made += sum(1 for _, fresh in made if fresh)
+        trim_thumbs = _made >= _TRIM_EVERY
+        if trim_thumbs:
+            _made = 0
+    if trim_thumbs:
+        _trim(THUMB_DIR, MAX_THUMBS)
+    return {"sprite": name, **layout}
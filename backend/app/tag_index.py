@@ -0,0 +1,118 @@
+import sqlite3
+from collections import Counter
+
+# Tag usage statistics, kept in the `tag_stats(tag, lower_tag, count)` table,
+# and the `tag_catalog` of tag names in use (a tag enters the catalog with its
+# first folder and leaves it with its last one).
+#
+# Every write of folder_index.tags goes through update_folder_tags() (or calls
+# apply_change() itself around an upsert/delete) on the same cursor, so the
+# counts move in the same transaction as the folder row. Bulk indexers that
+# rewrite the whole folder_index call rebuild() once at the end instead.
+# The in-memory autocomplete index (tag_suggest) is refreshed by the callers
+# after their commit, with the tag names returned here.
+
+# Splits folder_index.tags (CSV) into one row per non-empty, trimmed tag
+SPLIT_TAGS_CTE = """
+    WITH RECURSIVE split(tag, rest) AS (
+        SELECT '', tags || ',' FROM folder_index WHERE tags IS NOT NULL AND tags != ''
+        UNION ALL
+        SELECT trim(substr(rest, 1, instr(rest, ',') - 1)), substr(rest, instr(rest, ',') + 1)
+        FROM split WHERE rest != ''
+    )
+"""
+
+
+def split(csv_text: str | None) -> list[str]:
+    if not csv_text:
+        return []
+    return [t.strip() for t in csv_text.split(',') if t and t.strip()]
+
+
+def tags_of(cur: sqlite3.Cursor, key: tuple[int, str | None]) -> str | None:
+    """Tags CSV of the folder at key = (root_id, rel), see folder_store.key()."""
+    cur.execute("SELECT tags FROM folder_index WHERE root_id = ? AND rel = ?", key)
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def apply_change(cur: sqlite3.Cursor, old_csv: str | None, new_csv: str | None) -> list[str]:
+    """Move tag_stats from old_csv to new_csv. Returns the tags whose count changed."""
+    delta = Counter(split(new_csv))
+    delta.subtract(Counter(split(old_csv)))
+    plus = [(t, t.lower(), n) for t, n in delta.items() if n > 0]
+    minus = [(-n, t) for t, n in delta.items() if n < 0]
+    if plus:
+        cur.executemany(
+            """
+            INSERT INTO tag_stats(tag, lower_tag, count) VALUES(?, ?, ?)
+            ON CONFLICT(tag) DO UPDATE SET count = tag_stats.count + excluded.count
+            """,
+            plus,
+        )
+        cur.executemany("INSERT OR IGNORE INTO tag_catalog(name) VALUES(?)", [(t,) for t, _, _ in plus])
+    if minus:
+        cur.executemany("UPDATE tag_stats SET count = count - ? WHERE tag = ?", minus)
+        cur.executemany("DELETE FROM tag_stats WHERE tag = ? AND count <= 0", [(t,) for _, t in minus])
+        # Orphaned tags leave the catalog
+        cur.executemany(
+            "DELETE FROM tag_catalog WHERE name = ? AND NOT EXISTS (SELECT 1 FROM tag_stats WHERE tag = ?)",
+            [(t, t) for _, t in minus],
+        )
+    return [t for t, n in delta.items() if n != 0]
+
+
+def update_folder_tags(cur: sqlite3.Cursor, key: tuple[int, str | None], new_csv: str | None) -> list[str]:
+    """UPDATE folder_index.tags for one folder and keep tag_stats in step. Returns the tags whose count changed."""
+    old_csv = tags_of(cur, key)
+    cur.execute("UPDATE folder_index SET tags = ? WHERE root_id = ? AND rel = ?", (new_csv, *key))
+    if not cur.rowcount:
+        return []
+    return apply_change(cur, old_csv, new_csv)
+
+
+def _sync_catalog(cur: sqlite3.Cursor) -> tuple[int, int]:
+    cur.execute("INSERT OR IGNORE INTO tag_catalog(name) SELECT tag FROM tag_stats")
+    added = max(0, cur.rowcount)
+    cur.execute("DELETE FROM tag_catalog WHERE name NOT IN (SELECT tag FROM tag_stats)")
+    removed = max(0, cur.rowcount)
+    return added, removed
+
+
+def rebuild(cur: sqlite3.Cursor) -> int:
+    """Recompute tag_stats (and the catalog) from folder_index with set-based statements."""
+    cur.execute("DELETE FROM tag_stats")
+    cur.execute(
+        SPLIT_TAGS_CTE
+        + """
+        INSERT INTO tag_stats(tag, lower_tag, count)
+        SELECT tag, unicode_lower(tag), COUNT(*) FROM split WHERE tag != '' GROUP BY tag
+        """
+    )
+    _sync_catalog(cur)
+    cur.execute("SELECT COUNT(*) FROM tag_stats")
+    return int(cur.fetchone()[0])
+
+
+def check(cur: sqlite3.Cursor) -> dict:
+    """Consistency check: repair tag_stats rows that drifted from folder_index, then the catalog."""
+    # cursor.rowcount is not set for statements starting with WITH
+    before = cur.connection.total_changes
+    cur.execute(
+        SPLIT_TAGS_CTE
+        + """
+        INSERT INTO tag_stats(tag, lower_tag, count)
+        SELECT tag, unicode_lower(tag), COUNT(*) FROM split WHERE tag != '' GROUP BY tag
+        ON CONFLICT(tag) DO UPDATE SET count = excluded.count WHERE tag_stats.count != excluded.count
+        """
+    )
+    cur.execute(
+        SPLIT_TAGS_CTE
+        + """
+        DELETE FROM tag_stats WHERE tag NOT IN (SELECT tag FROM split WHERE tag != '')
+        """
+    )
+    repaired = cur.connection.total_changes - before
+    added, removed = _sync_catalog(cur)
+    cur.execute("SELECT COUNT(*) FROM tag_catalog")
+    return {"added": added, "removed": removed, "repaired": repaired, "total": int(cur.fetchone()[0])}
@@ -0,0 +1,154 @@
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterable
+
+from .db import get_connection
+
+# In-memory tag autocomplete index.
+#
+# Tag names are kept in a list sorted by lower-cased name, next to their usage
+# count (tag_stats, whose names are exactly the tag_catalog).
+# - a prefix query is a bisect on that list;
+# - substring and fuzzy (subsequence) matches are only looked for when the
+#   prefix tier does not fill the requested limit, by scanning one
+#   newline-joined string of all names (str.find / regex, no per-tag Python
+#   loop);
+# - within a tier, tags are ranked by count then name.
+# Built at startup, refreshed per tag by the tag write endpoints after their
+# commit, and rebuilt lazily after bulk operations (invalidate()).
+
+
+class TagSuggest:
+    def __init__(self, rows):
+        self.counts: dict[str, int] = {name: int(count or 0) for name, count in rows if name}
+        self.entries: list[tuple[str, str]] = sorted((n.lower(), n) for n in self.counts)
+        self._blob: str | None = None
+        self._starts: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def set_count(self, name: str, count: int | None) -> None:
+        """count None removes the tag."""
+        key = (name.lower(), name)
+        if count is None:
+            if name in self.counts:
+                del self.counts[name]
+                i = bisect_left(self.entries, key)
+                if i < len(self.entries) and self.entries[i] == key:
+                    del self.entries[i]
+                    self._blob = None
+            return
+        if name not in self.counts:
+            insort(self.entries, key)
+            self._blob = None
+        self.counts[name] = int(count)
+
+    def _rank(self, names) -> list[str]:
+        return sorted(names, key=lambda n: (-self.counts.get(n, 0), n.lower()))
+
+    def _prefix(self, q: str) -> list[str]:
+        i = bisect_left(self.entries, (q, ""))
+        out = []
+        while i < len(self.entries) and self.entries[i][0].startswith(q):
+            out.append(self.entries[i][1])
+            i += 1
+        return out
+
+    def _joined(self) -> str:
+        if self._blob is None:
+            starts = []
+            pos = 0
+            for lo, _ in self.entries:
+                starts.append(pos)
+                pos += len(lo) + 1
+            self._starts = starts
+            self._blob = "\n".join(lo.replace("\n", " ") for lo, _ in self.entries)
+        return self._blob
+
+    def _substring(self, q: str) -> list[str]:
+        blob = self._joined()
+        out = []
+        pos = blob.find(q)
+        while pos >= 0:
+            i = bisect_right(self._starts, pos) - 1
+            out.append(self.entries[i][1])
+            # One hit per tag: resume on the next line
+            nxt = self._starts[i + 1] if i + 1 < len(self._starts) else len(blob)
+            pos = blob.find(q, nxt)
+        return out
+
+    def _fuzzy(self, q: str) -> list[str]:
+        # Characters of q in order, within a single name
+        pattern = re.compile("[^\n]*?".join(re.escape(ch) for ch in q))
+        blob = self._joined()
+        hits = {bisect_right(self._starts, m.start()) - 1 for m in pattern.finditer(blob)}
+        return [self.entries[i][1] for i in hits]
+
+    def suggest(self, q: str | None, limit: int) -> list[str]:
+        q = (q or "").strip().lower()
+        if not q:
+            return [n for _, n in self.entries[:limit]]
+        out = self._rank(self._prefix(q))[:limit]
+        if len(out) < limit:
+            seen = set(out)
+            out += self._rank(n for n in self._substring(q) if n not in seen)[: limit - len(out)]
+        if len(out) < limit and len(q) >= 2:
+            seen = set(out)
+            out += self._rank(n for n in self._fuzzy(q) if n not in seen)[: limit - len(out)]
+        return out
+
+
+_lock = threading.RLock()
+_index: TagSuggest | None = None
+
+
+def _build() -> TagSuggest:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT tag, count FROM tag_stats")
+    idx = TagSuggest(cur.fetchall())
+    conn.close()
+    return idx
+
+
+def get() -> TagSuggest:
+    """Current index, (re)built on first use after startup or invalidate()."""
+    global _index
+    with _lock:
+        if _index is None:
+            _index = _build()
+        return _index
+
+
+def suggest(q: str | None, limit: int) -> list[str]:
+    with _lock:
+        return get().suggest(q, limit)
+
+
+def invalidate() -> None:
+    global _index
+    with _lock:
+        _index = None
+
+
+def refresh(names: Iterable[str]) -> None:
+    """Re-read the count of the given tags (call after the commit that changed them)."""
+    names = list({n for n in names if n})
+    with _lock:
+        if _index is None or not names:
+            return
+        try:
+            conn = get_connection()
+            cur = conn.cursor()
+            placeholders = ",".join("?" * len(names))
+            cur.execute(f"SELECT tag, count FROM tag_stats WHERE tag IN ({placeholders})", names)
+            found = {r[0]: int(r[1]) for r in cur.fetchall()}
+            conn.close()
+        except Exception as e:
+            print(f"[tags] suggest refresh failed, dropping index: {e}")
+            invalidate()
+            return
+        for n in names:
+            _index.set_count(n, found.get(n))
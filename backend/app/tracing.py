@@ -0,0 +1,253 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Per-request traces: where the time of a slow request goes.
+#
+# A traced request collects timed spans from the code it runs: every SQLite
+# statement of a db.get_connection() connection (metrics.MeteredCursor), the
+# scandir/stat/header reads of the media index, detail listings and image_meta,
+# sidecar reads, the JSON rendering of the response (fastjson) and its
+# compression. Spans nest by thread (a span opened inside another one is its
+# child); work done in other threads (background jobs, process pools) is not
+# part of the request's trace.
+#
+# Tracing is opt-in:
+# - per request, with the header `X-Trace: 1` (any value but 0);
+# - for every request, with TRACE=1; TRACE=0 ignores the header as well.
+# The trace comes back in a Server-Timing header (totals per category, then the
+# TRACE_HEADER_SPANS longest spans in start order, nesting shown in their
+# description), readable in the browser devtools' Timing tab. With TRACE_DIR
+# set, each trace is also written there as a Chrome trace file (chrome://tracing,
+# Perfetto), keeping the TRACE_FILES most recent.
+
+_mode = os.getenv("TRACE", "").lower()
+ALL = _mode in ("1", "true", "yes", "on", "all")
+# Whether requests can be traced at all (SQLite statements are then timed, see db.get_connection)
+ENABLED = _mode not in ("0", "false", "no", "off")
+HEADER = b"x-trace"
+HEADER_SPANS = max(0, int(os.getenv("TRACE_HEADER_SPANS", "20")))
+TRACE_DIR = os.getenv("TRACE_DIR") or None
+MAX_FILES = max(1, int(os.getenv("TRACE_FILES", "100")))
+# Spans kept per trace (a traced full reindex would otherwise grow without bound)
+MAX_SPANS = 20000
+
+_current: ContextVar["Trace | None"] = ContextVar("stlmanager_trace", default=None)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.wall = time.time()
+        self.duration: float | None = None
+        # (category, name, start, duration, thread id, depth, args, inside a span of the same category)
+        self.spans: list[tuple] = []
+        self.dropped = 0
+        # Categories of the spans open in each thread
+        self._open: dict[int, list[str]] = {}
+        self._lock = threading.Lock()
+
+    def enter(self, cat: str) -> None:
+        with self._lock:
+            self._open.setdefault(threading.get_ident(), []).append(cat)
+
+    def leave(self, cat: str, name: str, started: float, args: dict | None) -> None:
+        ended = time.perf_counter()
+        tid = threading.get_ident()
+        with self._lock:
+            stack = self._open[tid]
+            stack.pop()
+            if len(self.spans) >= MAX_SPANS:
+                self.dropped += 1
+                return
+            self.spans.append((cat, name, started, ended - started, tid, len(stack), args, cat in stack))
+
+    def record(self, cat: str, name: str, started: float, ended: float, args: dict | None) -> None:
+        """Add a leaf span that already ended (at the current nesting level)."""
+        tid = threading.get_ident()
+        with self._lock:
+            stack = self._open.get(tid, ())
+            if len(self.spans) >= MAX_SPANS:
+                self.dropped += 1
+                return
+            self.spans.append((cat, name, started, ended - started, tid, len(stack), args, cat in stack))
+
+
+def current() -> Trace | None:
+    return _current.get()
+
+
+@contextmanager
+def _span(trace: Trace, cat: str, name: str, args: dict | None):
+    trace.enter(cat)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.leave(cat, name, started, args)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(cat: str, name: str, **args):
+    """Context manager timing a span of the current request's trace (no-op when not traced)."""
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return _span(trace, cat, name, args or None)
+
+
+def record(cat: str, name: str, started: float, ended: float, **args) -> None:
+    """Record a finished leaf span (perf_counter() bounds) in the current trace, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.record(cat, name, started, ended, args or None)
+
+
+# ---- output -------------------------------------------------------------------
+
+def _desc(text: str) -> str:
+    # Header values are latin-1; keep them ASCII and short
+    text = text.encode("ascii", "replace").decode("ascii")
+    if len(text) > 100:
+        text = text[:97] + "..."
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _label(cat: str, name: str, args: dict | None) -> str:
+    if not args:
+        return f"{cat} {name}"
+    detail = args.get("sql") or args.get("path") or ""
+    return f"{cat} {name} {detail}".rstrip()
+
+
+def server_timing(trace: Trace) -> str:
+    totals: dict[str, list] = {}
+    for cat, _, _, dur, _, _, _, nested in trace.spans:
+        t = totals.setdefault(cat, [0.0, 0])
+        t[1] += 1
+        # A span inside one of its own category is already counted in its parent's time
+        if not nested:
+            t[0] += dur
+    parts = [f"total;dur={trace.duration * 1000:.2f}"]
+    if trace.dropped:
+        parts.append(f'dropped;desc="{trace.dropped} span(s) over {MAX_SPANS}"')
+    for cat, (dur, n) in totals.items():
+        parts.append(f'{cat};dur={dur * 1000:.2f};desc="{n} span(s)"')
+    if HEADER_SPANS:
+        longest = sorted(range(len(trace.spans)), key=lambda i: trace.spans[i][3], reverse=True)[:HEADER_SPANS]
+        for n, i in enumerate(sorted(longest, key=lambda i: trace.spans[i][2]), 1):
+            cat, name, _, dur, _, depth, args, _ = trace.spans[i]
+            label = "> " * depth + _label(cat, name, args)
+            parts.append(f'{cat}.{n};dur={dur * 1000:.2f};desc="{_desc(label)}"')
+    return ", ".join(parts)
+
+
+def chrome_trace(trace: Trace) -> dict:
+    pid = os.getpid()
+    events = [{
+        "name": trace.name, "cat": "request", "ph": "X", "pid": pid, "tid": 0,
+        "ts": 0, "dur": round(trace.duration * 1e6, 1),
+    }]
+    for cat, name, started, dur, tid, _, args, _ in sorted(trace.spans, key=lambda s: s[2]):
+        ev = {
+            "name": name, "cat": cat, "ph": "X", "pid": pid, "tid": tid,
+            "ts": round((started - trace.started) * 1e6, 1), "dur": round(dur * 1e6, 1),
+        }
+        if args:
+            ev["args"] = args
+        events.append(ev)
+    return {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "otherData": {"request": trace.name, "started_at": trace.wall, "dropped_spans": trace.dropped},
+    }
+
+
+_dump_lock = threading.Lock()
+_dumped = 0
+
+
+def dump(trace: Trace) -> str | None:
+    """Write the Chrome trace of `trace` to TRACE_DIR (oldest files trimmed), return its path."""
+    global _dumped
+    if not TRACE_DIR:
+        return None
+    with _dump_lock:
+        _dumped += 1
+        seq = _dumped
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", trace.name).strip("-")[:60]
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(trace.wall))
+    # Names sort by time, so trimming drops the oldest
+    path = os.path.join(TRACE_DIR, f"{stamp}-{seq:06d}-{slug}.json")
+    try:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(chrome_trace(trace), fh, ensure_ascii=False, default=str)
+        with _dump_lock:
+            files = sorted(n for n in os.listdir(TRACE_DIR) if n.endswith(".json"))
+            for n in files[: max(0, len(files) - MAX_FILES)]:
+                try:
+                    os.remove(os.path.join(TRACE_DIR, n))
+                except OSError:
+                    pass
+    except OSError as e:
+        print(f"[trace] dump failed: {e}")
+        return None
+    return path
+
+
+# ---- ASGI -------------------------------------------------------------------------
+
+class RequestTracing:
+    """ASGI middleware: traces the request when asked to, adds Server-Timing to the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        if not ALL:
+            value = dict(scope["headers"]).get(HEADER)
+            if value is None or value.strip() in (b"", b"0"):
+                await self.app(scope, receive, send)
+                return
+
+        trace = Trace(f'{scope["method"]} {scope["path"]}')
+        token = _current.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                if route is not None:
+                    trace.name = f'{scope["method"]} {getattr(route, "path", scope["path"])}'
+                trace.duration = time.perf_counter() - trace.started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(trace).encode("latin-1")))
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            trace.duration = time.perf_counter() - trace.started
+            if TRACE_DIR:
+                dump(trace)
@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+
+from . import folder_snapshot, tag_suggest
+from .db import CACHE_DB_PATH
+
+# Background warm-up after startup, so the first /folders/ request after a
+# container restart does not pay for a cold database.
+#
+# - the SQLite file (and its WAL) is read once sequentially, up to
+#   WARMUP_DB_MB, which pulls it into the OS page cache: later random page reads
+#   by the request connections are memory hits instead of disk (or NAS) seeks;
+# - the in-memory indexes are built: tag autocomplete, and the folder snapshot
+#   when FOLDER_SNAPSHOT=1.
+# Runs on its own daemon thread (not a job: nothing to follow or cancel, and it
+# must not queue behind a reindex); requests arriving meanwhile work as usual.
+# WARMUP=0 turns it off, the indexes are then built by the first request that
+# needs them.
+
+ENABLED = os.getenv("WARMUP", "1").lower() not in ("0", "false", "no", "off")
+MAX_BYTES = max(0, int(os.getenv("WARMUP_DB_MB", "512"))) * 1024 * 1024
+_CHUNK = 1024 * 1024
+
+
+def _read(path: str, budget: int) -> int:
+    """Read `path` sequentially (data discarded), at most `budget` bytes."""
+    done = 0
+    try:
+        with open(path, "rb", buffering=0) as fh:
+            buf = bytearray(_CHUNK)
+            while done < budget:
+                n = fh.readinto(buf)
+                if not n:
+                    break
+                done += n
+    except OSError:
+        pass
+    return done
+
+
+def run() -> dict:
+    started = time.perf_counter()
+    budget = MAX_BYTES
+    read = 0
+    for path in (CACHE_DB_PATH, CACHE_DB_PATH + "-wal"):
+        n = _read(path, budget - read)
+        read += n
+    out = {"db_bytes": read}
+    try:
+        out["tags"] = len(tag_suggest.get())
+    except Exception as e:
+        print(f"[warmup] tag suggest index not built: {e}")
+    snap = folder_snapshot.get()
+    if snap is not None:
+        out["snapshot_rows"] = snap.stats()["rows"]
+    out["seconds"] = round(time.perf_counter() - started, 3)
+    return out
+
+
+def _run_logged() -> None:
+    try:
+        r = run()
+        print(f"[warmup] done: {r}")
+    except Exception as e:
+        print(f"[warmup] failed: {e}")
+
+
+def start() -> threading.Thread | None:
+    """Start the warm-up thread (no-op with WARMUP=0)."""
+    if not ENABLED:
+        return None
+    t = threading.Thread(target=_run_logged, name="stlmanager-warmup", daemon=True)
+    t.start()
+    return t
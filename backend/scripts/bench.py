@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""Reproducible API benchmark on a synthetic collection.
+
+Generates a collection (N projects with nested folders, a mix of images, GIFs,
+videos, archives and small binary STLs, .stl_collect.json sidecars with tags
+and ratings) from a seed, so that two runs with the same options measure the
+same tree; it is rebuilt on every run, since the scan writes sidecars into
+it. The FastAPI app is then driven in-process, through plain ASGI calls
+(no server, no HTTP client), against a fresh SQLite cache:
+
+  startup, scan (cold then warm), reindex, reindex-incremental, /folders/
+  listings (default, sorted, deep page, text, tag), /folders/detail (cold and
+  warm caches), /folders/duplicates (computed, then cached) and
+  /folders/tags-counts;
+  payload.* : a 200-item /folders/ page and a 1000-pair duplicates result,
+  with their size on the wire per encoding (identity, gzip, br) and the CPU
+  time of their serialization (FastAPI's jsonable_encoder + json.dumps vs
+  app.fastjson) and compression.
+
+Background jobs queued by an endpoint are waited for before the next
+measurement, and are not part of it. Results (min / median / p95 / mean in ms,
+response size) are written as JSON; --baseline compares the medians with a
+previous result file and exits with status 1 when a case got slower than
+--tolerance.
+
+Usage: bench.py [options]
+  bench.py --projects 2000 --out bench.json
+  bench.py --projects 2000 --baseline bench.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import time
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import urlencode
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+GEN_VERSION = 1
+
+_ADJ = ["Ancient", "Brave", "Cursed", "Dark", "Elven", "Frozen", "Golden", "Hollow", "Iron", "Lunar",
+        "Mécanique", "Noble", "Orcish", "Primal", "Royal", "Shadow", "Tiny", "Void", "Wild", "Égaré"]
+_NOUN = ["Dragon", "Knight", "Tank", "Golem", "Wizard", "Tower", "Bust", "Mech", "Ranger", "Base",
+         "Ship", "Troll", "Queen", "Beast", "Ruins", "Terrain", "Walker", "Sphinx", "Hydra", "Gobelin"]
+
+
+# ---- collection generator -------------------------------------------------------
+
+def _png(w: int, h: int, rgb: tuple[int, int, int]) -> bytes:
+    import zlib
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes(rgb) * w
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * h)) + chunk(b"IEND", b""))
+
+
+def _jpeg(w: int, h: int, pad: int) -> bytes:
+    # Headers only (SOI, APP0, SOF0, EOI) plus padding: enough for header parsing, not decodable
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    sof = b"\xff\xc0" + struct.pack(">HBHHB", 17, 8, h, w, 3) + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01"
+    com = b"\xff\xfe" + struct.pack(">H", pad + 2) + b"\x00" * pad
+    return b"\xff\xd8" + app0 + com + sof + b"\xff\xd9"
+
+
+def _gif(w: int, h: int, frames: int) -> bytes:
+    out = [b"GIF89a", struct.pack("<HHBBB", w, h, 0x80, 0, 0), b"\x00\x00\x00\xff\xff\xff"]
+    out.append(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+    for _ in range(frames):
+        out.append(b"\x21\xf9\x04\x04\x0a\x00\x00\x00")
+        # Token image data (not a decodable frame): frame counting and posters only walk the blocks
+        out.append(b"\x2c" + struct.pack("<HHHHB", 0, 0, w, h, 0) + b"\x02\x02\x44\x01\x00")
+    out.append(b"\x3b")
+    return b"".join(out)
+
+
+def _stl(rng: random.Random, triangles: int) -> bytes:
+    head = b"bench stl".ljust(80, b"\x00") + struct.pack("<I", triangles)
+    body = bytearray()
+    for _ in range(triangles):
+        body += struct.pack("<12fH", *(rng.uniform(-50, 50) for _ in range(12)), 0)
+    return head + bytes(body)
+
+
+def _tag_pool(size: int) -> list[str]:
+    words = [a.lower() for a in _ADJ] + [n.lower() for n in _NOUN]
+    pool = []
+    i = 0
+    while len(pool) < size:
+        w = words[i % len(words)]
+        pool.append(w if i < len(words) else f"{w}-{i // len(words)}")
+        i += 1
+    return pool
+
+
+def generate(root: Path, opts: argparse.Namespace) -> dict:
+    """Write the synthetic collection under `root` (replaced), return its manifest."""
+    rng = random.Random(opts.seed)
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    pool = _tag_pool(opts.tags)
+    # Zipf-like tag popularity: a few tags everywhere, a long tail of rare ones
+    weights = [1.0 / (i + 1) for i in range(len(pool))]
+    base_time = datetime(2022, 1, 1).timestamp()
+    files = bytes_written = 0
+    stl_cache = [_stl(rng, opts.stl_triangles) for _ in range(8)]
+    dirs: list[tuple[Path, float]] = []
+
+    def write(path: Path, data: bytes, mtime: float) -> None:
+        nonlocal files, bytes_written
+        path.write_bytes(data)
+        os.utime(path, (mtime, mtime))
+        files += 1
+        bytes_written += len(data)
+
+    for i in range(opts.projects):
+        name = f"{rng.choice(_ADJ)} {rng.choice(_NOUN)} {i:05d}"
+        proj = root / name
+        mtime = base_time + rng.uniform(0, 3 * 365 * 86400)
+        # Nested layout: STL files one or two levels down, renders in their own folder
+        sub = [proj]
+        if opts.depth >= 1:
+            sub.append(proj / "STL")
+            sub.append(proj / "Renders")
+        if opts.depth >= 2:
+            sub.append(proj / "STL" / "Supported")
+            sub.append(proj / "STL" / "Unsupported")
+        for d in sub:
+            d.mkdir(parents=True, exist_ok=True)
+        media_dirs = [proj, sub[2]] if len(sub) > 2 else [proj]
+        stl_dirs = sub[1:] if len(sub) > 1 else [proj]
+
+        for k in range(rng.randint(0, opts.images * 2)):
+            d = rng.choice(media_dirs)
+            w, h = rng.choice(((800, 600), (600, 800), (1920, 1080), (1024, 1024)))
+            if rng.random() < 0.7:
+                write(d / f"render_{k:02d}.jpg", _jpeg(w, h, opts.image_bytes), mtime)
+            else:
+                write(d / f"render_{k:02d}.png", _png(w // 16, h // 16, (rng.randrange(256), 90, 140)), mtime)
+        if rng.random() < opts.gif_ratio:
+            write(proj / "turntable.gif", _gif(64, 64, rng.randint(2, 12)), mtime)
+        if rng.random() < opts.video_ratio:
+            write(rng.choice(media_dirs) / "preview.mp4", b"\x00\x00\x00\x18ftypmp42" + rng.randbytes(4096), mtime)
+        for k in range(rng.randint(max(1, opts.stls // 2), opts.stls * 2)):
+            write(rng.choice(stl_dirs) / f"part_{k:02d}.stl", rng.choice(stl_cache), mtime)
+        if rng.random() < opts.archive_ratio:
+            zpath = proj / f"{name}.zip"
+            with zipfile.ZipFile(zpath, "w", zipfile.ZIP_STORED) as zf:
+                zf.writestr("part.stl", stl_cache[0])
+            os.utime(zpath, (mtime, mtime))
+            files += 1
+            bytes_written += zpath.stat().st_size
+        if rng.random() < opts.sidecar_ratio:
+            tags = sorted(set(rng.choices(pool, weights=weights, k=rng.randint(2, 8))))
+            meta = {
+                "tags": tags,
+                "rating": rng.randint(0, 5),
+                "added_at": (datetime(2022, 1, 1) + timedelta(seconds=mtime - base_time)).isoformat(),
+                "printed": rng.random() < 0.3,
+                "to_print": rng.random() < 0.2,
+            }
+            write(proj / ".stl_collect.json", json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"), mtime)
+        dirs.extend((d, mtime) for d in sub)
+
+    # Directory mtimes last (writing files bumps them), deepest first
+    for d, mtime in sorted(dirs, key=lambda x: -len(x[0].parts)):
+        os.utime(d, (mtime, mtime))
+    return {"generator": GEN_VERSION, "params": _gen_params(opts), "files": files, "bytes": bytes_written}
+
+
+def _gen_params(opts: argparse.Namespace) -> dict:
+    keys = ("seed", "projects", "images", "image_bytes", "gif_ratio", "video_ratio", "stls", "stl_triangles",
+            "archive_ratio", "sidecar_ratio", "tags", "depth")
+    return {k: getattr(opts, k) for k in keys}
+
+
+# ---- in-process ASGI driver -----------------------------------------------------
+
+class Client:
+    """Minimal ASGI caller: one event loop for the whole run, the response body is consumed."""
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+
+    def startup(self) -> None:
+        self.loop.run_until_complete(self.app.router.startup())
+
+    def shutdown(self) -> None:
+        self.loop.run_until_complete(self.app.router.shutdown())
+        self.loop.close()
+
+    async def _call(self, method: str, path: str, params, headers) -> tuple[int, bytes]:
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": path, "raw_path": path.encode("utf-8"),
+            "query_string": urlencode(params or {}, doseq=True).encode("ascii"), "root_path": "",
+            "headers": [(b"host", b"bench")] + [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in (headers or {}).items()],
+            "client": ("127.0.0.1", 0), "server": ("bench", 80),
+        }
+        sent = False
+        never = asyncio.Event()
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # No disconnect: streaming responses run to completion
+            await never.wait()
+
+        status = 0
+        body: list[bytes] = []
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, b"".join(body)
+
+    def request(self, method: str, path: str, params=None, headers=None) -> tuple[int, bytes, float]:
+        """(status, body as sent, elapsed seconds)."""
+        t = time.perf_counter()
+        status, body = self.loop.run_until_complete(self._call(method, path, params, headers))
+        return status, body, time.perf_counter() - t
+
+
+def wait_jobs(timeout: float = 600.0) -> None:
+    """Block until no background job is queued or running."""
+    from app import jobs
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not any(j["status"] in ("queued", "running") for j in jobs.list_jobs(limit=20)):
+            return
+        time.sleep(0.05)
+    print("[bench] background jobs still running, measuring anyway", file=sys.stderr)
+
+
+# ---- cases ---------------------------------------------------------------------------
+
+def _summary(samples: list[float], statuses: list[int], sizes: list[int]) -> dict:
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))]
+    return {
+        "runs": len(ms),
+        "min_ms": round(ms[0], 3),
+        "median_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(p95, 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "bytes": int(statistics.median(sizes)) if sizes else 0,
+        "errors": sum(1 for s in statuses if s >= 400),
+    }
+
+
+def run_cases(client: Client, opts: argparse.Namespace, root: Path) -> dict:
+    from app import detail_cache, dir_listing, duplicates
+
+    rng = random.Random(opts.seed + 1)
+    only = set(opts.only.split(",")) if opts.only else None
+    results: dict[str, dict] = {}
+
+    def case(name: str, calls, before=None) -> None:
+        """Run each (method, path, params) of `calls` once, `before()` ahead of each call."""
+        if only and name not in only and name.split(".")[0] not in only:
+            return
+        samples, statuses, sizes = [], [], []
+        for method, path, params in calls:
+            if before:
+                before()
+            gc.collect()
+            status, body, elapsed = client.request(method, path, params)
+            wait_jobs()
+            samples.append(elapsed)
+            statuses.append(status)
+            sizes.append(len(body))
+        results[name] = _summary(samples, statuses, sizes)
+        r = results[name]
+        print(f"[bench] {name:<28} median {r['median_ms']:>10.2f} ms  p95 {r['p95_ms']:>10.2f} ms"
+              f"  {r['bytes']:>9} B" + (f"  ERRORS {r['errors']}" if r["errors"] else ""), file=sys.stderr)
+
+    n = opts.repeat
+    case("scan.cold", [("POST", "/scan", None)])
+    case("scan.warm", [("POST", "/scan", None)] * n)
+    case("reindex", [("POST", "/folders/reindex", None)] * n)
+    case("reindex_incremental", [("POST", "/folders/reindex-incremental", None)] * n)
+    if "scan.cold" not in results:
+        # The read cases need an index
+        client.request("POST", "/scan")
+        wait_jobs()
+
+    pages = max(1, opts.projects // 24)
+    _, body, _ = client.request("GET", "/folders/tags-counts", {"limit": 5})
+    top_tag = next(iter(_tag_names(json.loads(body or b"{}"))), None)
+    reps = [("GET", "/folders/", None)] * n
+    case("list_folders.default", reps)
+    case("list_folders.date_desc", [("GET", "/folders/", {"sort": "date", "order": "desc"})] * n)
+    case("list_folders.deep_page", [("GET", "/folders/", {"page": max(1, pages // 2)})] * n)
+    case("list_folders.text", [("GET", "/folders/", {"q": "dragon"})] * n)
+    if top_tag:
+        case("list_folders.tag", [("GET", "/folders/", {"tags": [top_tag]})] * n)
+
+    projects = sorted(p for p in root.iterdir() if p.is_dir())
+    sample = [str(p) for p in rng.sample(projects, min(len(projects), max(n, 1)))]
+
+    def cold():
+        detail_cache.invalidate()
+        dir_listing.invalidate()
+
+    case("detail.cold", [("GET", "/folders/detail", {"path": p}) for p in sample], before=cold)
+    case("detail.warm", [("GET", "/folders/detail", {"path": p}) for p in sample])
+    # Results are cached per index version: "duplicates" computes, "duplicates.cached" hits
+    case("duplicates", [("GET", "/folders/duplicates", {"min_shared": 3})] * n, before=duplicates.invalidate)
+    case("duplicates.cached", [("GET", "/folders/duplicates", {"min_shared": 3})] * n)
+    case("tags_counts", [("GET", "/folders/tags-counts", None)] * n)
+
+    def payload(name: str, path: str, params: dict, key: str) -> None:
+        """Request timing (gzip accepted), bytes per encoding, serialization / compression CPU."""
+        if only and name not in only and name.split(".")[0] not in only:
+            return
+        from fastapi.encoders import jsonable_encoder
+
+        from app import compression, fastjson
+
+        status, raw, _ = client.request("GET", path, params)
+        data = json.loads(raw or b"{}")
+        encodings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+        wire = {"identity": len(raw)}
+        for enc in encodings:
+            _, body, _ = client.request("GET", path, params, {"Accept-Encoding": enc})
+            wire[enc] = len(body)
+
+        def cpu(fn) -> float:
+            # Median CPU time of one call, in ms
+            runs = []
+            for _ in range(max(5, n)):
+                t = time.process_time()
+                fn()
+                runs.append((time.process_time() - t) * 1000)
+            return round(statistics.median(runs), 3)
+
+        serialize = {
+            # What FastAPI does with a returned dict (default JSONResponse)
+            "jsonable_encoder+json": cpu(lambda: json.dumps(
+                jsonable_encoder(data), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")),
+            "fastjson" + ("(orjson)" if fastjson.ENABLED else "(json)"): cpu(lambda: fastjson.dumps(data)),
+        }
+        compress = {enc: cpu(lambda enc=enc: compression._Encoder(enc).finish(raw)) for enc in encodings}
+
+        samples, statuses = [], []
+        for _ in range(n):
+            gc.collect()
+            st, body, elapsed = client.request("GET", path, params, {"Accept-Encoding": "gzip"})
+            samples.append(elapsed)
+            statuses.append(st)
+        r = results[name] = _summary(samples, statuses, [len(body)])
+        r.update({"items": len(data.get(key) or []), "wire_bytes": wire, "serialize_ms": serialize, "compress_ms": compress})
+        print(f"[bench] {name:<28} median {r['median_ms']:>10.2f} ms  {r['items']} items  bytes {wire}"
+              f"  serialize ms {serialize}  compress ms {compress}", file=sys.stderr)
+
+    payload("payload.folders_page", "/folders/", {"limit": 200}, "items")
+    payload("payload.duplicates", "/folders/duplicates", {"min_shared": 2, "limit": 1000}, "pairs")
+    return results
+
+
+def _tag_names(payload) -> list[str]:
+    items = payload.get("tags", payload) if isinstance(payload, dict) else payload
+    out = []
+    for it in items or []:
+        if isinstance(it, dict) and it.get("name"):
+            out.append(it["name"])
+        elif isinstance(it, (list, tuple)) and it:
+            out.append(str(it[0]))
+    return out
+
+
+# ---- baseline --------------------------------------------------------------------------
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print median ratios against `baseline`, return the names of the cases that regressed."""
+    if current["collection"]["params"] != baseline.get("collection", {}).get("params"):
+        print("[bench] warning: baseline was measured on another collection (options differ)", file=sys.stderr)
+    regressed = []
+    print(f"{'case':<28} {'baseline':>12} {'current':>12} {'ratio':>7}", file=sys.stderr)
+    for name, r in current["results"].items():
+        b = baseline.get("results", {}).get(name)
+        if not b:
+            print(f"{name:<28} {'-':>12} {r['median_ms']:>12.2f} {'new':>7}", file=sys.stderr)
+            continue
+        ratio = r["median_ms"] / b["median_ms"] if b["median_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  SLOWER"
+            regressed.append(name)
+        elif ratio < 1 - tolerance:
+            flag = "  faster"
+        print(f"{name:<28} {b['median_ms']:>12.2f} {r['median_ms']:>12.2f} {ratio:>7.2f}{flag}", file=sys.stderr)
+    return regressed
+
+
+def _git_sha() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the API in-process on a synthetic collection.")
+    ap.add_argument("--workdir", default=os.path.join(os.getenv("TMPDIR", "/tmp"), "stlmanager-bench"), help="collection and cache location")
+    ap.add_argument("--seed", type=int, default=42, help="generator seed")
+    ap.add_argument("--projects", type=int, default=500, help="number of projects")
+    ap.add_argument("--images", type=int, default=4, help="mean images per project")
+    ap.add_argument("--image-bytes", type=int, default=2048, help="padding per JPEG (file size)")
+    ap.add_argument("--gif-ratio", type=float, default=0.3, help="share of projects with a GIF")
+    ap.add_argument("--video-ratio", type=float, default=0.1, help="share of projects with a video")
+    ap.add_argument("--stls", type=int, default=4, help="mean STL files per project")
+    ap.add_argument("--stl-triangles", type=int, default=200, help="triangles per STL")
+    ap.add_argument("--archive-ratio", type=float, default=0.3, help="share of projects with a zip")
+    ap.add_argument("--sidecar-ratio", type=float, default=0.85, help="share of projects with .stl_collect.json")
+    ap.add_argument("--tags", type=int, default=300, help="size of the tag vocabulary")
+    ap.add_argument("--depth", type=int, default=2, choices=(0, 1, 2), help="sub-folder nesting in projects")
+    ap.add_argument("--repeat", type=int, default=5, help="runs per case")
+    ap.add_argument("--only", default=None, help="comma-separated cases or groups (e.g. list_folders,detail.warm)")
+    ap.add_argument("--out", default=None, help="write the JSON results here (default: stdout)")
+    ap.add_argument("--baseline", default=None, help="previous results to compare with")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed median slowdown vs baseline (0.25 = +25%%)")
+    args = ap.parse_args()
+
+    workdir = Path(args.workdir)
+    root = workdir / "collection"
+    t = time.perf_counter()
+    manifest = generate(root, args)
+    print(f"[bench] generated {args.projects} projects, {manifest['files']} files "
+          f"({manifest['bytes'] / 1e6:.1f} MB) in {time.perf_counter() - t:.1f}s", file=sys.stderr)
+
+    # The app reads its configuration at import time
+    db_path = workdir / "cache.db"
+    for p in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm")):
+        p.unlink(missing_ok=True)
+    os.environ["COLLECTION_ROOT"] = str(root)
+    os.environ["CACHE_DB_PATH"] = str(db_path)
+    # Image decoding in the background is not what is measured here
+    os.environ.setdefault("PLACEHOLDERS", "0")
+    from app.main import app  # noqa: E402
+
+    client = Client(app)
+    t = time.perf_counter()
+    client.startup()
+    startup_s = time.perf_counter() - t
+    wait_jobs()
+    try:
+        results = {"startup": _summary([startup_s], [200], [])}
+        results.update(run_cases(client, args, root))
+    finally:
+        client.shutdown()
+
+    out = {
+        "version": 1,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git": _git_sha(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "env": {k: os.environ[k] for k in ("FOLDER_SNAPSHOT", "METRICS", "TRACE", "PLACEHOLDERS") if k in os.environ},
+        "collection": manifest,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    text = json.dumps(out, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressed = compare(out, baseline, args.tolerance)
+        if regressed:
+            print(f"[bench] slower than baseline: {', '.join(regressed)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
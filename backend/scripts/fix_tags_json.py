@@ -1,182 +1,228 @@
 #!/usr/bin/env python3
+"""Offline bulk fix of the `tags` field of .stl_collect.json sidecars.
+
+Fixes each sidecar like the API (app/sidecar.py: normalized tags, added_at
+filled when missing, modified_at stamped), spreads the folders over worker
+processes and updates folder_index / tag_stats / tag_catalog in the SQLite
+cache directly, in batches. Completed folders are appended to a checkpoint file
+after each committed batch, so an interrupted run resumes where it stopped
+(--restart to start over). The API does not need to be running.
+
+Usage: fix_tags_json.py [PATH] [options]
+  PATH: COLLECTION_ROOT, a project folder or a .stl_collect.json file
+        (defaults to env COLLECTION_ROOT)
+"""
+import argparse
+import json
 import os
 import sys
-import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from datetime import datetime
-from typing import Any, List
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-def uniq_preserve(seq: List[str]) -> List[str]:
-    seen = set()
-    out = []
-    for x in seq:
-        if x not in seen:
-            seen.add(x)
-            out.append(x)
-    return out
+from app import db, folder_store, sidecar, tag_index  # noqa: E402
+from app.media_index import META_NAME  # noqa: E402
 
 
-def try_parse_json_list(s: str) -> List[str] | None:
-    try:
-        v = json.loads(s)
-        if isinstance(v, list):
-            return [str(t).strip() for t in v if str(t).strip()]
-        return None
-    except Exception:
-        return None
-
-
-def normalize_tags(raw: Any) -> List[str]:
-    # Already a clean list of strings
-    if isinstance(raw, list):
-        # Detect case where list actually contains slices of a JSON-encoded list
-        joined = "".join([str(x) for x in raw])
-        if "[" in joined and "]" in joined and '\\"' in joined:
-            parsed = try_parse_json_list(joined)
-            if parsed is not None:
-                return uniq_preserve(parsed)
-        # Fallback: clean each entry
-        cleaned: List[str] = []
-        for t in raw:
-            s = str(t).strip()
-            # remove surrounding quotes if present
-            if len(s) >= 2 and ((s[0] == '"' and s[-1] == '"') or (s[0] == "'" and s[-1] == "'")):
-                s = s[1:-1].strip()
-            # remove stray brackets
-            s = s.strip("[] ")
-            if s:
-                cleaned.append(s)
-        return uniq_preserve([c for c in cleaned if c])
-
-    # If it's a string, try JSON list first, else split by comma
-    if isinstance(raw, str):
-        s = raw.strip()
-        parsed = try_parse_json_list(s)
-        if parsed is not None:
-            return uniq_preserve(parsed)
-        # Remove outer brackets if user stored like "[a,b]"
-        s = s.strip()
-        s = s.strip("[]")
-        parts = [p.strip() for p in s.split(",")]
-        out = []
-        for p in parts:
-            if len(p) >= 2 and ((p[0] == '"' and p[-1] == '"') or (p[0] == "'" and p[-1] == "'")):
-                p = p[1:-1].strip()
-            p = p.strip()
-            if p:
-                out.append(p)
-        return uniq_preserve(out)
-
-    # Unknown format -> empty
-    return []
-
-
-def process_file(meta_path: Path) -> bool:
-    try:
-        with meta_path.open("r", encoding="utf-8") as fh:
-            meta = json.load(fh)
-    except Exception as e:
-        print(f"[skip read] {meta_path}: {e}")
-        return False
-
-    raw_tags = meta.get("tags")
-    new_tags = normalize_tags(raw_tags)
-
-    # Determine if change required
-    changed = False
-    if isinstance(raw_tags, list):
-        src = [str(t).strip() for t in raw_tags]
-        if src != new_tags:
-            changed = True
-    elif isinstance(raw_tags, str):
-        # any string form becomes list
-        changed = True
-    else:
-        # None or other -> only change if we produced something non-empty
-        changed = bool(new_tags)
-
-    if not changed:
-        return False
-
-    # Backup first
-    backup_path = meta_path.with_suffix(meta_path.suffix + ".bak")
-    try:
-        if not backup_path.exists():
-            backup_path.write_text(meta_path.read_text(encoding="utf-8"), encoding="utf-8")
-        else:
-            # timestamped backup to avoid overwrite
-            ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-            backup_ts = meta_path.with_suffix(meta_path.suffix + f".{ts}.bak")
-            backup_ts.write_text(meta_path.read_text(encoding="utf-8"), encoding="utf-8")
-    except Exception as e:
-        print(f"[warn] backup failed for {meta_path}: {e}")
+def process_file(meta_path: str, dry_run: bool) -> dict:
+    """Runs in a worker process. Returns the folder outcome (never raises).
 
-    # Write fixed file
-    meta["tags"] = new_tags
+    The sidecar is fixed by sidecar.fix_tags(), like /folders/fix-tags-all:
+    same tags, same added_at / modified_at.
+    """
+    res = {"meta": meta_path, "tags": None, "fixed": False, "bytes": 0, "error": None}
     try:
-        with meta_path.open("w", encoding="utf-8") as fh:
-            json.dump(meta, fh, ensure_ascii=False, indent=2)
-        return True
+        out = sidecar.fix_tags(Path(meta_path).parent, dry_run)
     except Exception as e:
-        print(f"[error] write failed for {meta_path}: {e}")
-        return False
+        res["error"] = f"read: {e}"
+        return res
+    if out is None:
+        res["error"] = "read: sidecar gone"
+        return res
+    res["error"] = out.get("error")
+    res["tags"] = out.get("tags")
+    res["fixed"] = out["changed"]
+    res["bytes"] = out.get("bytes", 0)
+    if dry_run and out["changed"]:
+        res["before"] = out["diff"].get("tags", {}).get("before")
+    return res
+
+
+def _targets(arg_path: Path) -> tuple[list[str], Path]:
+    """Sidecars to process and the directory their folders are relative to."""
+    if arg_path.is_file() and arg_path.name == META_NAME:
+        return [str(arg_path)], arg_path.parent.parent
+    meta_here = arg_path / META_NAME
+    if meta_here.is_file():
+        return [str(meta_here)], arg_path.parent
+    out = []
+    for entry in os.scandir(arg_path):
+        if not entry.is_dir() or entry.name.startswith('.'):
+            continue
+        meta_path = os.path.join(entry.path, META_NAME)
+        if os.path.isfile(meta_path):
+            out.append(meta_path)
+    return out, arg_path
+
+
+def _index_root_id(cur, index_root: str | None, base: Path) -> int | None:
+    """Root of the cache the folders are relative to: --index-root, else the only one, else `base`."""
+    cur.execute("SELECT id, path FROM collection_roots")
+    roots = {path: rid for rid, path in cur.fetchall()}
+    if index_root:
+        return roots.get(folder_store.norm_root(index_root))
+    if len(roots) == 1:
+        return next(iter(roots.values()))
+    return roots.get(folder_store.norm_root(str(base)))
+
+
+def _load_checkpoint(path: Path) -> set[str]:
+    try:
+        with path.open("r", encoding="utf-8") as fh:
+            return {line.rstrip("\n") for line in fh if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+class _Stats:
+    def __init__(self, total: int):
+        self.total = total
+        self.checked = 0
+        self.fixed = 0
+        self.errors = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self._last = self.started
+
+    def add(self, res: dict) -> None:
+        self.checked += 1
+        self.fixed += 1 if res["fixed"] else 0
+        self.errors += 1 if res["error"] else 0
+        self.bytes += res["bytes"]
+
+    def line(self) -> str:
+        elapsed = max(1e-9, time.perf_counter() - self.started)
+        return (
+            f"{self.checked}/{self.total} checked, {self.fixed} fixed, {self.errors} errors"
+            f" | {self.checked / elapsed:.0f} folders/s, {self.bytes / 1024:.1f} KiB written, {elapsed:.1f}s"
+        )
+
+    def tick(self, every: float) -> None:
+        now = time.perf_counter()
+        if now - self._last >= every:
+            self._last = now
+            print(f"[progress] {self.line()}", flush=True)
 
 
 def main():
-    arg_path: Path | None = None
-    if len(sys.argv) > 1:
-        arg_path = Path(sys.argv[1])
-    else:
-        root_env = os.getenv("COLLECTION_ROOT")
-        if root_env:
-            arg_path = Path(root_env)
-    if arg_path is None:
-        print("Usage: fix_tags_json.py <PATH>  (PATH can be COLLECTION_ROOT, a project folder, or a .stl_collect.json file). Alternatively, set env COLLECTION_ROOT.")
+    ap = argparse.ArgumentParser(description="Normalize tags in .stl_collect.json files (offline, bulk).")
+    ap.add_argument("path", nargs="?", default=os.getenv("COLLECTION_ROOT"), help="COLLECTION_ROOT, a project folder or a .stl_collect.json")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: CPU count)")
+    ap.add_argument("--dry-run", action="store_true", help="show what would change, write nothing")
+    ap.add_argument("--db", default=db.CACHE_DB_PATH, help="SQLite cache to update (default: CACHE_DB_PATH)")
+    ap.add_argument("--no-db", action="store_true", help="only rewrite sidecars, leave the cache alone")
+    ap.add_argument("--index-root", default=None, help="COLLECTION_ROOT as seen by the API, when the cache knows several roots")
+    ap.add_argument("--batch", type=int, default=1000, help="folders per SQLite transaction / checkpoint")
+    ap.add_argument("--checkpoint", default=None, help="checkpoint file (default: next to the database)")
+    ap.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    ap.add_argument("--progress", type=float, default=2.0, help="seconds between progress lines")
+    args = ap.parse_args()
+
+    if not args.path:
+        ap.print_usage()
+        print("PATH missing and COLLECTION_ROOT not set")
         sys.exit(2)
-
+    arg_path = Path(args.path)
     if not arg_path.exists():
         print(f"Invalid path: {arg_path}")
         sys.exit(2)
 
-    total = 0
-    fixed = 0
-
-    # Case 1: direct file .stl_collect.json
-    if arg_path.is_file() and arg_path.name == ".stl_collect.json":
-        total = 1
-        if process_file(arg_path):
-            fixed = 1
-            print(f"[fixed] {arg_path}")
-        print(f"Done. Checked: {total}, Fixed: {fixed}")
-        return
-
-    # Case 2: directory with its own .stl_collect.json (single project)
-    if arg_path.is_dir():
-        meta_here = arg_path / ".stl_collect.json"
-        if meta_here.exists() and meta_here.is_file():
-            total = 1
-            if process_file(meta_here):
-                fixed = 1
-                print(f"[fixed] {meta_here}")
-            print(f"Done. Checked: {total}, Fixed: {fixed}")
-            return
+    targets, base = _targets(arg_path)
 
-        # Case 3: treat as root directory: scan immediate subfolders
-        for entry in os.scandir(arg_path):
-            if not entry.is_dir() or entry.name.startswith('.'):
-                continue
-            meta_path = Path(entry.path) / ".stl_collect.json"
-            if not meta_path.exists() or not meta_path.is_file():
-                continue
-            total += 1
-            if process_file(meta_path):
-                fixed += 1
-                print(f"[fixed] {meta_path}")
-        print(f"Done. Checked: {total}, Fixed: {fixed}")
-        return
-
-    print(f"Unsupported path: {arg_path}")
+    use_db = not args.no_db and not args.dry_run
+    conn = None
+    if use_db:
+        if not Path(args.db).exists():
+            print(f"[warn] database not found ({args.db}), sidecars only")
+            use_db = False
+        else:
+            db.CACHE_DB_PATH = args.db
+            # The API registers its own COLLECTION_ROOT; this host's path may differ
+            db.init_db(attach_root=False)
+            conn = db.get_connection()
+            root_id = _index_root_id(conn.cursor(), args.index_root, base)
+            if root_id is None:
+                print("[warn] collection root not found in the database (see --index-root), sidecars only")
+                conn.close()
+                conn = None
+
+    checkpoint = Path(args.checkpoint) if args.checkpoint else Path(args.db).parent / "fix_tags_json.checkpoint"
+    done: set[str] = set()
+    if not args.dry_run:
+        if args.restart:
+            checkpoint.unlink(missing_ok=True)
+        done = _load_checkpoint(checkpoint)
+        if done:
+            print(f"[resume] {len(done)} folders already done ({checkpoint})")
+    todo = [t for t in targets if t not in done]
+
+    stats = _Stats(len(todo))
+    pending: list[dict] = []
+
+    def flush():
+        if not pending:
+            return
+        if conn is not None:
+            cur = conn.cursor()
+            for res in pending:
+                if res["error"]:
+                    continue
+                # folder_index rows are relative to their collection root
+                rel = str(Path(res["meta"]).parent.relative_to(base))
+                csv_text = ",".join(res["tags"]) if res["tags"] else None
+                tag_index.update_folder_tags(cur, (root_id, rel), csv_text)
+            conn.commit()
+        with checkpoint.open("a", encoding="utf-8") as fh:
+            for res in pending:
+                if not res["error"]:
+                    fh.write(res["meta"] + "\n")
+        pending.clear()
+
+    workers = max(1, args.workers)
+    chunk = max(1, min(256, len(todo) // (workers * 8) or 1))
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for res in pool.map(process_file, todo, [args.dry_run] * len(todo), chunksize=chunk):
+            stats.add(res)
+            if res["error"]:
+                print(f"[error] {res['meta']}: {res['error']}")
+            elif res["fixed"]:
+                if args.dry_run:
+                    print(f"[would fix] {res['meta']}: {json.dumps(res['before'], ensure_ascii=False)} -> {json.dumps(res['tags'], ensure_ascii=False)}")
+                elif len(targets) == 1:
+                    print(f"[fixed] {res['meta']}")
+            if not args.dry_run:
+                pending.append(res)
+                if len(pending) >= args.batch:
+                    flush()
+            stats.tick(args.progress)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        if not args.dry_run:
+            # Keep what was processed; sidecars written but not yet recorded are re-checked on resume
+            flush()
+        print(f"Interrupted. {stats.line()}")
+        sys.exit(130)
+    pool.shutdown()
+    if not args.dry_run:
+        flush()
+        # Complete run: next one starts from scratch
+        checkpoint.unlink(missing_ok=True)
+    if conn is not None:
+        conn.close()
+    print(f"Done. {stats.line()}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The app reads its configuration at import time: point it at a throwaway
+# collection and database before anything imports app.*
+_TMP = Path(tempfile.mkdtemp(prefix="stlmanager-tests-"))
+os.environ["COLLECTION_ROOT"] = str(_TMP / "collection")
+os.environ["CACHE_DB_PATH"] = str(_TMP / "data" / "cache.db")
+os.environ.setdefault("PLACEHOLDERS", "0")
+os.environ.setdefault("WARMUP", "0")
+
+
+def _make_collection(root: Path) -> None:
+    from PIL import Image
+
+    for i, (name, tags) in enumerate((("Dragon", ["dragon", "mini"]), ("Knight", ["mini", "fantasy"]), ("Tank", ["scifi"]))):
+        proj = root / name
+        (proj / "STL").mkdir(parents=True)
+        Image.new("RGB", (64, 48), (40 * i, 90, 140)).save(proj / "render.jpg", "JPEG")
+        (proj / "STL" / "part.stl").write_bytes(b"solid x")
+        (proj / ".stl_collect.json").write_text(json.dumps({"tags": tags, "rating": i + 1}))
+
+
+@pytest.fixture(scope="session")
+def client():
+    # Pillow is a requirement (placeholders, sprites): a missing one fails the suite, it does not skip it
+    from fastapi.testclient import TestClient
+
+    _make_collection(Path(os.environ["COLLECTION_ROOT"]))
+    from app.main import app
+
+    with TestClient(app) as c:
+        r = c.post("/scan")
+        assert r.status_code == 200, r.text
+        yield c
@@ -0,0 +1,41 @@
+import sqlite3
+
+import pytest
+
+from app import db
+
+
+def test_failed_key_migration_is_rolled_back(tmp_path, monkeypatch):
+    path = str(tmp_path / "legacy.db")
+    con = sqlite3.connect(path)
+    # Path-keyed folder_index of installs before integer keys (schema version 0)
+    con.execute("CREATE TABLE folder_index (path TEXT PRIMARY KEY, name TEXT NOT NULL, mtime REAL, tags TEXT, thumbnail_path TEXT)")
+    con.execute("INSERT INTO folder_index (path, name, tags) VALUES ('/old/Dragon', 'Dragon', 'dragon')")
+    con.commit()
+    con.close()
+    monkeypatch.setattr(db, "CACHE_DB_PATH", path)
+
+    def boom(cur):
+        cur.execute("INSERT INTO folder_index (root_id, rel, name) VALUES (1, 'half', 'half')")
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(db, "_migrate_folder_keys", boom)
+    with pytest.raises(RuntimeError):
+        db.init_db(attach_root=False)
+
+    con = sqlite3.connect(path)
+    assert con.execute("PRAGMA user_version").fetchone()[0] == 1
+    cols = {r[1] for r in con.execute("PRAGMA table_info(folder_index)")}
+    assert "path" in cols
+    assert con.execute("SELECT path, name FROM folder_index").fetchall() == [("/old/Dragon", "Dragon")]
+    assert con.execute("SELECT name FROM sqlite_master WHERE name = 'folder_index_v1'").fetchone() is None
+    con.close()
+
+    # Next start: the migration runs again, for real this time
+    monkeypatch.undo()
+    monkeypatch.setattr(db, "CACHE_DB_PATH", path)
+    db.init_db(attach_root=False)
+    con = sqlite3.connect(path)
+    assert con.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+    assert con.execute("SELECT name FROM folder_index").fetchall() == [("Dragon",)]
+    con.close()
@@ -0,0 +1,39 @@
+import importlib.util
+import json
+from pathlib import Path
+
+_SCRIPT = Path(__file__).resolve().parent.parent / "scripts" / "fix_tags_json.py"
+
+
+def _script():
+    spec = importlib.util.spec_from_file_location("fix_tags_json", _SCRIPT)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def test_cli_fix_matches_api(tmp_path):
+    from app import sidecar
+
+    script = _script()
+    for name in ("cli", "api"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / ".stl_collect.json").write_text(json.dumps({"tags": '["Orc", "orc", "Orc"]'}))
+
+    res = script.process_file(str(tmp_path / "cli" / ".stl_collect.json"), False)
+    assert res["fixed"] and res["error"] is None and res["bytes"] > 0
+    assert sidecar.fix_tags(tmp_path / "api", False)["changed"]
+
+    cli = json.loads((tmp_path / "cli" / ".stl_collect.json").read_text())
+    api = json.loads((tmp_path / "api" / ".stl_collect.json").read_text())
+    assert cli["tags"] == api["tags"] == ["Orc", "orc"]
+    assert set(cli) == set(api) == {"tags", "added_at", "modified_at"}
+
+
+def test_cli_dry_run_writes_nothing(tmp_path):
+    script = _script()
+    meta = tmp_path / ".stl_collect.json"
+    meta.write_text(json.dumps({"tags": "a, b"}))
+    res = script.process_file(str(meta), True)
+    assert res["fixed"] and res["before"] == "a, b" and res["tags"] == ["a", "b"]
+    assert json.loads(meta.read_text()) == {"tags": "a, b"}
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def snapshot(client, monkeypatch):
+    from app import folder_snapshot
+
+    snap = folder_snapshot._build()
+    monkeypatch.setattr(folder_snapshot, "ENABLED", True)
+    monkeypatch.setattr(folder_snapshot, "_snapshot", snap)
+    return snap
+
+
+def _paths(page: dict) -> list[str]:
+    return [it["path"] for it in page["items"]]
+
+
+@pytest.mark.parametrize("sort", ["name", "date", "rating", "created", "modified"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_snapshot_matches_sql(snapshot, monkeypatch, sort, order):
+    from app import folder_snapshot
+    from app.routers.folders import _list_folders
+
+    got = snapshot.query(sort=sort, order=order, page=1, limit=50)
+    monkeypatch.setattr(folder_snapshot, "ENABLED", False)
+    assert _paths(got) == _paths(_list_folders(sort=sort, order=order, page=1, limit=50))
+
+
+def test_snapshot_search(snapshot):
+    assert [it["name"] for it in snapshot.query(sort="name", order="asc", page=1, limit=10, q="kn")["items"]] == ["Knight"]
+    assert snapshot.query(sort="name", order="asc", page=1, limit=10, q="zzz")["total"] == 0
+
+
+def test_refresh_outside_root(snapshot):
+    from app import folder_snapshot
+
+    before = snapshot.stats()["rows"]
+    # No rel under the root: no query (no empty IN ()), the path is just unknown
+    folder_snapshot.refresh(["/elsewhere/Ghost"])
+    assert snapshot.stats()["rows"] == before
+    knight = os.path.join(os.environ["COLLECTION_ROOT"], "Knight")
+    folder_snapshot.refresh(["/elsewhere/Ghost", knight])
+    assert folder_snapshot._snapshot is snapshot
+    assert snapshot.stats()["rows"] == before
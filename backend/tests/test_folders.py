@@ -0,0 +1,143 @@
+def test_list_folders(client):
+    r = client.get("/folders/", params={"limit": 2})
+    assert r.status_code == 200
+    data = r.json()
+    assert data["total"] == 3
+    assert [it["name"] for it in data["items"]] == ["Dragon", "Knight"]
+
+
+def test_sprite_without_paths(client):
+    # Same listing as GET /folders/ (regression: list_folders returns a Response object)
+    r = client.get("/folders/sprite", params={"limit": 2})
+    assert r.status_code == 200, r.text
+    out = r.json()
+    assert out["url"] == f"/folders/sprite/{out['sprite']}"
+    assert client.get(out["url"]).status_code == 200
+
+
+def test_incremental_reindex_sees_sidecar_rewritten_in_place(client):
+    import json
+    import os
+    import time
+    from pathlib import Path
+
+    # Fills the per-directory summary cache
+    assert client.post("/folders/reindex-incremental").status_code == 200
+    proj = Path(os.environ["COLLECTION_ROOT"]) / "Tank"
+    meta = proj / ".stl_collect.json"
+    dir_mtime = os.stat(proj).st_mtime_ns
+    with open(meta, "r+", encoding="utf-8") as fh:
+        data = json.load(fh)
+        data["tags"] = ["scifi", "rewritten"]
+        data["rating"] = 5
+        fh.seek(0)
+        fh.truncate()
+        json.dump(data, fh)
+    later = time.time() + 10
+    os.utime(meta, (later, later))
+    # Same file rewritten: the directory mtime does not move
+    assert os.stat(proj).st_mtime_ns == dir_mtime
+
+    r = client.post("/folders/reindex-incremental")
+    assert r.status_code == 200, r.text
+    assert r.json()["updated"] >= 1
+    detail = client.get("/folders/detail", params={"path": str(proj)}).json()
+    assert "rewritten" in detail["tags"]
+    assert detail["rating"] == 5
+
+
+def test_scan_keeps_symlinked_project(client, tmp_path):
+    import os
+    from pathlib import Path
+
+    target = tmp_path / "Linked Ship"
+    (target / "STL").mkdir(parents=True)
+    (target / "STL" / "hull.stl").write_bytes(b"solid x")
+    link = Path(os.environ["COLLECTION_ROOT"]) / "Linked Ship"
+    link.symlink_to(target, target_is_directory=True)
+    try:
+        assert client.post("/scan").status_code == 200
+        names = [it["name"] for it in client.get("/folders/", params={"limit": 200}).json()["items"]]
+        assert "Linked Ship" in names
+    finally:
+        link.unlink()
+        client.post("/scan")
+
+
+def test_rename_moves_project_dirs(client):
+    import os
+    from pathlib import Path
+
+    root = Path(os.environ["COLLECTION_ROOT"])
+    r = client.post("/folders/rename", params={"path": str(root / "Knight"), "new_name": "Knight v2"})
+    assert r.status_code == 200, r.text
+    try:
+        assert r.json()["rel"] == "Knight v2"
+        dirs = {p["path"]: p["dir"] for p in client.get("/projects/").json()["items"]}
+        assert dirs[str(root / "Knight v2" / "STL" / "part.stl")] == "Knight v2/STL"
+    finally:
+        client.post("/folders/rename", params={"path": str(root / "Knight v2"), "new_name": "Knight"})
+
+
+def test_detail_archive_rewritten_in_place(client):
+    import os
+    from pathlib import Path
+
+    proj = Path(os.environ["COLLECTION_ROOT"]) / "Dragon"
+    archive = proj / "pack.zip"
+    archive.write_bytes(b"x" * 10)
+    try:
+        params = {"path": str(proj), "media_type": "archives", "limit": 10}
+        for _ in range(2):
+            r = client.get("/folders/detail", params=params)
+            assert r.json()["media_sizes"]["archives"] == {"pack.zip": 10}
+        dir_mtime = os.stat(proj).st_mtime_ns
+        with open(archive, "r+b") as fh:
+            fh.write(b"y" * 25)
+        assert os.stat(proj).st_mtime_ns == dir_mtime
+        r = client.get("/folders/detail", params=params)
+        assert r.json()["media_sizes"]["archives"] == {"pack.zip": 25}
+    finally:
+        archive.unlink()
+
+
+def test_delete_file_updates_index(client):
+    import os
+    from pathlib import Path
+
+    from PIL import Image
+
+    proj = Path(os.environ["COLLECTION_ROOT"]) / "Dragon"
+    extra = proj / "extra.png"
+    Image.new("RGB", (8, 8)).save(extra, "PNG")
+    # Not normalized on purpose: the index key comes from the normalized path
+    r = client.post("/folders/delete-file", params={"file": str(proj / "STL" / ".." / "extra.png")})
+    assert r.status_code == 200, r.text
+    assert not extra.exists()
+    assert r.json()["path"] == str(proj)
+    assert r.json()["counts"]["images"] == 1
+    detail = client.get("/folders/detail", params={"path": str(proj)}).json()
+    assert detail["tags"] == ["dragon", "mini"]
+
+
+def test_delete_file_outside_a_folder_is_refused_first(client):
+    import os
+    from pathlib import Path
+
+    stray = Path(os.environ["COLLECTION_ROOT"]) / "stray.txt"
+    stray.write_text("x")
+    try:
+        r = client.post("/folders/delete-file", params={"file": str(stray)})
+        assert r.status_code == 400
+        assert stray.exists()
+    finally:
+        stray.unlink()
+
+
+def test_dry_run_cannot_run_in_background(client):
+    for route in ("/folders/fix-tags-all", "/folders/backfill-dates-all"):
+        r = client.post(route, params={"background": "true", "dry_run": "true"})
+        assert r.status_code == 400, route
+        r = client.post(route, params={"dry_run": "true"})
+        assert r.status_code == 200, route
+        assert "summary" in r.text.splitlines()[-1]
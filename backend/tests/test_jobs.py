@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+
+def test_stream_job_follows_progress(client):
+    from app import jobs
+    from app.routers.jobs import stream_job
+
+    seen = threading.Event()
+
+    def work():
+        jobs.checkpoint(done=1, total=2)
+        assert seen.wait(5), "progress not streamed"
+        jobs.checkpoint(done=2, total=2)
+        return {"ok": True}
+
+    async def read(job_id):
+        # Straight on the event loop (the test client buffers streamed bodies)
+        resp = await stream_job(job_id)
+        events = []
+        async for chunk in resp.body_iterator:
+            if chunk.startswith("event: "):
+                events.append(chunk.split("\n", 1)[0][len("event: "):])
+                if '"done": 1' in chunk:
+                    seen.set()
+        return events
+
+    job_id = jobs.submit("test-stream", work)["job_id"]
+    events = asyncio.run(read(job_id))
+    assert events[-1] == "done"
+    assert "progress" in events
+    assert jobs.get(job_id)["status"] == "done"
+    assert not jobs._watchers
+
+
+def test_stream_finished_job(client):
+    from app import jobs
+
+    job_id = jobs.submit("test-stream-done", lambda: 1)["job_id"]
+    jobs._queue.join()
+    r = client.get(f"/jobs/{job_id}/stream")
+    assert r.status_code == 200
+    assert r.text.startswith("event: done\n")
+    assert client.get("/jobs/unknown/stream").status_code == 404
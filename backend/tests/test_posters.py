@@ -0,0 +1,33 @@
+import os
+import shutil
+from pathlib import Path
+
+
+def test_unconvertible_sources_are_not_pending(client, monkeypatch):
+    from app import jobs, posters
+    from app.db import get_connection
+
+    root = Path(os.environ["COLLECTION_ROOT"])
+    broken = root / "Broken Gif"
+    broken.mkdir()
+    (broken / "anim.gif").write_bytes(b"not a gif")
+    clip = root / "Clip Only"
+    clip.mkdir()
+    (clip / "turntable.mp4").write_bytes(b"\0" * 64)
+    try:
+        assert client.post("/scan").status_code == 200
+        # The scan queued the posters job: it fails on the GIF and leaves a .none marker
+        jobs._queue.join()
+        conn = get_connection()
+        try:
+            monkeypatch.setattr(posters, "FFMPEG", None)
+            assert posters._pending(conn) == []
+            # With ffmpeg only the video is still to do, never the GIF known to fail
+            monkeypatch.setattr(posters, "FFMPEG", "ffmpeg")
+            assert [p for _, p, _ in posters._pending(conn)] == [str(clip)]
+        finally:
+            conn.close()
+    finally:
+        shutil.rmtree(broken)
+        shutil.rmtree(clip)
+        client.post("/scan")
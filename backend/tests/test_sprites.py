@@ -0,0 +1,17 @@
+def test_build_counts_new_derivatives(client, tmp_path, monkeypatch):
+    from PIL import Image
+
+    from app import sprites
+
+    items = []
+    for i in range(6):
+        p = tmp_path / f"thumb{i}.jpg"
+        Image.new("RGB", (40, 30), (i * 40, 20, 20)).save(p, "JPEG")
+        items.append({"path": str(tmp_path / f"p{i}"), "thumbnail_path": str(p)})
+    monkeypatch.setattr(sprites, "_made", 0)
+    out = sprites.build(items)
+    assert len(out["items"]) == 6
+    assert sprites._made == 6
+    # Same tiles in another order: a new sheet, no new derivative
+    sprites.build(items[::-1])
+    assert sprites._made == 6
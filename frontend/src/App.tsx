@@ -337,15 +337,23 @@ export default function App() {
       es.addEventListener('debug', (ev: MessageEvent) => {
         try { const data = JSON.parse((ev as MessageEvent).data || '{}'); setDupDebug(prev => [...prev, JSON.stringify(data)]) } catch {}
       })
-      es.addEventListener('done', (ev: MessageEvent) => {
+      // Pairs arrive in final order, in batches, while the server is still counting
+      let received = 0
+      es.addEventListener('pairs', (ev: MessageEvent) => {
         try {
           const data = JSON.parse((ev as MessageEvent).data || '{}')
           const pairs = Array.isArray(data?.pairs) ? data.pairs : []
-          setDups(pairs)
-          setDupsTotal(Number(data?.total ?? pairs.length))
+          received += pairs.length
+          if (pairs.length > 0) setDups(prev => [...prev, ...pairs])
+        } catch {}
+      })
+      es.addEventListener('done', (ev: MessageEvent) => {
+        try {
+          const data = JSON.parse((ev as MessageEvent).data || '{}')
+          setDupsTotal(Number(data?.total ?? received))
           setDupPhase('done')
           setDupProgress(100)
-          if (!pairs || pairs.length === 0) {
+          if (received === 0) {
             try { loadDuplicates() } catch {}
           }
         } catch {}